@@ -1,35 +1,120 @@
 # forgemind-backend/app.py
 
+import functools
+import logging
 import time
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-from supabase import create_client, Client
 from pydantic import BaseModel, ValidationError
-from openai import OpenAI
 import re
-from redis import Redis
 import json
-from typing import Optional
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
 import base64
 from PIL import Image
 from io import BytesIO
+from notifier import OperationNotifier
+from chat_engines import AssistantsEngine, CompletionsEngine
+from chat_jobs import ChatJobRunner
+from example_index import DEFAULT_DATASET_DIR, ExampleIndex, quantities
+from fanout import IoPool, StepTimer
+import cad_codec
+import compression
+import auth
+import logs
+from lazy import Lazy
+from listing import (
+    ListingError,
+    ListingVersions,
+    fetch_page,
+    parse_fields,
+    parse_limit,
+)
+from local_store import CachedRedis, LocalStore
+import metrics
+from auth import RequestAuthenticator, TokenVerifier, caller_id
+from cad_state import CadStateStore
+from operations import OperationStore
+from presence import PluginPresence
+from prompt_state import compile_cad_state
+from response_cache import CACHED_FIELDS, ResponseCache
+from retention import StateRetention
+from streaming import JsonStringFieldStreamer, sse_event
+from templates import match_template
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Structured logs, written to stdout by a background thread
+logs.configure(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    fmt=os.getenv("LOG_FORMAT", "json"),
+    max_chars=int(os.getenv("LOG_MAX_CHARS", "2000")),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+)
+logger = logging.getLogger(__name__)
+# Only one in this many per-poll debug records is written
+POLL_LOG_SAMPLE = int(os.getenv("POLL_LOG_SAMPLE", "100"))
+
 # Retrieve Supabase URL and Anon Key from environment variables
 SUPABASE_URL = os.getenv("REACT_APP_SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("REACT_APP_SUPABASE_ANON_KEY")
 
-# Get OpenAI API key from environment variables
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),  # This is the default and can be omitted
-)
 
-# Create a Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+def create_openai_client():
+    # Imported here: the openai package alone takes ~0.4s to import
+    from openai import DefaultHttpxClient, OpenAI
+
+    # OPENAI_API_KEY is the default and could be omitted. Both clients time
+    # their calls (see /metrics)
+    return OpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        http_client=metrics.time_http(DefaultHttpxClient(), "openai"),
+    )
+
+
+def create_supabase_client():
+    from supabase import create_client
+
+    return metrics.time_supabase(create_client(SUPABASE_URL, SUPABASE_ANON_KEY))
+
+
+def create_session_client():
+    from gotrue import SyncGoTrueClient
+
+    session_client = SyncGoTrueClient(
+        url=f"{SUPABASE_URL}/auth/v1",
+        headers={
+            "apiKey": SUPABASE_ANON_KEY,
+            "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
+        },
+        auto_refresh_token=False,
+        persist_session=False,
+    )
+    metrics.time_http(session_client._http_client, "supabase")
+    return session_client
+
+
+# Shared clients, built by the first request that uses them
+client = Lazy(create_openai_client, "openai")
+supabase = Lazy(create_supabase_client, "supabase")
+# Refreshes add-in sessions; apart from ``supabase`` so that no user's session
+# is attached to the client every request shares
+session_auth = Lazy(create_session_client, "session_auth")
+
+# Verifies access tokens locally (JWT secret or JWKS) and caches the results
+token_verifier = TokenVerifier(
+    supabase,
+    SUPABASE_URL,
+    jwt_secret=os.getenv("SUPABASE_JWT_SECRET"),
+    max_entries=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+)
+# Checks the bearer token on every request; "warn" until all clients send one
+authenticator = RequestAuthenticator(
+    token_verifier, os.getenv("AUTH_ENFORCEMENT", "warn")
+)
 
 
 # Retrieve Supabase S3 credentials from environment variables
@@ -38,81 +123,184 @@ SUPABASE_STORAGE_S3_SECRET_ACCESS_KEY = os.getenv(
     "SUPABASE_STORAGE_S3_SECRET_ACCESS_KEY"
 )
 
-# Initialize Supabase Storage client
-storage_client = supabase.storage
-
-# Check if the storage bucket "fusion_screenshots" exists, create if it doesn't
+# Storage bucket for plugin screenshots, created by `flask provision-storage`
 bucket_name = "fusion_screenshots"
-try:
+
+
+def provision_storage():
+    """Create the storage bucket if it doesn't exist. Run once per deploy (the
+    Procfile's release phase), not in every worker."""
+    storage_client = supabase.storage
     bucket_list = storage_client.list_buckets()
     if bucket_name not in [bucket.name for bucket in bucket_list]:
         storage_client.create_bucket(bucket_name)
-        print(f"Bucket '{bucket_name}' created successfully.")
+        logger.info("Bucket '%s' created successfully.", bucket_name)
     else:
-        print(f"Bucket '{bucket_name}' already exists.")
-except Exception as e:
-    print(f"Error checking/creating bucket: {e}")
-
-# Initialize Redis client - use REDISCLOUD_URL for Heroku Redis Cloud compatibility
-redis_url = os.getenv("REDISCLOUD_URL", "redis://localhost:6379/0")
-try:
-    redis_client = Redis.from_url(redis_url, socket_connect_timeout=2)
-    # Test the connection
-    redis_client.ping()
-    print("Successfully connected to Redis")
-    use_redis = True
-except Exception as e:
-    print(f"Warning: Redis connection failed: {e}")
-    print("The application will run with limited functionality (no CAD state tracking)")
-
-    # Create a mock Redis client that does nothing
-    class MockRedis:
-        def set(self, *args, **kwargs):
-            return True
-
-        def get(self, *args, **kwargs):
-            return None
+        logger.info("Bucket '%s' already exists.", bucket_name)
 
-        def delete(self, *args, **kwargs):
-            return True
 
-        def ping(self, *args, **kwargs):
-            return True
-
-        def exists(self, *args, **kwargs):
-            return False
-
-        def keys(self, *args, **kwargs):
-            return []
-
-        def hset(self, *args, **kwargs):
-            return True
-
-        def hget(self, *args, **kwargs):
-            return None
+# Initialize Redis client - use REDISCLOUD_URL for Heroku Redis Cloud compatibility.
+# A remote Redis is connected to on first use (and checked by /ready); a local one
+# is probed at startup, which is immediate, to fall back to running without it.
+# STATE_STORE=local skips Redis for single-process deployments
+redis_url = os.getenv("REDISCLOUD_URL", "redis://localhost:6379/0")
+use_redis = os.getenv("STATE_STORE", "redis") != "local"
+if use_redis:
+    redis_client = metrics.TimedRedis.from_url(redis_url, socket_connect_timeout=2)
+    try:
+        if urlsplit(redis_url).hostname in ("localhost", "127.0.0.1"):
+            redis_client.ping()
+    except Exception as e:
+        logger.warning(
+            "Redis connection failed (%s); keeping state in this process instead, "
+            "which other workers don't see",
+            e,
+        )
+        use_redis = False
+if not use_redis:
+    # CAD state, presence and the caches below work the same on a LocalStore;
+    # the operation queue, chat jobs and notifications must be shared between
+    # workers, so they only use redis_client when it is Redis (use_redis)
+    redis_client = LocalStore(
+        max_bytes=int(os.getenv("LOCAL_STORE_MAX_MB", "128")) * 1024 * 1024
+    )
+    metrics.register_stats(
+        "forgemind_local_store", "In-process store (no Redis)", redis_client.stats
+    )
 
-        def hmset(self, *args, **kwargs):
-            return True
+# Seconds presence and chat summaries may be served from this process's L1 copy
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", "2"))
+if use_redis and L1_CACHE_TTL > 0:
+    l1_store = LocalStore(
+        max_bytes=int(os.getenv("L1_CACHE_MAX_MB", "16")) * 1024 * 1024
+    )
+    cached_redis = CachedRedis(redis_client, l1_store, L1_CACHE_TTL)
+    metrics.register_stats("forgemind_l1_cache", "Redis L1 cache", l1_store.stats)
+else:
+    cached_redis = redis_client
+
+# Plugin login/activity state, one Redis hash per user
+plugin_presence = PluginPresence(cached_redis)
+
+# Seconds a user's CAD state, status and operation queue outlive their last poll
+STATE_TTL = int(os.getenv("STATE_TTL", str(7 * 24 * 3600)))
+# Per-user budget for the stored (encoded) CAD state; larger states are truncated
+STATE_MAX_BYTES = int(os.getenv("STATE_MAX_KB", "256")) * 1024
+
+# Latest CAD state per user, reconstructed from the add-in's delta uploads
+cad_state_store = CadStateStore(redis_client, ttl=STATE_TTL, max_bytes=STATE_MAX_BYTES)
+
+# Queues pending operations per user in Redis and hands each to a plugin exactly
+# once; status changes reach Supabase through a batched background writer
+operation_store = OperationStore(
+    supabase,
+    redis_client,
+    use_redis,
+    claim_ttl=int(os.getenv("OPERATION_CLAIM_TTL", "86400")),
+    queue_ttl=STATE_TTL,
+)
 
-        def hmget(self, *args, **kwargs):
-            return [None]
+# Expires per-user state of users who stop polling; reported by /admin/state_stats
+state_retention = StateRetention(
+    redis_client,
+    ttls={
+        prefix: STATE_TTL
+        for prefix in (
+            CadStateStore.STATE_PREFIX,
+            CadStateStore.HASH_PREFIX,
+            "cad_status:",
+            "cad_message:",
+            OperationStore.QUEUE_PREFIX,
+            OperationStore.HYDRATED_PREFIX,
+        )
+    },
+    max_message_chars=int(os.getenv("STATE_MESSAGE_MAX_CHARS", "4000")),
+)
+# Bearer token for the /admin routes, which are disabled without one
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Versions of each user's chat list and each chat's messages, for the ETags of
+# /get_chats and /get_messages
+listing_versions = ListingVersions(redis_client, use_redis, ttl=STATE_TTL)
+
+# Wakes long-polling plugins as soon as /chat enqueues an operation for them
+operation_notifier = OperationNotifier(redis_client, use_redis)
+
+# How long /wait_for_operation parks a plugin request; keep below the 30s Heroku router timeout
+LONG_POLL_TIMEOUT = float(os.getenv("LONG_POLL_TIMEOUT", "20"))
+
+# Assistant runs are driven by a worker pool so /chat returns a job ID immediately;
+# CHAT_WORKERS bounds concurrent runs per process
+chat_jobs = ChatJobRunner(
+    redis_client,
+    use_redis,
+    max_workers=int(os.getenv("CHAT_WORKERS", "16")),
+    ttl=int(os.getenv("CHAT_JOB_TTL", "3600")),
+)
 
-        def hgetall(self, *args, **kwargs):
-            return {}
+# Overlaps independent Supabase/Redis/OpenAI calls within a request and runs
+# persistence the response doesn't wait for; IO_THREADS=0 runs them in order
+io_pool = IoPool(int(os.getenv("IO_THREADS", "32")))
 
-        def decode(self, *args, **kwargs):
-            return None
+# Replays proven assistant replies for repeated first prompts (e.g. "Create a 5x5x5 cube")
+response_cache = ResponseCache(
+    redis_client,
+    use_redis=True,
+    ttl=int(os.getenv("CHAT_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("CHAT_CACHE_SIZE", "10000")),
+)
+metrics.register_stats(
+    "forgemind_chat_cache", "Chat response cache", response_cache.stats
+)
 
-    redis_client = MockRedis()
-    use_redis = False
+# Scripts that ran successfully (and the curated dataset), retrieved by instruction similarity
+example_index = ExampleIndex(
+    client,
+    redis_client,
+    use_redis=True,
+    dataset_dir=os.getenv("EXAMPLE_DATASET_DIR", DEFAULT_DATASET_DIR),
+    cache_dir=os.getenv("EXAMPLE_INDEX_DIR"),
+)
+# Proven scripts shown to the assistant with each prompt, and how similar they must be
+FEW_SHOT_EXAMPLES = int(os.getenv("FEW_SHOT_EXAMPLES", "2"))
+FEW_SHOT_MIN_SIMILARITY = float(os.getenv("FEW_SHOT_MIN_SIMILARITY", "0.4"))
+# A first prompt this similar to a proven one reuses its reply without an assistant run
+EXAMPLE_REUSE_SIMILARITY = float(os.getenv("EXAMPLE_REUSE_SIMILARITY", "0.97"))
+
+# Answer primitive requests ("Create a 5x5x5 cube") from templates, without the assistant
+TEMPLATE_FAST_PATH = os.getenv("TEMPLATE_FAST_PATH", "true").lower() == "true"
+
+# Upper bound on the (estimated) tokens the CAD state takes up in a prompt
+CAD_STATE_TOKEN_BUDGET = int(os.getenv("CAD_STATE_TOKEN_BUDGET", "1500"))
+
+# OpenAI assistant that answers /chat prompts
+ASSISTANT_ID = "asst_SICfkmxReT9Xd76xOmieEqpL"
+
+# "assistants" runs prompts on OpenAI Assistants threads; "completions" makes one
+# streaming Chat Completions call with history rebuilt from the messages table
+CHAT_ENGINE = os.getenv("CHAT_ENGINE", "assistants")
+if CHAT_ENGINE == "completions":
+    chat_engine = CompletionsEngine(
+        client,
+        supabase,
+        cached_redis,
+        use_redis=True,
+        model=os.getenv("CHAT_MODEL", "gpt-4o"),
+        summary_model=os.getenv("CHAT_SUMMARY_MODEL", "gpt-4o-mini"),
+        history_budget=int(os.getenv("CHAT_HISTORY_TOKENS", "6000")),
+    )
+    if os.getenv("CHAT_SYSTEM_PROMPT_FILE"):
+        with open(os.environ["CHAT_SYSTEM_PROMPT_FILE"], encoding="utf-8") as f:
+            chat_engine.system_prompt = f.read()
+else:
+    chat_engine = AssistantsEngine(client, ASSISTANT_ID)
 
-app = Flask(__name__)
-# Explicitly allow all origins with a single CORS configuration
-CORS(app, resources={r"/*": {"origins": "*"}})
+# Every view; registered on the Flask app by create_app()
+api = Blueprint("api", __name__)
 
 
 # Error handler to ensure all errors return JSON
-@app.errorhandler(Exception)
+@api.app_errorhandler(Exception)
 def handle_error(e):
     code = 500
     if hasattr(e, "code"):
@@ -126,14 +314,14 @@ class ChatPayload(BaseModel):
     thread_id: Optional[str] = None  # new optional field
 
 
-@app.route("/chat", methods=["OPTIONS", "POST"])
+@api.route("/chat", methods=["OPTIONS", "POST"])
 def chat():
     # Handle preflight OPTIONS request
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"})
 
     try:
-        data = ChatPayload(**request.get_json())
+        data = chat_payload()
     except ValidationError as e:
         return (
             jsonify(
@@ -142,7 +330,138 @@ def chat():
             400,
         )
 
-    # Insert or get the chat
+    job_id = chat_jobs.submit(data.user_id, _run_chat, data)
+    return jsonify({"status": "queued", "job_id": job_id}), 202
+
+
+@api.route("/chat_status/<job_id>", methods=["GET", "OPTIONS"])
+def chat_status(job_id):
+    """Report the progress of a /chat job; once completed, ``result`` holds
+    the response /chat used to return synchronously."""
+    # Handle preflight OPTIONS request
+    if request.method == "OPTIONS":
+        return jsonify({"status": "ok"})
+
+    job = chat_jobs.get(job_id)
+    if job is None or not chat_jobs.visible_to(job, caller_id()):
+        return (
+            jsonify({"status": "error", "message": "Unknown or expired job_id"}),
+            404,
+        )
+
+    return jsonify({"status": "success", "job_id": job_id, **job})
+
+
+def chat_payload() -> ChatPayload:
+    """Parse a /chat or /chat_stream body; the prompt is sent as the
+    verified caller, whatever ``user_id`` the body names."""
+    body = request.get_json()
+    return ChatPayload(**{**body, "user_id": caller_id(body.get("user_id"))})
+
+
+def _run_chat(data: ChatPayload):
+    """Run the full chat pipeline for one prompt on a chat job worker."""
+    chat = prepare_chat(data)
+
+    cached_response = replay_known_response(data, chat)
+    if cached_response is not None:
+        return complete_chat(data, chat, cached_response, cache_hit=True)
+
+    with chat.timer.step("reply"):
+        raw_response = chat_engine.complete(chat)
+    with chat.timer.step("parse"):
+        assistant_response = json.loads(raw_response)
+    return complete_chat(data, chat, assistant_response)
+
+
+class PreparedChat(NamedTuple):
+    chat_id: str
+    thread_id: str
+    # None unless the reply can come from the response cache
+    cache_key: Optional[str]
+    # The user's instructions with the CAD context, as sent to the model
+    prompt: str
+    timer: StepTimer
+
+
+def prepare_chat(data: ChatPayload) -> PreparedChat:
+    """Record the user's prompt and build it, with the CAD context, for the
+    chat engine; the Assistants engine posts it to the chat's thread."""
+    timer = StepTimer()
+    # The chat row, the CAD context and similar examples don't depend on each other
+    (chat_id, thread_id), (cad_state, cad_status), examples = io_pool.gather(
+        timer.timed("chat", find_or_create_chat, data),
+        timer.timed("cad_context", read_cad_context, data),
+        timer.timed("examples", few_shot_examples, data),
+    )
+
+    prompt_state, prompt_state_tokens = compile_cad_state(
+        cad_state, data.text, CAD_STATE_TOKEN_BUDGET
+    )
+    logger.info(
+        "CAD state for prompt: %d tokens",
+        prompt_state_tokens,
+        extra={"user_id": data.user_id},
+    )
+    content = f"CAD workspace contents:\n```\n{prompt_state}\n```\nCAD workspace status:\n```\n{cad_status}\n````\nInstructions:\n```\n{data.text}\n```"
+
+    if examples:
+        content += "\nScripts that worked for similar instructions:\n" + "\n".join(
+            f"```python\n# {example['instruction']}\n{example['python_code']}\n```"
+            for _, example in examples
+        )
+
+    logger.debug("Query to LLM for chat %s:\n%s", chat_id, content)
+
+    # Follow-up prompts depend on the thread's history, so only a chat's first
+    # prompt, whose reply is determined by what was just sent, is cacheable
+    cache_key = (
+        None
+        if data.thread_id
+        else response_cache.key_for(data.text, cad_state, cad_status)
+    )
+    chat = PreparedChat(chat_id, thread_id, cache_key, content, timer)
+
+    # Add the user message to the messages table
+    io_pool.gather(
+        timer.timed("user_message", add_message, chat_id, "user", data.text),
+        timer.timed("add_prompt", chat_engine.add_prompt, chat),
+    )
+    return chat
+
+
+def add_message(chat_id, role, content):
+    """Insert a row in the messages table."""
+    supabase.table("messages").insert(
+        {"chat_id": chat_id, "role": role, "content": content}
+    ).execute()
+    listing_versions.bump(listing_versions.messages_key(chat_id))
+
+
+@functools.lru_cache(maxsize=10000)
+def chat_owner(chat_id):
+    """The ``user_id`` owning the chat. A chat never changes owner, so each
+    worker remembers the answers; raises LookupError for unknown chats,
+    which aren't remembered."""
+    rows = (
+        supabase.table("chats").select("user_id").eq("id", chat_id).execute().data
+    )
+    if not rows:
+        raise LookupError(f"Unknown chat {chat_id}")
+    return rows[0]["user_id"]
+
+
+def touch_chat(chat_id, user_id):
+    """Move the chat to the top of the user's chat list."""
+    supabase.table("chats").update({"updated_at": "now()"}).eq(
+        "id", chat_id
+    ).execute()
+    listing_versions.bump(listing_versions.chats_key(user_id))
+
+
+def find_or_create_chat(data: ChatPayload):
+    """Return ``(chat_id, thread_id)`` for the prompt, creating the chat, and
+    for a new conversation its thread, when needed."""
     if data.thread_id:
         # Get an existing chat if thread_id is provided
         existing_chats = (
@@ -153,335 +472,498 @@ def chat():
         )
 
         if existing_chats.data and len(existing_chats.data) > 0:
+            if existing_chats.data[0]["user_id"] != data.user_id:
+                raise PermissionError("Chat not found or not owned by user")
             chat_id = existing_chats.data[0]["id"]
-            # Update the timestamp
-            supabase.table("chats").update({"updated_at": "now()"}).eq(
-                "id", chat_id
-            ).execute()
-        else:
-            # If no chat with this thread_id exists, create a new one
-            chat_insertion = (
-                supabase.table("chats")
-                .insert(
-                    {
-                        "title": f"Chat {data.text[:30]}...",  # Use the first 30 chars as title
-                        "user_id": data.user_id,
-                        "assistant_id": "asst_SICfkmxReT9Xd76xOmieEqpL",
-                        "thread_id": data.thread_id,
-                    }
-                )
-                .execute()
-            )
-            chat_id = chat_insertion.data[0]["id"]
+            # Update the timestamp; only the order of the chat list depends on it
+            io_pool.defer(touch_chat, chat_id, data.user_id)
+            return chat_id, data.thread_id
+
+        # If no chat with this thread_id exists, create a new one
+        thread_id = data.thread_id
     else:
-        # Create a new chat if no thread_id is provided
-        chat_insertion = (
-            supabase.table("chats")
-            .insert(
-                {
-                    "title": f"Chat {data.text[:30]}...",  # Use the first 30 chars as title
-                    "user_id": data.user_id,
-                    "assistant_id": "asst_SICfkmxReT9Xd76xOmieEqpL",
-                }
-            )
-            .execute()
+        thread_id = chat_engine.start_thread()
+
+    chat_insertion = (
+        supabase.table("chats")
+        .insert(
+            {
+                "title": f"Chat {data.text[:30]}...",  # Use the first 30 chars as title
+                "user_id": data.user_id,
+                "assistant_id": ASSISTANT_ID,
+                "thread_id": thread_id,
+            }
         )
-        chat_id = chat_insertion.data[0]["id"]
+        .execute()
+    )
+    listing_versions.bump(listing_versions.chats_key(data.user_id))
+    return chat_insertion.data[0]["id"], thread_id
 
-    # Add the user message to the messages table
-    supabase.table("messages").insert(
-        {"chat_id": chat_id, "role": "user", "content": data.text}
-    ).execute()
 
-    # Use existing thread if provided; otherwise, create a new one.
-    if data.thread_id:
-        thread_id = data.thread_id
-        # Assuming the thread exists; in production, you might verify it.
-    else:
+def read_cad_context(data: ChatPayload):
+    """Return ``(cad_state, cad_status)`` for the prompt; a new chat first
+    clears the user's stored state."""
+    if not data.thread_id:
         # Clear all Redis states for the user
         try:
-            redis_client.delete(f"cad_state:{data.user_id}")
-            redis_client.delete(f"status:{data.user_id}")
-            redis_client.delete(f"message:{data.user_id}")
+            cad_state_store.clear(data.user_id)
+            redis_client.delete(f"status:{data.user_id}", f"message:{data.user_id}")
         except Exception as e:
-            print(f"Warning: Redis operation failed: {e}")
-
-        thread = client.beta.threads.create()
-        thread_id = thread.id
-
-        # Update the chat with the thread_id
-        supabase.table("chats").update({"thread_id": thread_id}).eq(
-            "id", chat_id
-        ).execute()
+            logger.warning("Redis operation failed: %s", e)
 
     # Get CAD state from Redis with error handling
     try:
-        cad_state = redis_client.get(f"cad_state:{data.user_id}")
-        cad_state = cad_state.decode("utf-8") if cad_state else "No CAD state found"
-
-        cad_status = redis_client.get(f"status:{data.user_id}")
+        cad_state, cad_status, cad_message = redis_client.mget(
+            f"cad_state:{data.user_id}",
+            f"status:{data.user_id}",
+            f"message:{data.user_id}",
+        )
+        cad_state = cad_codec.decode(cad_state) or "No CAD state found"
         cad_status = cad_status.decode("utf-8") if cad_status else "No CAD status found"
-
-        cad_message = redis_client.get(f"message:{data.user_id}")
         cad_message = (
             cad_message.decode("utf-8") if cad_message else "No CAD message found"
         )
 
         cad_status += f"\n{cad_message}"
     except Exception as e:
-        print(f"Warning: Error retrieving Redis data: {e}")
+        logger.warning("Error retrieving Redis data: %s", e)
         cad_state = "No CAD state found"
         cad_status = "No CAD status found"
+    return cad_state, cad_status
+
+
+def few_shot_examples(data: ChatPayload):
+    if not FEW_SHOT_EXAMPLES or templated_response(data) is not None:
+        return []
+    return example_index.search(data.text, FEW_SHOT_EXAMPLES, FEW_SHOT_MIN_SIMILARITY)
+
+
+def templated_response(data: ChatPayload):
+    return match_template(data.text) if TEMPLATE_FAST_PATH else None
+
+
+def replay_known_response(data: ChatPayload, chat: PreparedChat):
+    """Return a reply without an assistant run, or None.
+
+    Primitive requests are rendered from templates. Cacheable prompts are
+    then looked up in the response cache, then matched against near-identical
+    first prompts whose script is known to work. Embeddings barely tell
+    "5x5x5" from "5x5x6", so a match is only reused when its numbers and
+    units are the same; otherwise it still reaches the assistant as a
+    few-shot example. The reply is also posted to the thread so follow-up
+    prompts see it.
+    """
+    cached_response = templated_response(data)
+    if cached_response is None:
+        cached_response = response_cache.get(chat.cache_key)
+    if cached_response is None and chat.cache_key is not None:
+        matches = example_index.search(data.text, 1, EXAMPLE_REUSE_SIMILARITY)
+        if (
+            matches
+            and matches[0][1].get("first_prompt")
+            and quantities(matches[0][1]["instruction"]) == quantities(data.text)
+        ):
+            cached_response = {
+                field: matches[0][1][field] for field in CACHED_FIELDS
+            }
+    if cached_response is not None:
+        chat_engine.add_reply(chat, cached_response)
+    return cached_response
+
+
+def complete_chat(
+    data: ChatPayload, chat: PreparedChat, assistant_response, cache_hit=False
+):
+    """Hand the assistant's reply to the plugin and build the /chat response
+    body. The reply and its operation are stored before the job finishes, so
+    a follow-up prompt sees the reply in its history and queues its operation
+    behind this one."""
+    persist_reply(data, chat, assistant_response, cache_hit)
+
+    steps = chat.timer.finish()
+    metrics.record_chat_steps(steps)
+    logger.info(
+        "Chat timings (ms) for chat %s: %s",
+        chat.chat_id,
+        chat.timer.report(),
+        extra={"user_id": data.user_id, "cached": cache_hit},
+    )
 
-    print(
-        "Checking keys",
-        f"cad_state:{data.user_id}",
-        f"status:{data.user_id}",
-        f"message:{data.user_id}",
+    return {
+        "status": "success",
+        "response": assistant_response,
+        "thread_id": chat.thread_id,
+        "chat_id": chat.chat_id,
+        "cached": cache_hit,
+    }
+
+
+def persist_reply(
+    data: ChatPayload, chat: PreparedChat, assistant_response, cache_hit
+):
+    """Store the reply in the messages table and create and enqueue its
+    operation for the plugin; only waking the plugin happens in the
+    background."""
+    chat_id = chat.chat_id
+    operation, _ = io_pool.gather(
+        chat.timer.timed(
+            "operation",
+            supabase.table("operations")
+            .insert(
+                {
+                    "steps": assistant_response["steps"],
+                    "python_code": assistant_response["python_code"],
+                    "user_facing_response": assistant_response[
+                        "user_facing_response"
+                    ],
+                    "chat_id": chat_id,
+                    "user_id": data.user_id,
+                    "cad_type": "fusion",
+                    "status": "pending",
+                }
+            )
+            .execute,
+        ),
+        chat.timer.timed(
+            "assistant_message", add_message, chat_id, "assistant", assistant_response
+        ),
     )
-    content = f"CAD workspace contents:\n```\n{cad_state}\n```\nCAD workspace status:\n```\n{cad_status}\n````\nInstructions:\n```\n{data.text}\n```"
-
-    print("------- Query to LLM   -----------------------")
-    print(content)
-    print("------- Query Complete -----------------------")
-    # Add a message to the thread using the determined thread_id.
-    client.beta.threads.messages.create(
-        thread_id=thread_id, role="user", content=content
+    # Log operation creation for security auditing
+    logger.info(
+        "Created new operation for user %s with chat_id %s", data.user_id, chat_id
     )
-
-    # Create a run using the thread_id.
-    run = client.beta.threads.runs.create(
-        thread_id=thread_id, assistant_id="asst_SICfkmxReT9Xd76xOmieEqpL"
+    metrics.record_operation("pending")
+    operation_store.enqueue(operation.data[0])
+    io_pool.defer(operation_notifier.notify, data.user_id)
+
+    # Cached once the plugin reports the script ran (see /instruction_result)
+    response_cache.remember(
+        operation.data[0]["id"],
+        data.user_id,
+        chat.cache_key,
+        assistant_response,
+        cache_hit,
+    )
+    example_index.remember(
+        operation.data[0]["id"],
+        data.user_id,
+        data.text,
+        assistant_response,
+        first_prompt=not data.thread_id,
     )
+    chat_engine.finish(chat)
 
-    # Wait for the run to complete
-    while run.status != "completed":
-        time.sleep(1)
-        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
 
-    # Get the messages from the thread
-    messages = client.beta.threads.messages.list(thread_id=thread_id)
+@api.route("/chat_stream", methods=["OPTIONS", "POST"])
+def chat_stream():
+    """Streaming variant of /chat: server-sent events carrying the
+    ``user_facing_response`` text as the assistant generates it.
 
-    # Accumulate the assistant's response
-    assistant_response = next(
-        (
-            msg["content"]
-            for msg in parse_messages(messages)
-            if msg["role"] == "assistant"
-        ),
-        "No response from assistant",
-    )
+    Emits ``meta`` (chat_id/thread_id), repeated ``token`` events, then
+    ``final`` with the same body /chat_status returns, or ``error``.
+    """
+    # Handle preflight OPTIONS request
+    if request.method == "OPTIONS":
+        return jsonify({"status": "ok"})
 
-    assistant_response = json.loads(assistant_response)
+    try:
+        data = chat_payload()
+    except ValidationError as e:
+        return (
+            jsonify(
+                {"status": "error", "message": "Invalid payload", "errors": e.errors()}
+            ),
+            400,
+        )
 
-    # Add the assistant response to the messages table
-    supabase.table("messages").insert(
-        {"chat_id": chat_id, "role": "assistant", "content": assistant_response}
-    ).execute()
+    def generate():
+        try:
+            chat = prepare_chat(data)
+            yield sse_event(
+                "meta", {"chat_id": chat.chat_id, "thread_id": chat.thread_id}
+            )
 
-    supabase.table("operations").insert(
-        {
-            "steps": assistant_response["steps"],
-            "python_code": assistant_response["python_code"],
-            "user_facing_response": assistant_response["user_facing_response"],
-            "chat_id": chat_id,
-            "user_id": data.user_id,
-            "cad_type": "fusion",
-            "status": "pending",
-        }
-    ).execute()
-    # Log operation creation for security auditing
-    print(f"Created new operation for user {data.user_id} with chat_id {chat_id}")
+            cached_response = replay_known_response(data, chat)
+            if cached_response is not None:
+                yield sse_event(
+                    "token", {"text": cached_response["user_facing_response"]}
+                )
+                yield sse_event(
+                    "final", complete_chat(data, chat, cached_response, cache_hit=True)
+                )
+                return
+
+            streamer = JsonStringFieldStreamer("user_facing_response")
+            raw_response = []
+            with chat.timer.step("reply"):
+                for delta in chat_engine.stream(chat):
+                    raw_response.append(delta)
+                    text = streamer.feed(delta)
+                    if text:
+                        yield sse_event("token", {"text": text})
+
+            assistant_response = json.loads("".join(raw_response))
+            yield sse_event("final", complete_chat(data, chat, assistant_response))
+        except Exception as e:
+            logger.exception("Error in chat_stream: %s", e)
+            yield sse_event("error", {"message": str(e)})
 
-    return jsonify(
-        {
-            "status": "success",
-            "response": assistant_response,
-            "thread_id": thread_id,
-            "chat_id": chat_id,
-        }
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@app.route("/instruction_result", methods=["POST"])
+@api.route("/instruction_result", methods=["POST"])
 def instruction_result():
     data = request.get_json()
-    user_id = data.get("user_id")
+    user_id = caller_id(data.get("user_id"))
     cad_state = data.get("cad_state")
     error_message = data.get("error_message")
     status = data.get("status")
 
     if not user_id:
-        print("Missing user_id")
+        logger.warning("instruction_result: missing user_id")
         return jsonify({"status": False, "message": "Missing user_id"}), 400
     if not cad_state:
-        print("Missing cad_state")
+        logger.warning("instruction_result: missing cad_state")
         return jsonify({"status": False, "message": "Missing cad_state"}), 400
     if not error_message and status != "success":
-        print("Missing message")
+        logger.warning("instruction_result: missing message")
         return jsonify({"status": False, "message": "Missing message"}), 400
     if not status:
-        print("Missing status")
+        logger.warning("instruction_result: missing status")
         return jsonify({"status": False, "message": "Missing status"}), 400
 
     # Log operation completion by user (for security auditing)
-    print(f"Operation completed by user {user_id} with status: {status}")
+    logger.info("Operation completed by user %s with status: %s", user_id, status)
 
     # If status is not "success", mark it as "error" in database
     final_status = "completed" if status == "success" else "error"
-
-    # Update the most recent sent operation for this user to completed/error
-    try:
-        sent_ops = (
-            supabase.table("operations")
-            .select("*")
-            .eq("status", "sent")
-            .eq("user_id", user_id)
-            .order("created_at", desc=True)
-            .limit(1)
-            .execute()
+    metrics.record_operation(final_status)
+
+    # The plugin echoes the operation_id it was handed; the status change is
+    # persisted by the operation store's background writer
+    operation_id = data.get("operation_id")
+    if operation_id:
+        operation_store.record_status(operation_id, user_id, final_status)
+        response_cache.record_outcome(operation_id, user_id, status == "success")
+        example_index.record_outcome(operation_id, user_id, status == "success")
+        logger.info(
+            "Queued operation %s for user %s -> %s", operation_id, user_id, final_status
         )
+    else:
+        # Older plugins don't send operation_id: update the most recent sent operation
+        try:
+            sent_ops = (
+                supabase.table("operations")
+                .select("*")
+                .eq("status", "sent")
+                .eq("user_id", user_id)
+                .order("created_at", desc=True)
+                .limit(1)
+                .execute()
+            )
 
-        if sent_ops.data and len(sent_ops.data) > 0:
-            op = sent_ops.data[0]
+            if sent_ops.data and len(sent_ops.data) > 0:
+                op = sent_ops.data[0]
 
-            # Update operation status with screenshot URLs
-            supabase.table("operations").update(
-                {
-                    "status": final_status
-                }
-            ).eq("id", op["id"]).execute()
+                # Update operation status with screenshot URLs
+                supabase.table("operations").update(
+                    {
+                        "status": final_status
+                    }
+                ).eq("id", op["id"]).execute()
 
-            print(
-                f"Updated operation {op['id']} for user {user_id} to status: {final_status}"
-            )
-        else:
-            print(f"No sent operation found for user {user_id} to update")
-    except Exception as e:
-        print(f"Error updating operation status: {e}")
+                logger.info(
+                    "Updated operation %s for user %s to status: %s",
+                    op["id"],
+                    user_id,
+                    final_status,
+                )
+            else:
+                logger.info("No sent operation found for user %s to update", user_id)
+        except Exception as e:
+            logger.error("Error updating operation status: %s", e)
 
     # Store in Redis
     try:
         if "cad_state" in data:
-            redis_client.set(f"cad_state:{user_id}", json.dumps(cad_state))
+            cad_state_store.store(user_id, cad_state, data.get("cad_state_hash"))
         if "message" in data:
-            redis_client.set(f"cad_message:{user_id}", message)
+            redis_client.set(
+                f"cad_message:{user_id}",
+                state_retention.message(data["message"]),
+                ex=state_retention.ttl("cad_message:"),
+            )
         if "status" in data:
-            redis_client.set(f"cad_status:{user_id}", status)
+            redis_client.set(
+                f"cad_status:{user_id}",
+                status,
+                ex=state_retention.ttl("cad_status:"),
+            )
     except Exception as e:
-        print(f"Warning: Error storing data in Redis: {e}")
+        logger.warning("Error storing data in Redis: %s", e)
         # Continue execution even if Redis fails
 
     return jsonify({"status": True, "message": "Result received successfully"})
 
 
-@app.route("/poll", methods=["POST"])
+def record_plugin_poll(user_id, data):
+    """Refresh plugin presence and stored CAD state for a polling plugin.
+
+    Returns ``(rejection, resync)``: ``rejection`` is a ``(body, status_code)``
+    pair if the user has explicitly logged out, otherwise None, and
+    ``resync`` is True when the add-in's CAD state delta could not be applied
+    and it must upload the full state. Shared with the ASGI long-poll view,
+    so it must not depend on the Flask request context.
+    """
+    # Read presence, refresh it, store the CAD state and extend the TTLs of the
+    # user's state in one round trip
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        plugin_presence.queue_poll(pipe, user_id)
+        cad_state_store.queue_upload(pipe, user_id, data)
+        refreshed = state_retention.queue_refresh(pipe, user_id)
+        results = pipe.execute()
+        presence = PluginPresence.parse(results[0])
+        upload_result = results[-1 - refreshed]
+    except Exception as e:
+        logger.warning("Error updating plugin status in Redis: %s", e)
+        # Continue execution even if Redis fails
+        return None, False
+
+    # Check if user has explicitly logged out
+    if presence.get("logged_out") == "true":
+        logger.info(
+            "Rejecting poll for user %s - user has explicitly logged out", user_id
+        )
+
+        # Return 401 with a clear message that authentication is required
+        return (
+            {
+                "status": False,
+                "message": "User has logged out. Authentication required.",
+                "authentication_required": True,
+                "explicit_logout": True,
+            },
+            401,
+        ), False
+
+    try:
+        in_sync = cad_state_store.finish_upload(user_id, data, upload_result)
+    except Exception as e:
+        logger.warning("Error applying CAD state delta in Redis: %s", e)
+        in_sync = False
+    if not in_sync:
+        logger.info(
+            "CAD state out of sync for user %s, requesting full upload", user_id
+        )
+
+    return None, not in_sync
+
+
+@api.route("/poll", methods=["POST"])
 def poll():
     data = request.get_json()
-    print(data)
-    cad_state = data.get("cad_state")
-    user_id = data.get("user_id")
+    logger.debug(
+        "Poll received",
+        extra={"payload": data, "sample_every": POLL_LOG_SAMPLE},
+    )
+    user_id = caller_id(data.get("user_id"))
 
     if not user_id:
         return jsonify({"status": False, "message": "Missing user_id"}), 400
 
-    # Diagnostic logging for all Redis keys/values for this user
-    try:
-        plugin_login = redis_client.get(f"plugin_login:{user_id}")
-        plugin_login_value = plugin_login.decode("utf-8") if plugin_login else "none"
+    rejection, resync = record_plugin_poll(user_id, data)
+    if rejection:
+        body, status_code = rejection
+        return jsonify(body), status_code
 
-        explicit_logout = redis_client.get(f"plugin_explicitly_logged_out:{user_id}")
-        explicit_logout_value = (
-            explicit_logout.decode("utf-8") if explicit_logout else "none"
+    # Check for pending operations
+    pending = operation_store.has_pending(user_id)
+    metrics.record_poll("/poll", pending)
+    if pending:
+        logger.debug(
+            "Pending operation found for user %s",
+            user_id,
+            extra={"sample_every": POLL_LOG_SAMPLE},
         )
+        body = {"status": True, "message": "Operation pending for this user"}
+    else:
+        body = {"status": False, "message": "No pending operation"}
 
-        last_seen = redis_client.get(f"plugin_last_seen:{user_id}")
-        last_seen_value = last_seen.decode("utf-8") if last_seen else "none"
+    return jsonify({**body, "resync_cad_state": resync})
 
-        # print(f"REDIS STATE for user {user_id}:")
-        # print(f"  plugin_login: {plugin_login_value}")
-        # print(f"  explicitly_logged_out: {explicit_logout_value}")
-        # print(f"  last_seen: {last_seen_value}")
-    except Exception as e:
-        print(f"Warning: Error retrieving Redis diagnostic data: {e}")
 
-    # Check if user has explicitly logged out
-    try:
-        explicit_logout = redis_client.get(f"plugin_explicitly_logged_out:{user_id}")
-        if explicit_logout and explicit_logout.decode("utf-8") == "true":
-            print(f"Rejecting poll for user {user_id} - user has explicitly logged out")
+@api.route("/wait_for_operation", methods=["POST"])
+def wait_for_operation():
+    """Long-poll variant of /poll: parks the request until an operation is
+    enqueued for the user or LONG_POLL_TIMEOUT elapses, then claims it and
+    returns its instructions in the same response (no /get_instructions call)."""
+    data = request.get_json()
+    user_id = caller_id(data.get("user_id"))
 
-            # Return 401 with a clear message that authentication is required
-            return (
-                jsonify(
-                    {
-                        "status": False,
-                        "message": "User has logged out. Authentication required.",
-                        "authentication_required": True,
-                        "explicit_logout": True,
-                    }
-                ),
-                401,
-            )
-    except Exception as e:
-        print(f"Warning: Error checking logout status in Redis: {e}")
-        # Continue execution even if Redis check fails
+    if not user_id:
+        return jsonify({"status": False, "message": "Missing user_id"}), 400
 
-    # Update plugin last seen timestamp in Redis
-    try:
-        redis_client.set(f"plugin_last_seen:{user_id}", str(int(time.time())))
+    rejection, resync = record_plugin_poll(user_id, data)
+    if rejection:
+        body, status_code = rejection
+        return jsonify(body), status_code
 
-        # Only set login to true if not explicitly logged out
-        logout_flag = redis_client.get(f"plugin_explicitly_logged_out:{user_id}")
-        if not logout_flag or logout_flag.decode("utf-8") != "true":
-            redis_client.set(f"plugin_login:{user_id}", "true")
-    except Exception as e:
-        print(f"Warning: Error updating plugin status in Redis: {e}")
-        # Continue execution even if Redis fails
+    # Answer at once when the add-in has to resend its full CAD state
+    timeout = 0 if resync else long_poll_timeout(data)
 
-    # Store cad_state in Redis
-    if cad_state:
-        try:
-            redis_client.set(
-                f"cad_state:{user_id}",
-                json.dumps(cad_state) if isinstance(cad_state, dict) else cad_state,
-            )
-        except Exception as e:
-            print(f"Warning: Error storing data in Redis: {e}")
-            # Continue execution even if Redis fails
+    with operation_notifier.subscribe(user_id) as woken:
+        body = claim_operation_body(user_id)
+        if body is None and woken.wait(timeout):
+            body = claim_operation_body(user_id)
+    metrics.record_poll("/wait_for_operation", body is not None)
 
-    # Check for pending operations
-    pending_ops = (
-        supabase.table("operations")
-        .select("*")
-        .eq("status", "pending")
-        .eq("user_id", user_id)
-        .limit(1)
-        .execute()
-    )
+    return jsonify({**(body or NO_PENDING_OPERATION), "resync_cad_state": resync})
+
+
+def long_poll_timeout(data):
+    """Seconds to park a long-poll request, capped at LONG_POLL_TIMEOUT."""
+    return min(float(data.get("timeout", LONG_POLL_TIMEOUT)), LONG_POLL_TIMEOUT)
+
+
+def claim_operation_body(user_id):
+    """Claim the user's next pending operation and return the response body
+    carrying its instructions, or None if nothing is pending."""
+    op = operation_store.claim_next(user_id)
+    if op is None:
+        return None
 
-    if pending_ops.data and len(pending_ops.data) > 0:
-        print(f"Pending operation found for user {user_id}")
-        return jsonify({"status": True, "message": "Operation pending for this user"})
+    logger.info("Operation %s claimed by user %s", op["id"], user_id)
+    metrics.record_operation("sent")
+    return {
+        "status": True,
+        "instructions": op["python_code"],
+        "operation_id": op["id"],
+        "chat_id": op["chat_id"],
+    }
 
-    return jsonify({"status": False, "message": "No pending operation"})
 
+NO_PENDING_OPERATION = {"status": False, "message": "No pending operation"}
 
-@app.route("/get_instructions", methods=["POST"])
+
+@api.route("/get_instructions", methods=["POST"])
 def get_instructions():
     # Get user_id from request data
-    data = request.get_json()
-    if not data or not data.get("user_id"):
+    data = request.get_json(silent=True) or {}
+    user_id = caller_id(data.get("user_id"))
+    if not user_id:
         return jsonify({"status": False, "message": "Missing user_id parameter"}), 400
 
-    user_id = data.get("user_id")
-
     # Check if user has explicitly logged out
     try:
-        explicit_logout = redis_client.get(f"plugin_explicitly_logged_out:{user_id}")
-        if explicit_logout and explicit_logout.decode("utf-8") == "true":
-            print(
-                f"Rejecting get_instructions for user {user_id} - user has explicitly logged out"
+        if plugin_presence.is_logged_out(user_id):
+            logger.info(
+                "Rejecting get_instructions for user %s - user has explicitly logged out",
+                user_id,
             )
             return (
                 jsonify(
@@ -494,83 +976,114 @@ def get_instructions():
                 401,
             )
     except Exception as e:
-        print(f"Warning: Error checking logout status in Redis: {e}")
+        logger.warning("Error checking logout status in Redis: %s", e)
         # Continue execution even if Redis check fails
 
-    # Retrieve one pending operation FOR THIS USER ONLY
-    pending_ops = (
-        supabase.table("operations")
-        .select("*")
-        .eq("status", "pending")
-        .eq(
-            "user_id", user_id
-        )  # Critical security filter: only get operations for this user
-        .limit(1)
-        .execute()
-    )
-
-    if not pending_ops.data or len(pending_ops.data) == 0:
-        print(f"No pending operation for user {user_id}")
+    # Atomically claim one pending operation FOR THIS USER ONLY
+    body = claim_operation_body(user_id)
+    metrics.record_poll("/get_instructions", body is not None)
+    if body is None:
+        logger.debug(
+            "No pending operation for user %s",
+            user_id,
+            extra={"sample_every": POLL_LOG_SAMPLE},
+        )
         return jsonify(
             {"status": False, "message": "No pending operation for this user"}
         )
 
-    # Security double-check: make sure the operation belongs to this user
-    op = pending_ops.data[0]
-    if op["user_id"] != user_id:
-        print(
-            f"SECURITY ALERT: User {user_id} tried to access operation belonging to {op['user_id']}"
-        )
-        return (
-            jsonify(
-                {
-                    "status": False,
-                    "message": "Access denied: operation belongs to another user",
-                }
-            ),
-            403,
+    return jsonify(body)
+
+
+# Columns /get_chats and /get_messages return with ?fields=, and what their list
+# views return without it
+CHAT_FIELDS = (
+    "id",
+    "title",
+    "thread_id",
+    "assistant_id",
+    "user_id",
+    "created_at",
+    "updated_at",
+)
+CHAT_LIST_FIELDS = ("id", "title", "thread_id", "updated_at")
+MESSAGE_FIELDS = ("id", "chat_id", "role", "content", "created_at")
+MESSAGE_LIST_FIELDS = ("id", "role", "content", "created_at")
+# Rows per page when the client doesn't pass ?limit=, and the most it may ask for
+LISTING_PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", "50"))
+LISTING_MAX_PAGE_SIZE = int(os.getenv("LISTING_MAX_PAGE_SIZE", "500"))
+
+
+def list_page(key, filters, fields, version_key, order_column, desc, shape=None):
+    """Respond with one page of the ``key`` table's rows matching ``filters``
+    (``?cursor=``, ``?limit=``, ``?fields=``), or 304 if the client's ETag
+    shows it has the page already. ``fields`` is ``(allowed, list view)``;
+    ``shape`` rewrites each row of the list view."""
+    allowed, default = fields
+    try:
+        columns = parse_fields(request.args.get("fields"), allowed, default)
+        limit = parse_limit(
+            request.args.get("limit"), LISTING_PAGE_SIZE, LISTING_MAX_PAGE_SIZE
         )
+        cursor = request.args.get("cursor")
+        etag = listing_versions.etag(version_key, columns, limit, cursor)
+        if etag and request.if_none_match.contains_weak(etag):
+            return _listing_headers(Response(status=304), etag)
 
-    # Update the operation's status to "sent"
-    supabase.table("operations").update({"status": "sent"}).eq("id", op["id"]).execute()
+        rows, next_cursor = fetch_page(
+            supabase.table(key), filters, columns, order_column, desc, cursor, limit
+        )
+    except ListingError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    return jsonify(
-        {
-            "status": True,
-            "instructions": op["python_code"],
-            "operation_id": op["id"],
-            "chat_id": op["chat_id"],
-        }
+    if shape and not request.args.get("fields"):
+        rows = [shape(row) for row in rows]
+    return _listing_headers(
+        jsonify({"status": "success", key: rows, "next_cursor": next_cursor}), etag
     )
 
 
-@app.route("/get_chats", methods=["GET", "OPTIONS"])
+def _listing_headers(response, etag):
+    if etag:
+        response.set_etag(etag, weak=True)
+        # Stored by the browser, but revalidated before every use
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _reply_text_only(message):
+    content = message.get("content")
+    if isinstance(content, dict) and "user_facing_response" in content:
+        message["content"] = {"user_facing_response": content["user_facing_response"]}
+    return message
+
+
+@api.route("/get_chats", methods=["GET", "OPTIONS"])
 def get_chats():
+    """A page of the user's chats, most recently updated first."""
     # Handle preflight OPTIONS request
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"})
 
-    user_id = request.args.get("user_id")
+    user_id = caller_id(request.args.get("user_id"))
     if not user_id:
         return jsonify({"status": "error", "message": "Missing user_id parameter"}), 400
 
-    # Fetch all chats for the user, ordered by updated_at descending (newest first)
-    chats_response = (
-        supabase.table("chats")
-        .select("*")
-        .eq("user_id", user_id)
-        .order("updated_at", desc=True)
-        .execute()
+    return list_page(
+        "chats",
+        {"user_id": user_id},
+        (CHAT_FIELDS, CHAT_LIST_FIELDS),
+        listing_versions.chats_key(user_id),
+        "updated_at",
+        desc=True,
     )
 
-    if not chats_response.data:
-        return jsonify({"status": "success", "chats": []})
-
-    return jsonify({"status": "success", "chats": chats_response.data})
-
 
-@app.route("/get_messages", methods=["GET", "OPTIONS"])
+@api.route("/get_messages", methods=["GET", "OPTIONS"])
 def get_messages():
+    """A page of the chat's messages, oldest first. The list view carries
+    only the ``user_facing_response`` of assistant replies; their steps and
+    code come with ``?fields=`` listing ``content``."""
     # Handle preflight OPTIONS request
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"})
@@ -579,22 +1092,36 @@ def get_messages():
     if not chat_id:
         return jsonify({"status": "error", "message": "Missing chat_id parameter"}), 400
 
-    # Fetch all messages for the chat, ordered by created_at ascending (oldest first)
-    messages_response = (
-        supabase.table("messages")
-        .select("*")
-        .eq("chat_id", chat_id)
-        .order("created_at", desc=False)
-        .execute()
-    )
-
-    if not messages_response.data:
-        return jsonify({"status": "success", "messages": []})
+    # Without a verified caller (outside enforce) there is no one to check
+    user_id = caller_id(request.args.get("user_id"))
+    if user_id is not None:
+        try:
+            owned = chat_owner(chat_id) == user_id
+        except LookupError:
+            owned = False
+        if not owned:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": "Chat not found or not owned by user",
+                    }
+                ),
+                404,
+            )
 
-    return jsonify({"status": "success", "messages": messages_response.data})
+    return list_page(
+        "messages",
+        {"chat_id": chat_id},
+        (MESSAGE_FIELDS, MESSAGE_LIST_FIELDS),
+        listing_versions.messages_key(chat_id),
+        "created_at",
+        desc=False,
+        shape=_reply_text_only,
+    )
 
 
-@app.route("/delete_chat", methods=["DELETE", "OPTIONS"])
+@api.route("/delete_chat", methods=["DELETE", "OPTIONS"])
 def delete_chat():
     # Handle preflight OPTIONS request
     if request.method == "OPTIONS":
@@ -607,10 +1134,12 @@ def delete_chat():
             return jsonify({"status": "error", "message": "No JSON data provided"}), 400
 
         chat_id = data.get("chat_id")
-        user_id = data.get("user_id")
+        user_id = caller_id(data.get("user_id"))
 
         # Add debug logging
-        print(f"Delete request received for chat_id: {chat_id}, user_id: {user_id}")
+        logger.info(
+            "Delete request received for chat_id: %s, user_id: %s", chat_id, user_id
+        )
 
         # Validate required parameters
         if not chat_id:
@@ -627,7 +1156,7 @@ def delete_chat():
                 .eq("user_id", user_id)
                 .execute()
             )
-            print(f"Chat verification response: {chat_response}")
+            logger.debug("Chat verification response: %s", chat_response)
 
             # If no chat found or doesn't belong to user
             if not chat_response.data or len(chat_response.data) == 0:
@@ -641,7 +1170,7 @@ def delete_chat():
                     404,
                 )
         except Exception as e:
-            print(f"Error verifying chat ownership: {str(e)}")
+            logger.error("Error verifying chat ownership: %s", e)
             return (
                 jsonify(
                     {
@@ -654,13 +1183,14 @@ def delete_chat():
 
         # First delete all operations associated with the chat
         try:
-            print(f"Attempting to delete operations for chat_id: {chat_id}")
+            logger.debug("Attempting to delete operations for chat_id: %s", chat_id)
             operations_deletion = (
                 supabase.table("operations").delete().eq("chat_id", chat_id).execute()
             )
-            print(f"Operations deletion response: {operations_deletion}")
+            logger.debug("Operations deletion response: %s", operations_deletion)
+            operation_store.discard_chat(user_id, chat_id)
         except Exception as e:
-            print(f"Error deleting operations: {str(e)}")
+            logger.error("Error deleting operations: %s", e)
             return (
                 jsonify(
                     {
@@ -677,9 +1207,10 @@ def delete_chat():
             messages_deletion = (
                 supabase.table("messages").delete().eq("chat_id", chat_id).execute()
             )
-            print(f"Messages deletion response: {messages_deletion}")
+            logger.debug("Messages deletion response: %s", messages_deletion)
+            listing_versions.bump(listing_versions.messages_key(chat_id))
         except Exception as e:
-            print(f"Error deleting messages: {str(e)}")
+            logger.error("Error deleting messages: %s", e)
             return (
                 jsonify(
                     {"status": "error", "message": f"Error deleting messages: {str(e)}"}
@@ -696,9 +1227,10 @@ def delete_chat():
                 .eq("user_id", user_id)  # Double check user ownership
                 .execute()
             )
-            print(f"Chat deletion response: {chat_deletion}")
+            logger.debug("Chat deletion response: %s", chat_deletion)
+            listing_versions.bump(listing_versions.chats_key(user_id))
         except Exception as e:
-            print(f"Error deleting chat: {str(e)}")
+            logger.error("Error deleting chat: %s", e)
             return (
                 jsonify(
                     {"status": "error", "message": f"Error deleting chat: {str(e)}"}
@@ -717,7 +1249,7 @@ def delete_chat():
     except Exception as e:
         # Handle any exceptions and provide detailed error
         error_msg = str(e)
-        print(f"Exception in delete_chat: {error_msg}")
+        logger.exception("Exception in delete_chat: %s", error_msg)
         return (
             jsonify(
                 {"status": "error", "message": f"Failed to delete chat: {error_msg}"}
@@ -726,7 +1258,7 @@ def delete_chat():
         )
 
 
-@app.route("/fusion_auth", methods=["POST"])
+@api.route("/fusion_auth", methods=["POST"])
 def fusion_auth():
     """Authenticate Fusion 360 plugin user with email and password"""
     try:
@@ -759,20 +1291,16 @@ def fusion_auth():
 
         # Store plugin status in Redis
         try:
-            # Set plugin login status to true
-            redis_client.set(f"plugin_login:{user.id}", "true")
-            # Set last seen timestamp
-            redis_client.set(f"plugin_last_seen:{user.id}", str(int(time.time())))
-
             # IMPORTANT: Reset the explicit logout flag when user logs in again
             # This ensures consistency between plugin and backend auth state
-            redis_client.set(f"plugin_explicitly_logged_out:{user.id}", "false")
+            plugin_presence.login(user.id)
 
-            print(
-                f"User {user.id} authenticated successfully - reset logout flags in Redis"
+            logger.info(
+                "User %s authenticated successfully - reset logout flags in Redis",
+                user.id,
             )
         except Exception as e:
-            print(f"Warning: Error storing plugin status in Redis: {e}")
+            logger.warning("Error storing plugin status in Redis: %s", e)
             # Continue execution even if Redis fails
 
         # Return success with token from session and user id
@@ -781,19 +1309,63 @@ def fusion_auth():
                 "status": True,
                 "message": "Authentication successful",
                 "token": session.access_token,  # Use access_token from session object
+                "refresh_token": session.refresh_token,
+                "expires_at": session.expires_at,
                 "user_id": user.id,
             }
         )
 
     except Exception as e:
-        print(f"Error in authentication: {str(e)}")
+        logger.error("Error in authentication: %s", e)
         return (
             jsonify({"status": False, "message": f"Authentication error: {str(e)}"}),
             500,
         )
 
 
-@app.route("/verify_token", methods=["POST"])
+@api.route("/refresh_token", methods=["POST"])
+def refresh_token():
+    """Exchange a Fusion add-in's refresh token for a new session. Access
+    tokens last about an hour; the add-in refreshes them before they expire.
+    Each refresh token is single use, so the response carries the next one."""
+    data = request.get_json(silent=True) or {}
+    token = data.get("refresh_token")
+    if not token:
+        return jsonify({"status": False, "message": "Missing refresh_token"}), 400
+
+    from gotrue.errors import AuthApiError
+
+    try:
+        session = session_auth.refresh_session(token).session
+    except AuthApiError as e:
+        logger.info("Refresh token rejected: %s", e)
+        return (
+            jsonify(
+                {
+                    "status": False,
+                    "message": "Invalid refresh token",
+                    "authentication_required": True,
+                }
+            ),
+            401,
+        )
+    except Exception as e:
+        # The add-in keeps its refresh token and tries again later
+        logger.error("Error refreshing session: %s", e)
+        return jsonify({"status": False, "message": f"Refresh error: {e}"}), 502
+
+    return jsonify(
+        {
+            "status": True,
+            "token": session.access_token,
+            "refresh_token": session.refresh_token,
+            "expires_at": session.expires_at,
+            "user_id": session.user.id,
+        }
+    )
+
+
+@api.route("/verify_token", methods=["POST"])
 def verify_token():
     """Verify a Supabase authentication token or encrypted token data."""
     try:
@@ -854,7 +1426,7 @@ def verify_token():
                 )
 
             except Exception as e:
-                print(f"Error processing encrypted token data: {str(e)}")
+                logger.error("Error processing encrypted token data: %s", e)
                 return (
                     jsonify(
                         {
@@ -869,15 +1441,16 @@ def verify_token():
         if not token or token.startswith("TEMPORARY_TOKEN_"):
             return jsonify({"status": False, "message": "Valid token is required"}), 400
 
-        # Verify the token with Supabase
+        # Verify the token locally; Supabase is only asked when no key is available
         try:
-            user = supabase.auth.get_user(token)
-            if user and user.user and user.user.id:
+            claims = token_verifier.verify(token)
+            if claims:
                 return jsonify(
                     {
                         "status": True,
                         "message": "Token is valid",
-                        "user_id": user.user.id,
+                        "user_id": claims["sub"],
+                        "expires_at": claims.get("exp"),
                     }
                 )
             else:
@@ -891,14 +1464,14 @@ def verify_token():
             )
 
     except Exception as e:
-        print(f"Error in verify_token: {str(e)}")
+        logger.error("Error in verify_token: %s", e)
         return (
             jsonify({"status": False, "message": f"Verification error: {str(e)}"}),
             500,
         )
 
 
-@app.route("/plugin_logout", methods=["POST"])
+@api.route("/plugin_logout", methods=["POST"])
 def plugin_logout():
     """Handle plugin logout and update Redis status."""
     try:
@@ -907,28 +1480,24 @@ def plugin_logout():
         if not data:
             return jsonify({"status": False, "message": "No JSON data provided"}), 400
 
-        user_id = data.get("user_id")
+        user_id = caller_id(data.get("user_id"))
 
         if not user_id:
             return jsonify({"status": False, "message": "Missing user_id"}), 400
 
         # Clear plugin login status in Redis - with additional keys to ensure full invalidation
         try:
-            # Explicitly set the plugin status to logged out
-            redis_client.set(f"plugin_login:{user_id}", "false")
-
-            # Update the last seen timestamp to now
-            redis_client.set(f"plugin_last_seen:{user_id}", str(int(time.time())))
-
-            # Set a dedicated logout flag
-            redis_client.set(f"plugin_explicitly_logged_out:{user_id}", "true")
+            # Mark the plugin logged out; polls are rejected until the next login
+            plugin_presence.logout(user_id)
 
             # Log this event for debugging
-            print(
-                f"Plugin logout recorded for user {user_id} with timestamp {int(time.time())}"
+            logger.info(
+                "Plugin logout recorded for user %s with timestamp %d",
+                user_id,
+                int(time.time()),
             )
         except Exception as e:
-            print(f"Warning: Error updating plugin logout status in Redis: {e}")
+            logger.warning("Error updating plugin logout status in Redis: %s", e)
             # Continue execution even if Redis fails
 
         return jsonify(
@@ -936,48 +1505,27 @@ def plugin_logout():
         )
 
     except Exception as e:
-        print(f"Error in plugin_logout: {str(e)}")
+        logger.error("Error in plugin_logout: %s", e)
         return jsonify({"status": False, "message": f"Logout error: {str(e)}"}), 500
 
 
-@app.route("/check_plugin_login", methods=["GET"])
+@api.route("/check_plugin_login", methods=["GET"])
 def check_plugin_login():
     """Check if a user's Fusion plugin is logged in and active."""
-    user_id = request.args.get("user_id")
+    user_id = caller_id(request.args.get("user_id"))
 
     if not user_id:
         return jsonify({"status": False, "message": "Missing user_id parameter"}), 400
 
-    # Diagnostic logging for all Redis keys/values for this user
     try:
-        plugin_login = redis_client.get(f"plugin_login:{user_id}")
-        plugin_login_value = plugin_login.decode("utf-8") if plugin_login else "none"
-
-        explicit_logout = redis_client.get(f"plugin_explicitly_logged_out:{user_id}")
-        explicit_logout_value = (
-            explicit_logout.decode("utf-8") if explicit_logout else "none"
-        )
-
-        last_seen = redis_client.get(f"plugin_last_seen:{user_id}")
-        last_seen_value = last_seen.decode("utf-8") if last_seen else "none"
+        # One HGETALL; the hash only exists while the plugin keeps polling or after a logout
+        presence = plugin_presence.get(user_id)
 
-        # print(f"REDIS STATE for user {user_id}:")
-        # print(f"  plugin_login: {plugin_login_value}")
-        # print(f"  explicitly_logged_out: {explicit_logout_value}")
-        # print(f"  last_seen: {last_seen_value}")
-    except Exception as e:
-        print(f"Warning: Error retrieving Redis diagnostic data: {e}")
-
-    try:
         # Check if plugin is logged in
-        plugin_login = redis_client.get(f"plugin_login:{user_id}")
-        plugin_login_status = plugin_login and plugin_login.decode("utf-8") == "true"
+        plugin_login_status = presence.get("login") == "true"
 
         # Check explicit logout flag
-        explicit_logout = redis_client.get(f"plugin_explicitly_logged_out:{user_id}")
-        explicitly_logged_out = (
-            explicit_logout and explicit_logout.decode("utf-8") == "true"
-        )
+        explicitly_logged_out = presence.get("logged_out") == "true"
 
         # Check Supabase for user existence - this provides an extra layer of validation
         # that the user_id is valid and belongs to a real user
@@ -992,57 +1540,37 @@ def check_plugin_login():
             )
             user_exists = user_check.data and len(user_check.data) > 0
             if not user_exists:
-                print(f"WARNING: User {user_id} not found in database")
+                logger.warning("User %s not found in database", user_id)
                 # Consider the user logged out if they don't exist in the database
                 explicitly_logged_out = True
                 plugin_login_status = False
         except Exception as e:
-            print(f"Warning: Error checking user existence in database: {e}")
+            logger.warning("Error checking user existence in database: %s", e)
 
         # If explicitly logged out, override login status regardless of other states
         if explicitly_logged_out:
             plugin_login_status = False
 
         # Get last seen timestamp
-        last_seen = redis_client.get(f"plugin_last_seen:{user_id}")
-        print(f"Last seen value: {last_seen}")
-        last_seen_timestamp = int(last_seen.decode("utf-8")) if last_seen else None
-
-        # Calculate if plugin is active (seen in the last 5 minutes)
-        is_active = False
-        time_since_last_seen = None
-
-        if last_seen_timestamp:
-            current_time = int(time.time())
-            time_since_last_seen = current_time - last_seen_timestamp
-            # Consider active if seen in the last 5 minutes
-            is_active = time_since_last_seen < 300  # 5 minutes in seconds
-
-        # Check if plugin has explicitly logged out via plugin_login key
-        plugin_explicitly_logged_out = (
-            plugin_login and plugin_login.decode("utf-8") == "false"
+        last_seen = presence.get("last_seen")
+        last_seen_timestamp = int(last_seen) if last_seen else None
+        time_since_last_seen = (
+            int(time.time()) - last_seen_timestamp if last_seen_timestamp else None
         )
 
+        # Polls keep the presence key alive for ACTIVE_TTL seconds, so an active
+        # plugin is one whose key still exists and that hasn't logged out
+        is_active = bool(presence) and not explicitly_logged_out
+
+        # Check if plugin has explicitly logged out via the login field
+        plugin_explicitly_logged_out = presence.get("login") == "false"
+
         # Combined logout check - either by flag or by login status
         is_logged_out = explicitly_logged_out or plugin_explicitly_logged_out
 
         # Only show as connected if the plugin is BOTH logged in AND active AND NOT explicitly logged out
         is_connected = plugin_login_status and is_active and not is_logged_out
 
-        # Debug info to help diagnose issues
-        print(f"Plugin status for user {user_id}:")
-        print(
-            f"  plugin_login: {plugin_login.decode('utf-8') if plugin_login else None}"
-        )
-        print(f"  plugin_login_status: {plugin_login_status}")
-        print(f"  explicitly_logged_out: {explicitly_logged_out}")
-        print(f"  plugin_explicitly_logged_out: {plugin_explicitly_logged_out}")
-        print(f"  is_logged_out: {is_logged_out}")
-        print(
-            f"  is_active: {is_active} (last seen: {time_since_last_seen} seconds ago)"
-        )
-        print(f"  is_connected: {is_connected}")
-
         # Set appropriate status message
         status_message = "Disconnected"
         if is_logged_out:
@@ -1054,7 +1582,21 @@ def check_plugin_login():
         elif not plugin_login_status:
             status_message = "Not installed"
 
-        print(f"  status_message: {status_message}")
+        # Debug info to help diagnose issues
+        logger.debug(
+            "Plugin status for user %s: %s",
+            user_id,
+            status_message,
+            extra={
+                "plugin_login": presence.get("login"),
+                "plugin_login_status": plugin_login_status,
+                "explicitly_logged_out": explicitly_logged_out,
+                "plugin_explicitly_logged_out": plugin_explicitly_logged_out,
+                "is_active": is_active,
+                "time_since_last_seen": time_since_last_seen,
+                "is_connected": is_connected,
+            },
+        )
 
         # Return accurate plugin status
         return jsonify(
@@ -1073,7 +1615,7 @@ def check_plugin_login():
         )
 
     except Exception as e:
-        print(f"Error checking plugin login status: {str(e)}")
+        logger.exception("Error checking plugin login status: %s", e)
         return (
             jsonify(
                 {"status": False, "message": f"Error checking plugin status: {str(e)}"}
@@ -1082,25 +1624,93 @@ def check_plugin_login():
         )
 
 
-def parse_messages(messages):
-    parsed_messages = []
-    for message in messages.data:
-        content = ""
-        for block in message.content:
-            if block.type == "text":
-                content += block.text.value
-        parsed_messages.append(
-            {
-                "id": message.id,
-                "role": message.role,
-                "content": content,
-                "created_at": message.created_at,
-                "thread_id": message.thread_id,
-            }
-        )
+@api.route("/ready", methods=["GET"])
+def ready():
+    """Readiness check: the worker is up and Redis answers. Builds none of
+    the lazy clients, so it can be polled right after a restart."""
+    checks = {
+        "supabase_client": supabase.built,
+        "openai_client": client.built,
+    }
+    if use_redis:
+        try:
+            redis_client.ping()
+            checks["redis"] = "ok"
+        except Exception as e:
+            logger.warning("Readiness check: Redis unavailable: %s", e)
+            checks["redis"] = "unavailable"
+    else:
+        checks["redis"] = "local"
+    status_code = 503 if checks["redis"] == "unavailable" else 200
+    return jsonify({"status": status_code == 200, **checks}), status_code
+
+
+@api.route("/admin/state_stats", methods=["GET"])
+def state_stats():
+    """Key counts and bytes per Redis key family. Requires
+    ``Authorization: Bearer $ADMIN_TOKEN``; ``?limit=`` caps the keys scanned."""
+    if not ADMIN_TOKEN:
+        return jsonify({"status": False, "message": "Not found"}), 404
+    if request.headers.get("Authorization") != f"Bearer {ADMIN_TOKEN}":
+        return jsonify({"status": False, "message": "Unauthorized"}), 401
+    try:
+        limit = int(request.args.get("limit", "100000"))
+    except ValueError:
+        return jsonify({"status": False, "message": "Invalid limit"}), 400
+
+    try:
+        stats = state_retention.stats(limit)
+    except Exception as e:
+        logger.exception("Error collecting state stats: %s", e)
+        return jsonify({"status": False, "message": f"Error: {str(e)}"}), 500
+    return jsonify(
+        {
+            "status": True,
+            "store": "redis" if use_redis else "local",
+            "ttls": state_retention.ttls,
+            "state_max_bytes": STATE_MAX_BYTES,
+            **stats,
+        }
+    )
+
+
+def create_app():
+    """Build the Flask app serving every route in this module."""
+    app = Flask(__name__)
+    # Explicitly allow all origins with a single CORS configuration
+    CORS(app, resources={r"/*": {"origins": "*"}})
+    # Request latency histograms and /metrics; registered first so they cover the
+    # other hooks
+    metrics.init_app(app, token=os.getenv("METRICS_TOKEN"))
+    # gzip/zstd request bodies from the add-in and negotiated response compression
+    compression.init_app(app)
+    # msgpack request bodies and, for clients that ask, responses
+    cad_codec.init_app(app)
+    # Resolve the caller from the bearer token (flask.g.user_id) before every view;
+    # the login routes are how a client obtains a token in the first place
+    auth.init_app(
+        app,
+        authenticator,
+        public_endpoints=(
+            "api.fusion_auth",
+            "api.refresh_token",
+            "api.verify_token",
+            "api.ready",
+            "api.state_stats",  # Checks ADMIN_TOKEN itself
+            "metrics",
+        ),
+    )
+    app.register_blueprint(api)
+
+    @app.cli.command("provision-storage")
+    def provision_storage_command():
+        """Create the Supabase storage bucket used for screenshots."""
+        provision_storage()
+
+    return app
 
-    return parsed_messages
 
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
@@ -0,0 +1,285 @@
+# forgemind-backend/asgi.py
+
+"""Async serving mode for the backend: ``uvicorn asgi:app``.
+
+The long-lived routes run as native async views so a single worker can hold
+hundreds of them open: /wait_for_operation parks on an ``asyncio.Event``
+instead of a thread, /chat_stream streams from ``AsyncOpenAI`` over a pooled
+``httpx.AsyncClient``, and /chat_status reads job records through a
+``redis.asyncio`` connection pool. Short Supabase calls reuse the shared sync
+client from ``app.py`` on the thread pool, so hot-path logic lives in one
+place. Every other route is served by the Flask app through a WSGI bridge.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from openai import AsyncOpenAI
+from pydantic import ValidationError
+from redis.asyncio import ConnectionPool, Redis as AsyncRedis
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as backend
+import cad_codec
+import metrics
+from chat_jobs import ChatJobRunner
+from compression import MIN_COMPRESS_SIZE, BodyTooLarge, decompress_body
+from streaming import JsonStringFieldStreamer, sse_event
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on pooled connections per upstream service in this worker
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "100"))
+# Threads available to the WSGI bridge for routes still served by Flask
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "32"))
+
+
+class AsyncClients:
+    """Pooled async clients shared by every request in this worker."""
+
+    http: httpx.AsyncClient = None
+    openai: AsyncOpenAI = None
+    redis: AsyncRedis = None
+
+
+clients = AsyncClients()
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    clients.http = metrics.time_http(
+        httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_POOL_SIZE,
+                max_keepalive_connections=ASYNC_POOL_SIZE,
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        ),
+        "openai",
+    )
+    clients.openai = AsyncOpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"), http_client=clients.http
+    )
+    if backend.use_redis:
+        clients.redis = AsyncRedis(
+            connection_pool=ConnectionPool.from_url(
+                backend.redis_url,
+                max_connections=ASYNC_POOL_SIZE,
+                socket_connect_timeout=2,
+            )
+        )
+    try:
+        yield
+    finally:
+        if clients.redis is not None:
+            await clients.redis.aclose()
+        await clients.http.aclose()
+
+
+async def read_json(request):
+    """Parse a JSON (or msgpack) request body, inflating it if the client
+    compressed it.
+
+    Routes mounted from Flask get the same treatment from compression.py's
+    WSGI middleware and cad_codec's request class.
+    """
+    body = await request.body()
+    body = decompress_body(body, request.headers.get("content-encoding"))
+    if request.headers.get("content-type", "").startswith(cad_codec.MSGPACK_MIMETYPE):
+        return cad_codec.unpack(body)
+    return json.loads(body)
+
+
+def body_error(error):
+    status_code = 413 if isinstance(error, BodyTooLarge) else 400
+    return JSONResponse({"status": False, "message": str(error)}, status_code)
+
+
+async def authenticate(request, claimed_user_id=None):
+    """Native-route counterpart of the Flask ``before_request`` auth hook.
+
+    Returns an error response when the request must be refused, else None.
+    Verification normally hits the in-process cache, but an unseen token may
+    need a JWKS fetch, so it runs off the event loop.
+    """
+    user_id, rejection = await run_in_threadpool(
+        backend.authenticator.authenticate,
+        request.headers.get("authorization"),
+        claimed_user_id,
+    )
+    # The caller views act for; see auth.caller_id
+    request.state.user_id = user_id or claimed_user_id
+    if rejection:
+        body, status_code = rejection
+        return JSONResponse(body, status_code)
+    return None
+
+
+async def wait_for_operation(request):
+    try:
+        data = await read_json(request)
+    except ValueError as e:
+        return body_error(e)
+    denied = await authenticate(request, data.get("user_id"))
+    if denied:
+        return denied
+    user_id = request.state.user_id
+
+    if not user_id:
+        return JSONResponse({"status": False, "message": "Missing user_id"}, 400)
+
+    rejection, resync = await run_in_threadpool(
+        backend.record_plugin_poll, user_id, data
+    )
+    if rejection:
+        body, status_code = rejection
+        return JSONResponse(body, status_code)
+
+    # Answer at once when the add-in has to resend its full CAD state
+    timeout = 0 if resync else backend.long_poll_timeout(data)
+
+    async with backend.operation_notifier.subscribe_async(user_id) as woken:
+        body = await run_in_threadpool(backend.claim_operation_body, user_id)
+        if body is None and timeout > 0:
+            try:
+                await asyncio.wait_for(woken.wait(), timeout)
+                body = await run_in_threadpool(backend.claim_operation_body, user_id)
+            except asyncio.TimeoutError:
+                pass
+    metrics.record_poll("/wait_for_operation", body is not None)
+
+    return JSONResponse(
+        {**(body or backend.NO_PENDING_OPERATION), "resync_cad_state": resync}
+    )
+
+
+async def chat_status(request):
+    denied = await authenticate(request)
+    if denied:
+        return denied
+    job_id = request.path_params["job_id"]
+
+    if clients.redis is not None:
+        raw = await clients.redis.get(f"{ChatJobRunner.KEY_PREFIX}{job_id}")
+        job = json.loads(raw) if raw else None
+    else:
+        job = backend.chat_jobs.get(job_id)
+
+    if job is None or not ChatJobRunner.visible_to(job, request.state.user_id):
+        return JSONResponse(
+            {"status": "error", "message": "Unknown or expired job_id"}, 404
+        )
+
+    return JSONResponse({"status": "success", "job_id": job_id, **job})
+
+
+async def stream_reply(chat):
+    """Async counterpart of ``backend.chat_engine.stream``."""
+    engine = backend.chat_engine
+    if engine.name == "completions":
+        # History is read from Supabase with the sync client
+        params = await run_in_threadpool(engine.request, chat)
+        stream = await clients.openai.chat.completions.create(stream=True, **params)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        return
+
+    async with clients.openai.beta.threads.runs.stream(
+        thread_id=chat.thread_id, assistant_id=engine.assistant_id
+    ) as stream:
+        async for delta in stream.text_deltas:
+            yield delta
+
+
+async def chat_stream(request):
+    try:
+        data = backend.ChatPayload(**await read_json(request))
+    except ValidationError as e:
+        return JSONResponse(
+            {"status": "error", "message": "Invalid payload", "errors": e.errors()},
+            400,
+        )
+    except ValueError as e:
+        return body_error(e)
+
+    denied = await authenticate(request, data.user_id)
+    if denied:
+        return denied
+    # The prompt is sent as the verified caller, whatever user_id the body names
+    data = data.model_copy(update={"user_id": request.state.user_id})
+
+    async def generate():
+        try:
+            chat = await run_in_threadpool(backend.prepare_chat, data)
+            yield sse_event(
+                "meta", {"chat_id": chat.chat_id, "thread_id": chat.thread_id}
+            )
+
+            cached_response = await run_in_threadpool(
+                backend.replay_known_response, data, chat
+            )
+            if cached_response is not None:
+                yield sse_event(
+                    "token", {"text": cached_response["user_facing_response"]}
+                )
+                result = await run_in_threadpool(
+                    backend.complete_chat, data, chat, cached_response, True
+                )
+                yield sse_event("final", result)
+                return
+
+            streamer = JsonStringFieldStreamer("user_facing_response")
+            raw_response = []
+            with chat.timer.step("reply"):
+                async for delta in stream_reply(chat):
+                    raw_response.append(delta)
+                    text = streamer.feed(delta)
+                    if text:
+                        yield sse_event("token", {"text": text})
+
+            assistant_response = json.loads("".join(raw_response))
+            result = await run_in_threadpool(
+                backend.complete_chat, data, chat, assistant_response
+            )
+            yield sse_event("final", result)
+        except Exception as e:
+            logger.exception("Error in chat_stream: %s", e)
+            yield sse_event("error", {"message": str(e)})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+app = Starlette(
+    routes=[
+        Route("/wait_for_operation", wait_for_operation, methods=["POST"]),
+        Route("/chat_status/{job_id}", chat_status, methods=["GET"]),
+        Route("/chat_stream", chat_stream, methods=["POST"]),
+        Mount("/", app=WSGIMiddleware(backend.app, workers=WSGI_THREADS)),
+    ],
+    middleware=[
+        # Request latency for the native routes (see /metrics)
+        Middleware(metrics.ASGIRequestTimer),
+        Middleware(
+            CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]
+        ),
+        # Compresses native routes; responses Flask already encoded pass through
+        Middleware(GZipMiddleware, minimum_size=MIN_COMPRESS_SIZE),
+    ],
+    lifespan=lifespan,
+)
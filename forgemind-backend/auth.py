@@ -0,0 +1,212 @@
+# forgemind-backend/auth.py
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from flask import g, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+# Signing algorithms Supabase uses; anything else (including "none") is rejected
+ALLOWED_ALGORITHMS = ("HS256", "RS256", "ES256")
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens and caches the verified claims.
+
+    Signatures are checked locally, with ``SUPABASE_JWT_SECRET`` for HS256
+    projects or against the project's JWKS (fetched once and cached by
+    ``PyJWKClient``) for asymmetric keys. Only when neither is available does
+    verification fall back to ``supabase.auth.get_user``. Successful results
+    are kept in a bounded LRU keyed by the token's SHA-256, each until the
+    token's ``exp``, so repeat checks never leave the process.
+    """
+
+    AUDIENCE = "authenticated"
+
+    def __init__(
+        self,
+        supabase,
+        supabase_url: str,
+        jwt_secret: str = None,
+        max_entries: int = 10000,
+        fallback_ttl: int = 300,
+    ):
+        self._supabase = supabase
+        self._secret = jwt_secret
+        self._jwks = (
+            jwt.PyJWKClient(f"{supabase_url}/auth/v1/.well-known/jwks.json")
+            if supabase_url
+            else None
+        )
+        self._max_entries = max_entries
+        self._fallback_ttl = fallback_ttl
+        self._cache = OrderedDict()  # token hash -> (expires_at, claims)
+        self._lock = threading.Lock()
+
+    def verify(self, token: str):
+        """Return the token's claims (``sub`` is the user id), or None if invalid."""
+        if not token:
+            return None
+
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                if cached[0] > now:
+                    self._cache.move_to_end(key)
+                    return cached[1]
+                del self._cache[key]
+
+        claims = self._verify_uncached(token)
+        if claims is None:
+            return None
+
+        expires_at = claims.get("exp") or now + self._fallback_ttl
+        with self._lock:
+            self._cache[key] = (expires_at, claims)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+        return claims
+
+    def _verify_uncached(self, token):
+        try:
+            return self._verify_locally(token)
+        except jwt.InvalidTokenError:
+            return None
+        except (jwt.PyJWKClientError, _NoLocalKey) as e:
+            logger.warning(
+                "Local token verification unavailable (%s), asking Supabase", e
+            )
+            return self._verify_remotely(token)
+
+    def _verify_locally(self, token):
+        algorithm = jwt.get_unverified_header(token).get("alg")
+        if algorithm not in ALLOWED_ALGORITHMS:
+            raise jwt.InvalidAlgorithmError(f"Unsupported algorithm: {algorithm}")
+
+        if algorithm == "HS256":
+            if not self._secret:
+                raise _NoLocalKey("SUPABASE_JWT_SECRET is not set")
+            key = self._secret
+        elif self._jwks is not None:
+            key = self._jwks.get_signing_key_from_jwt(token).key
+        else:
+            raise _NoLocalKey("no JWKS URL configured")
+
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=self.AUDIENCE,
+            options={"require": ["exp", "sub"]},
+        )
+
+    def _verify_remotely(self, token):
+        try:
+            user = self._supabase.auth.get_user(token)
+        except Exception as e:
+            logger.error("Token verification with Supabase failed: %s", e)
+            return None
+        if not (user and user.user and user.user.id):
+            return None
+
+        # Supabase vouched for the token; its own exp still bounds the cache entry
+        try:
+            exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        except jwt.InvalidTokenError:
+            exp = None
+        return {"sub": user.user.id, "exp": exp}
+
+
+class _NoLocalKey(Exception):
+    """No key is configured to verify this token locally."""
+
+
+class RequestAuthenticator:
+    """Resolves the user behind a request from its ``Authorization: Bearer`` token.
+
+    ``enforcement`` controls what happens when the token is missing, invalid
+    or belongs to a different user than the ``user_id`` the client sent:
+
+    - ``off``: only resolve the user id;
+    - ``warn``: also log the problem, but let the request through (rollout);
+    - ``enforce``: reject with 401/403.
+    """
+
+    MODES = ("off", "warn", "enforce")
+
+    def __init__(self, verifier: TokenVerifier, enforcement: str = "warn"):
+        if enforcement not in self.MODES:
+            raise ValueError(f"AUTH_ENFORCEMENT must be one of {self.MODES}")
+        self._verifier = verifier
+        self.enforcement = enforcement
+
+    def authenticate(self, authorization: str, claimed_user_id: str = None):
+        """Return ``(user_id, rejection)``.
+
+        ``user_id`` is the token's subject or None; ``rejection`` is a
+        ``(body, status_code)`` pair when the request must be refused.
+        """
+        scheme, _, token = (authorization or "").partition(" ")
+        claims = (
+            self._verifier.verify(token.strip())
+            if scheme.lower() == "bearer"
+            else None
+        )
+        user_id = claims["sub"] if claims else None
+
+        if user_id is None:
+            problem = "Missing or invalid access token"
+            status_code = 401
+        elif claimed_user_id and claimed_user_id != user_id:
+            problem = "Access token does not belong to this user_id"
+            status_code = 403
+        else:
+            return user_id, None
+
+        if self.enforcement == "warn":
+            logger.warning("%s (user_id=%s)", problem, claimed_user_id)
+        if self.enforcement != "enforce":
+            return user_id, None
+        return user_id, (
+            {"status": False, "message": problem, "authentication_required": True},
+            status_code,
+        )
+
+
+def caller_id(claimed_user_id=None):
+    """The user a view acts for: the verified ``g.user_id``, or the
+    ``user_id`` the client sent when its request carries no valid token
+    (which only gets through while enforcement is ``off`` or ``warn``)."""
+    return g.get("user_id") or claimed_user_id
+
+
+def init_app(app, authenticator: RequestAuthenticator, public_endpoints=()):
+    """Authenticate every request to ``app`` except preflights and
+    ``public_endpoints``; views read the caller with ``caller_id``."""
+
+    @app.before_request
+    def authenticate_request():
+        g.user_id = None
+        if request.method == "OPTIONS" or request.endpoint in public_endpoints:
+            return None
+
+        # JSON or msgpack (see cad_codec); None for other bodies
+        body = request.get_json(silent=True)
+        claimed_user_id = request.args.get("user_id") or (
+            body.get("user_id") if isinstance(body, dict) else None
+        )
+        g.user_id, rejection = authenticator.authenticate(
+            request.headers.get("Authorization"), claimed_user_id
+        )
+        if rejection:
+            body, status_code = rejection
+            return jsonify(body), status_code
+        return None
@@ -0,0 +1,112 @@
+# forgemind-backend/benchmarks/auth_bench.py
+
+"""Per-request cost of verifying the bearer token.
+
+Signs Supabase-shaped HS256 access tokens with a throwaway secret and times
+``TokenVerifier.verify`` for unseen tokens (full signature check) and repeat
+tokens (cache hit), then the whole ``before_request`` hook on a bare Flask app
+serving a /poll-sized JSON body, against the same app without the hook:
+
+    python benchmarks/auth_bench.py --requests 5000
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import jwt
+from flask import Flask, g, jsonify
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import auth  # noqa: E402
+from auth import RequestAuthenticator, TokenVerifier  # noqa: E402
+
+SECRET = "benchmark-secret-" + uuid.uuid4().hex
+
+
+def access_token(user_id):
+    now = int(time.time())
+    return jwt.encode(
+        {
+            "sub": user_id,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "iat": now,
+            "exp": now + 3600,
+            "session_id": str(uuid.uuid4()),
+        },
+        SECRET,
+        algorithm="HS256",
+    )
+
+
+def per_call_us(fn, args):
+    started = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - started) / len(args) * 1e6
+
+
+def bench_verifier(count):
+    verifier = TokenVerifier(None, None, jwt_secret=SECRET, max_entries=count)
+    tokens = [access_token(str(uuid.uuid4())) for _ in range(count)]
+
+    uncached = per_call_us(verifier.verify, tokens)
+    cached = per_call_us(verifier.verify, tokens)
+    print(f"TokenVerifier.verify ({count} tokens)")
+    print(f"  uncached (HS256 signature check) {uncached:8.1f} us/token")
+    print(f"  cached                           {cached:8.1f} us/token")
+
+
+def make_app(authenticator):
+    app = Flask(__name__)
+    if authenticator is not None:
+        auth.init_app(app, authenticator)
+
+    @app.route("/poll", methods=["POST"])
+    def poll():
+        return jsonify({"status": True, "user_id": g.get("user_id")})
+
+    return app
+
+
+def bench_requests(count):
+    user_id = str(uuid.uuid4())
+    headers = {"Authorization": f"Bearer {access_token(user_id)}"}
+    body = {"user_id": user_id, "cad_state_hash": "0" * 64, "timeout": 25}
+    verifier = TokenVerifier(None, None, jwt_secret=SECRET)
+
+    print(f"Flask /poll round trip ({count} requests, test client)")
+    baseline = None
+    for label, authenticator in (
+        ("no auth hook", None),
+        ("auth hook, enforce", RequestAuthenticator(verifier, "enforce")),
+    ):
+        client = make_app(authenticator).test_client()
+        assert client.post("/poll", json=body, headers=headers).status_code == 200
+
+        started = time.perf_counter()
+        for _ in range(count):
+            client.post("/poll", json=body, headers=headers)
+        elapsed = (time.perf_counter() - started) / count * 1e6
+
+        overhead = "" if baseline is None else f" (+{elapsed - baseline:.1f} us)"
+        baseline = elapsed if baseline is None else baseline
+        print(f"  {label:<20} {elapsed:8.1f} us/request{overhead}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    bench_verifier(args.tokens)
+    bench_requests(args.requests)
+
+
+if __name__ == "__main__":
+    main()
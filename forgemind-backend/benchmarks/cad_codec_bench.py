@@ -0,0 +1,73 @@
+# forgemind-backend/benchmarks/cad_codec_bench.py
+
+"""Stored CAD state size and encode/decode time, JSON against ``cad_codec``.
+
+Uses the synthetic designs of ``prompt_state_bench.py`` and compares the
+JSON text stored before, the same text zstd-compressed, plain msgpack and
+``cad_codec`` (msgpack in zstd). Decoding is to the Python object /chat
+works from:
+
+    python benchmarks/cad_codec_bench.py --rounds 50
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import msgpack
+import zstandard
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import cad_codec  # noqa: E402
+from prompt_state_bench import design  # noqa: E402
+
+zstd_compressor = zstandard.ZstdCompressor(level=cad_codec.ZSTD_LEVEL)
+zstd_decompressor = zstandard.ZstdDecompressor()
+
+FORMATS = {
+    "json": (lambda state: json.dumps(state).encode("utf-8"), json.loads),
+    "json+zstd": (
+        lambda state: zstd_compressor.compress(json.dumps(state).encode("utf-8")),
+        lambda raw: json.loads(zstd_decompressor.decompress(raw)),
+    ),
+    "msgpack": (cad_codec.pack, cad_codec.unpack),
+    "cad_codec": (cad_codec.encode, cad_codec.decode),
+}
+
+
+def per_call_ms(fn, arg, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"Stored CAD state ({args.rounds} rounds per cell)")
+    sizes = ((1, 1, 1), (5, 8, 2), (40, 20, 5), (200, 50, 5))
+    for components, bodies, sketches in sizes:
+        state = design(components, bodies, sketches)
+        print(f"  {components} components x {bodies} bodies, {sketches} sketches")
+        baseline = None
+        for name, (encode, decode) in FORMATS.items():
+            raw = encode(state)
+            assert decode(raw) == state
+            baseline = baseline or len(raw)
+            print(
+                f"    {name:<10} {len(raw):9d} B ({len(raw) / baseline:6.1%})"
+                f"  encode {per_call_ms(encode, state, args.rounds):7.3f} ms"
+                f"  decode {per_call_ms(decode, raw, args.rounds):7.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# forgemind-backend/benchmarks/chat_engine_bench.py
+
+"""Latency of the Assistants and Chat Completions chat engines.
+
+Offline, times ``CompletionsEngine.build_messages`` over synthetic chats of
+growing length, which is the only work the completions engine adds per
+prompt:
+
+    python benchmarks/chat_engine_bench.py
+
+With ``--live`` (needs ``OPENAI_API_KEY``; the assistants engine also needs
+access to ``ASSISTANT_ID``), sends the same prompts through both engines and
+reports time to first token, total time and OpenAI HTTP requests per prompt.
+History for the completions engine comes from an in-memory ``messages``
+table, so no Supabase project is touched:
+
+    python benchmarks/chat_engine_bench.py --live --prompts 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import NamedTuple
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chat_engines import AssistantsEngine, CompletionsEngine  # noqa: E402
+
+ASSISTANT_ID = "asst_SICfkmxReT9Xd76xOmieEqpL"
+
+PROMPTS = [
+    "Create a 5x5x5 cm cube",
+    "Add a 1 cm fillet to every edge of the cube",
+    "Cut a 2 cm diameter hole through the centre of the top face",
+    "Make a cylinder 3 cm in diameter and 6 cm tall next to the cube",
+    "Shell the cylinder with a 2 mm wall, leaving the top open",
+]
+
+CAD_CONTEXT = (
+    "CAD Workspace Contents:\n"
+    + json.dumps({"components": [{"name": "Root", "bodies": [], "sketches": []}]})
+    + "\n\nCAD Status:\nsuccess\n\nUser Instructions:\n"
+)
+
+REPLY = {
+    "steps": ["Create a sketch on the XY plane", "Extrude the profile"],
+    "python_code": "app = adsk.core.Application.get()\n" * 20,
+    "user_facing_response": "Done! The model has been updated.",
+}
+
+
+class Chat(NamedTuple):
+    chat_id: str
+    thread_id: str
+    cache_key: str
+    prompt: str
+
+
+class MessagesTable:
+    """Just enough of the Supabase query builder for ``CompletionsEngine``."""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, chat_id, role, content):
+        self.rows.append(
+            {
+                "id": len(self.rows),
+                "chat_id": chat_id,
+                "role": role,
+                "content": content,
+                "created_at": f"{len(self.rows):012d}",
+            }
+        )
+
+    def table(self, _name):
+        return Query(self.rows)
+
+
+class Query:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def select(self, _columns):
+        return self
+
+    def eq(self, column, value):
+        return Query([row for row in self._rows if row[column] == value])
+
+    def gt(self, column, value):
+        return Query([row for row in self._rows if row[column] > value])
+
+    def order(self, column, desc=False):
+        return Query(sorted(self._rows, key=lambda row: row[column], reverse=desc))
+
+    def limit(self, count):
+        return Query(self._rows[:count])
+
+    def execute(self):
+        return self
+
+    @property
+    def data(self):
+        return self._rows
+
+
+def bench_build_messages(turns_list, budget):
+    engine = CompletionsEngine(None, None, None, False, "gpt-4o", "gpt-4o-mini")
+    engine.history_budget = budget
+    print(f"CompletionsEngine.build_messages (history budget {budget} tokens)")
+    for turns in turns_list:
+        history = []
+        for i in range(turns):
+            history.append({"role": "user", "content": CAD_CONTEXT + PROMPTS[i % 5]})
+            history.append({"role": "assistant", "content": REPLY})
+        rounds = max(1, 2000 // turns)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            messages = engine.build_messages(CAD_CONTEXT + PROMPTS[0], history)
+        elapsed = (time.perf_counter() - started) / rounds * 1e6
+        print(
+            f"  {turns:4d} turns -> {len(messages) - 2:3d} messages kept"
+            f" {elapsed:8.1f} us/prompt"
+        )
+
+
+def openai_client(counter):
+    from openai import OpenAI
+
+    def count(_request):
+        counter["requests"] += 1
+
+    return OpenAI(http_client=httpx.Client(event_hooks={"request": [count]}))
+
+
+def run_engine(engine, counter, table, prompts):
+    chat_id = str(uuid.uuid4())
+    thread_id = engine.start_thread()
+    first_token, total, requests = [], [], []
+    for text in prompts:
+        chat = Chat(chat_id, thread_id, None, CAD_CONTEXT + text)
+        table.add(chat_id, "user", text)
+        counter["requests"] = 0
+        started = time.perf_counter()
+        engine.add_prompt(chat)
+        deltas = []
+        for delta in engine.stream(chat):
+            if not deltas:
+                first_token.append(time.perf_counter() - started)
+            deltas.append(delta)
+        total.append(time.perf_counter() - started)
+        requests.append(counter["requests"])
+        table.add(chat_id, "assistant", json.loads("".join(deltas)))
+        engine.finish(chat)
+    return first_token, total, requests
+
+
+def bench_live(prompt_count):
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(prompt_count)]
+    counter = {"requests": 0}
+    client = openai_client(counter)
+    table = MessagesTable()
+    engines = (
+        AssistantsEngine(client, os.getenv("ASSISTANT_ID", ASSISTANT_ID)),
+        CompletionsEngine(
+            client,
+            table,
+            None,
+            False,
+            model=os.getenv("CHAT_MODEL", "gpt-4o"),
+            summary_model=os.getenv("CHAT_SUMMARY_MODEL", "gpt-4o-mini"),
+        ),
+    )
+    print(f"Live chat ({prompt_count} prompts per engine)")
+    for engine in engines:
+        first_token, total, requests = run_engine(engine, counter, table, prompts)
+        print(
+            f"  {engine.name:<11}"
+            f" first token {statistics.median(first_token) * 1000:7.0f} ms"
+            f"  total {statistics.median(total) * 1000:7.0f} ms"
+            f"  {statistics.mean(requests):4.1f} HTTP requests/prompt"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=6000)
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--prompts", type=int, default=5)
+    args = parser.parse_args()
+
+    bench_build_messages([2, 10, 50, 200], args.budget)
+    if args.live:
+        bench_live(args.prompts)
+
+
+if __name__ == "__main__":
+    main()
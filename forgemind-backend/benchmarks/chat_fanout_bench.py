@@ -0,0 +1,169 @@
+# forgemind-backend/benchmarks/chat_fanout_bench.py
+
+"""/chat latency around the model call, sequential against overlapped I/O.
+
+Runs the real ``_run_chat`` pipeline from ``app.py`` with its Supabase,
+Redis, OpenAI thread and embedding calls replaced by in-memory stand-ins
+that sleep for a configurable round-trip time, so only the request's I/O
+structure is measured: first with ``IoPool(0)`` (every call in order, as
+before) and then with the shared pool. The model's own generation time is
+left out since it is the same either way. Reports p50/p95 per step of the
+timings each prompt hands to ``metrics.record_chat_steps``:
+
+    python benchmarks/chat_fanout_bench.py --supabase-ms 40 --openai-ms 250
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Nothing below may reach a real service
+os.environ.update(
+    {
+        "REACT_APP_SUPABASE_URL": "http://127.0.0.1:9",
+        "REACT_APP_SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.x",
+        "OPENAI_API_KEY": "sk-benchmark",
+        "REDISCLOUD_URL": "redis://127.0.0.1:9/0",
+    }
+)
+
+import app  # noqa: E402
+from fanout import IoPool, StepStats  # noqa: E402
+
+USER_ID = "benchmark-user"
+
+
+class Table:
+    """Supabase table stand-in: every ``execute`` is one round trip."""
+
+    def __init__(self, latency):
+        self._latency = latency
+
+    def __getattr__(self, _name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self._latency)
+        row = {"id": str(uuid.uuid4()), "user_id": USER_ID}
+        return type("Result", (), {"data": [row]})
+
+
+class Supabase:
+    def __init__(self, latency):
+        self._latency = latency
+
+    def table(self, _name):
+        return Table(self._latency)
+
+
+class Redis:
+    def __init__(self, redis, latency):
+        self._redis = redis
+        self._latency = latency
+
+    def __getattr__(self, name):
+        command = getattr(self._redis, name)
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency)
+            return command(*args, **kwargs)
+
+        return call
+
+
+class Engine:
+    name = "assistants"
+
+    def __init__(self, latency):
+        self._latency = latency
+
+    def start_thread(self):
+        time.sleep(self._latency)
+        return f"thread_{uuid.uuid4().hex}"
+
+    def add_prompt(self, chat):
+        time.sleep(self._latency)
+
+    def add_reply(self, chat, reply):
+        time.sleep(self._latency)
+
+    def complete(self, chat):
+        return (
+            '{"steps": ["Fillet the edges"], "python_code": "pass",'
+            ' "user_facing_response": "Done!"}'
+        )
+
+    def finish(self, chat):
+        pass
+
+
+class Examples:
+    def __init__(self, latency):
+        self._latency = latency
+
+    def search(self, *args):
+        time.sleep(self._latency)
+        return []
+
+    def remember(self, *args, **kwargs):
+        pass
+
+
+def run(prompts, follow_up):
+    timings = StepStats()
+    record_chat_steps = app.metrics.record_chat_steps
+
+    def record(steps):
+        timings.record(steps)
+        record_chat_steps(steps)
+
+    app.metrics.record_chat_steps = record
+    try:
+        thread_id = app.chat_engine.start_thread() if follow_up else None
+        for _ in range(prompts):
+            app._run_chat(
+                app.ChatPayload(
+                    text="Round over the top edges of the bracket",
+                    user_id=USER_ID,
+                    thread_id=thread_id,
+                )
+            )
+    finally:
+        app.metrics.record_chat_steps = record_chat_steps
+    return timings.percentiles()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=50)
+    parser.add_argument("--supabase-ms", type=float, default=40)
+    parser.add_argument("--redis-ms", type=float, default=2)
+    parser.add_argument("--openai-ms", type=float, default=250)
+    parser.add_argument("--embedding-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    app.supabase = Supabase(args.supabase_ms / 1000)
+    app.redis_client = Redis(app.redis_client, args.redis_ms / 1000)
+    app.chat_engine = Engine(args.openai_ms / 1000)
+    app.example_index = Examples(args.embedding_ms / 1000)
+
+    for follow_up in (False, True):
+        print(f"{'Follow-up' if follow_up else 'First'} prompt ({args.prompts} runs)")
+        for label, pool in (("sequential", IoPool(0)), ("overlapped", IoPool(32))):
+            app.io_pool = pool
+            timings = run(args.prompts, follow_up)
+            print(f"  {label}")
+            for step, stats in timings.items():
+                print(
+                    f"    {step:<14} p50 {stats['p50']:7.1f} ms"
+                    f"  p95 {stats['p95']:7.1f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
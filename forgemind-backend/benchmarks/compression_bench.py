@@ -0,0 +1,140 @@
+# forgemind-backend/benchmarks/compression_bench.py
+
+"""Bandwidth of add-in uploads and chat responses with and without compression.
+
+Builds a synthetic large-assembly CAD state shaped like the add-in's
+``get_workspace_state`` output, plus a /get_messages-style chat history, and
+reports the encoded size and encode/decode time for identity, gzip (what the
+add-in sends) and zstd (what the backend prefers for responses):
+
+    python benchmarks/compression_bench.py --components 400
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compression import compress_body, decompress_body  # noqa: E402
+
+
+def large_assembly(components, bodies, sketches, profiles, seed=0):
+    rng = random.Random(seed)
+
+    def point():
+        return [round(rng.uniform(-500, 500), 6) for _ in range(3)]
+
+    return {
+        "name": "Gearbox Assembly v42",
+        "components": [
+            {
+                "name": f"Component{c}:1",
+                "bodies": [
+                    {
+                        "name": f"Body{b}",
+                        "volume": rng.uniform(1, 5000),
+                        "surface_area": rng.uniform(1, 2000),
+                        "bounding_box": {"min_point": point(), "max_point": point()},
+                    }
+                    for b in range(bodies)
+                ],
+                "sketches": [
+                    {
+                        "name": f"Sketch{s}",
+                        "profiles": [
+                            {
+                                "area": rng.uniform(0.1, 300),
+                                "perimeter": rng.uniform(1, 100),
+                            }
+                            for _ in range(profiles)
+                        ],
+                    }
+                    for s in range(sketches)
+                ],
+            }
+            for c in range(components)
+        ],
+    }
+
+
+def chat_history(messages, seed=0):
+    rng = random.Random(seed)
+    code = "\n".join(
+        f"sketch{i} = rootComp.sketches.add(rootComp.xYConstructionPlane)"
+        for i in range(20)
+    )
+    return {
+        "status": "success",
+        "messages": [
+            {
+                "id": f"{rng.getrandbits(128):032x}",
+                "chat_id": "5f0c8a52-6d8e-4b0c-9a51-0b7b7c6c1f3e",
+                "role": "assistant" if i % 2 else "user",
+                "content": (
+                    {
+                        "steps": ["Create a sketch", "Extrude it"],
+                        "python_code": code,
+                        "user_facing_response": "I created the part as requested.",
+                    }
+                    if i % 2
+                    else "Make a 20mm cube with a 5mm hole through the centre"
+                ),
+                "created_at": "2025-03-01T12:00:00.000000+00:00",
+            }
+            for i in range(messages)
+        ],
+    }
+
+
+def measure(label, payload, repeat):
+    raw = json.dumps(payload).encode("utf-8")
+    print(f"{label}: {len(raw) / 1024:.1f} KiB uncompressed")
+    for encoding in ("gzip", "zstd"):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            encoded = compress_body(raw, encoding)
+        encode_ms = (time.perf_counter() - started) / repeat * 1000
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            decompress_body(encoded, encoding)
+        decode_ms = (time.perf_counter() - started) / repeat * 1000
+
+        print(
+            f"  {encoding:<5} {len(encoded) / 1024:8.1f} KiB "
+            f"({1 - len(encoded) / len(raw):.1%} smaller), "
+            f"encode {encode_ms:.2f}ms, decode {decode_ms:.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--components", type=int, default=400)
+    parser.add_argument("--bodies", type=int, default=4)
+    parser.add_argument("--sketches", type=int, default=3)
+    parser.add_argument("--profiles", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cad_state = large_assembly(
+        args.components, args.bodies, args.sketches, args.profiles
+    )
+    measure(
+        f"/poll full CAD state ({args.components} components)",
+        {"user_id": "bench", "cad_state": cad_state},
+        args.repeat,
+    )
+    measure(
+        f"/get_messages ({args.messages} messages)",
+        chat_history(args.messages),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
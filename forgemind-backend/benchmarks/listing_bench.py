@@ -0,0 +1,137 @@
+# forgemind-backend/benchmarks/listing_bench.py
+
+"""/get_messages response size and latency: every row against a list page,
+and a page against a revalidated (304) one.
+
+Serves /get_messages from ``app.py`` with Supabase replaced by an in-memory
+stand-in holding ``--messages`` rows (assistant replies carry steps and
+generated code) and answering after ``--supabase-ms``; listing versions are
+kept in a ``LocalStore`` so ETags are issued as they are with Redis. Rows:
+
+- ``all rows``: every column of every message, what the route returned
+  before;
+- ``list page``: the default first page and projection;
+- ``304``: the same request with the ETag the list page came with.
+
+    python benchmarks/listing_bench.py --messages 400 --supabase-ms 40
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Nothing below may reach a real service
+os.environ.update(
+    {
+        "REACT_APP_SUPABASE_URL": "http://127.0.0.1:9",
+        "REACT_APP_SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.x",
+        "OPENAI_API_KEY": "sk-benchmark",
+        "REDISCLOUD_URL": "redis://127.0.0.1:9/0",
+        "AUTH_ENFORCEMENT": "off",
+        "LOG_LEVEL": "ERROR",
+    }
+)
+
+import app  # noqa: E402
+from listing import ListingVersions  # noqa: E402
+from local_store import LocalStore  # noqa: E402
+
+CODE = "\n".join(
+    f"sketch{i} = root.sketches.add(root.xYConstructionPlane)  # step {i}"
+    for i in range(40)
+)
+
+
+def message(i):
+    if i % 2 == 0:
+        content = f"Create a {i}x{i}x{i} cube"
+        role = "user"
+    else:
+        role = "assistant"
+        content = {
+            "steps": [f"Step {n}: sketch and extrude" for n in range(8)],
+            "python_code": CODE,
+            "user_facing_response": f"I created the cube you asked for ({i}).",
+        }
+    return {
+        "id": i,
+        "chat_id": "bench-chat",
+        "role": role,
+        "content": content,
+        "created_at": f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}+00:00",
+    }
+
+
+class Query:
+    """PostgREST query stand-in: honours ``limit``, one round trip per
+    ``execute``."""
+
+    def __init__(self, rows, latency):
+        self._rows = rows
+        self._latency = latency
+        self._limit = None
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def __getattr__(self, _name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self._latency)
+        rows = self._rows[: self._limit] if self._limit else self._rows
+        return type("Result", (), {"data": [dict(row) for row in rows]})
+
+
+class Supabase:
+    def __init__(self, rows, latency):
+        self._rows = rows
+        self._latency = latency
+
+    def table(self, _name):
+        return Query(self._rows, self._latency)
+
+
+def timed(client, url, headers, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        response = client.get(url, headers=headers)
+    return response, (time.perf_counter() - started) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--supabase-ms", type=float, default=40)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = [message(i) for i in range(args.messages)]
+    app.supabase = Supabase(rows, args.supabase_ms / 1000)
+    app.listing_versions = ListingVersions(LocalStore(), use_redis=True, ttl=3600)
+    client = app.app.test_client()
+
+    url = "/get_messages?chat_id=bench-chat"
+    everything = f"{url}&fields={','.join(app.MESSAGE_FIELDS)}&limit={len(rows)}"
+    print(f"/get_messages, {args.messages} messages ({args.rounds} rounds per row)")
+    print(f"  {'':<10} {'status':>6} {'bytes':>10} {'ms':>8}")
+    page, _ = timed(client, url, {}, 1)
+    for label, path, headers in (
+        ("all rows", everything, {}),
+        ("list page", url, {}),
+        ("304", url, {"If-None-Match": page.headers["ETag"]}),
+    ):
+        response, ms = timed(client, path, headers, args.rounds)
+        print(
+            f"  {label:<10} {response.status_code:>6} {len(response.data):>10}"
+            f" {ms:8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# forgemind-backend/benchmarks/load_test.py
+
+"""Closed-loop HTTP load test for comparing the WSGI and ASGI serving modes.
+
+Start the backend in one mode, then run for example:
+
+    # sync workers (default Procfile)
+    gunicorn app:app --worker-class gthread --threads 64 --bind :5000
+    # async mode
+    uvicorn asgi:app --port 5000
+
+    python benchmarks/load_test.py --path /wait_for_operation \
+        --json '{"user_id": "load-test", "timeout": 5}' --concurrency 500
+
+Each of ``--concurrency`` clients sends requests back to back for
+``--duration`` seconds; the report gives requests/sec and latency percentiles.
+Long-poll routes show the difference most clearly: sync workers can only park
+as many requests as they have threads, the rest queue behind them.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+async def _client_loop(client, args, deadline, latencies, errors):
+    body = json.loads(args.json) if args.json else None
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.request(args.method, args.path, json=body)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+
+async def run(args):
+    latencies, errors = [], []
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=args.timeout
+    ) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(
+            *(
+                _client_loop(client, args, deadline, latencies, errors)
+                for _ in range(args.concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.method} {args.url}{args.path}")
+    print(f"  concurrency: {args.concurrency}, duration: {elapsed:.1f}s")
+    print(f"  completed:   {len(latencies)} ({len(latencies) / elapsed:.1f} req/s)")
+    print(f"  errors:      {len(errors)}")
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"  latency:     p50 {quantiles[49] * 1000:.1f}ms, "
+            f"p95 {quantiles[94] * 1000:.1f}ms, max {max(latencies) * 1000:.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--path", default="/chat_status/load-test")
+    parser.add_argument("--method", default=None)
+    parser.add_argument("--json", default=None, help="JSON request body")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    args.method = args.method or ("POST" if args.json else "GET")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# forgemind-backend/benchmarks/local_store_bench.py
+
+"""Read latency of the in-process store against Redis round trips.
+
+Times GET and HGETALL of a presence-sized hash and a CAD-state-sized
+string from a ``LocalStore``, through ``CachedRedis`` once the L1 copy is
+warm, and straight from Redis; then the /poll pipeline (presence refresh
+plus CAD hash check) on a ``LocalStore``. Redis rows are skipped when
+``--redis-url`` can't be reached:
+
+    python benchmarks/local_store_bench.py --redis-url redis://localhost:6379/0
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import redis
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from local_store import CachedRedis, LocalStore  # noqa: E402
+from presence import PluginPresence  # noqa: E402
+
+PRESENCE = {"login": "true", "logged_out": "false", "last_seen": "1760000000"}
+
+
+def seed(store, state_kb):
+    store.hset("bench:presence", mapping=PRESENCE)
+    store.set("bench:cad_state", "x" * (state_kb * 1024))
+
+
+def per_call_us(fn, count):
+    fn()
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def report(label, store, count):
+    get = per_call_us(lambda: store.get("bench:cad_state"), count)
+    hgetall = per_call_us(lambda: store.hgetall("bench:presence"), count)
+    print(f"  {label:<22} {get:9.1f} us GET  {hgetall:9.1f} us HGETALL")
+
+
+def bench_poll_pipeline(store, count):
+    presence = PluginPresence(store)
+
+    def poll():
+        pipe = store.pipeline(transaction=False)
+        presence.queue_poll(pipe, "bench-user")
+        pipe.get("cad_state_hash:bench-user")
+        pipe.execute()
+
+    print(f"  /poll pipeline on LocalStore {per_call_us(poll, count):9.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--state-kb", type=int, default=20)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    args = parser.parse_args()
+
+    print(f"Reads ({args.reads} per row, {args.state_kb} KB CAD state)")
+    local = LocalStore()
+    seed(local, args.state_kb)
+    report("LocalStore", local, args.reads)
+
+    server = redis.Redis.from_url(args.redis_url, socket_connect_timeout=1)
+    try:
+        server.ping()
+    except redis.RedisError as e:
+        print(f"  Redis unreachable at {args.redis_url} ({e}); skipping Redis rows")
+    else:
+        seed(server, args.state_kb)
+        cached = CachedRedis(server, LocalStore(), ttl=60)
+        report("CachedRedis (L1 hit)", cached, args.reads)
+        report("Redis", server, min(args.reads, 2000))
+        server.delete("bench:presence", "bench:cad_state")
+
+    bench_poll_pipeline(local, args.reads)
+
+
+if __name__ == "__main__":
+    main()
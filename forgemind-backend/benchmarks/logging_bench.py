@@ -0,0 +1,112 @@
+# forgemind-backend/benchmarks/logging_bench.py
+
+"""/poll throughput with each way of logging a poll.
+
+Serves the real /poll view from ``app.py`` through the Flask test client,
+with the operation store replaced by an in-memory stand-in, while logs go
+to a temporary file:
+
+- ``print(data)``: the payload printed on every poll, as before;
+- ``sync, unsampled``: structured records written by the request thread;
+- ``queued, sampled``: ``logs.configure`` at DEBUG with ``POLL_LOG_SAMPLE``;
+- ``queued, INFO``: the default configuration, where poll records are off.
+
+    python benchmarks/logging_bench.py --polls 5000 --state-kb 20
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Nothing below may reach a real service
+os.environ.update(
+    {
+        "REACT_APP_SUPABASE_URL": "http://127.0.0.1:9",
+        "REACT_APP_SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.x",
+        "OPENAI_API_KEY": "sk-benchmark",
+        "REDISCLOUD_URL": "redis://127.0.0.1:9/0",
+        "AUTH_ENFORCEMENT": "off",
+    }
+)
+
+import app  # noqa: E402
+import logs  # noqa: E402
+
+
+class OperationStore:
+    def has_pending(self, user_id):
+        return False
+
+
+def make_payload(state_kb):
+    body = {"name": "body", "volume": 1000.0, "surface_area": 600.0}
+    bodies = [dict(body, name=f"Body{i}") for i in range(state_kb * 10)]
+    return {
+        "user_id": "benchmark-user",
+        "cad_state": {"name": "Design", "components": [{"bodies": bodies}]},
+    }
+
+
+def configure(mode, sink):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    app.POLL_LOG_SAMPLE = 100
+    hooks = app.app.before_request_funcs.setdefault(None, [])
+    hooks[:] = [hook for hook in hooks if hook.__name__ != "print_payload"]
+
+    if mode == "print(data)":
+        root.setLevel(logging.INFO)
+
+        def print_payload():
+            print(app.request.get_json(), file=sink, flush=True)
+
+        hooks.append(print_payload)
+    elif mode == "sync, unsampled":
+        app.POLL_LOG_SAMPLE = 1
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logs.JsonFormatter())
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+    else:
+        level = "DEBUG" if mode == "queued, sampled" else "INFO"
+        logs.configure(level=level, stream=sink)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--polls", type=int, default=5000)
+    parser.add_argument("--state-kb", type=int, default=20)
+    args = parser.parse_args()
+
+    app.operation_store = OperationStore()
+    client = app.app.test_client()
+    payload = make_payload(args.state_kb)
+
+    print(f"/poll throughput ({args.polls} polls, ~{args.state_kb} KB CAD state)")
+    for mode in ("print(data)", "sync, unsampled", "queued, sampled", "queued, INFO"):
+        with tempfile.TemporaryFile("w") as sink:
+            configure(mode, sink)
+            client.post("/poll", json=payload)
+
+            started = time.perf_counter()
+            for _ in range(args.polls):
+                client.post("/poll", json=payload)
+            elapsed = time.perf_counter() - started
+
+            logs.configure(level="WARNING", stream=sink)  # Drains the queue
+            written = sink.tell() / 1024
+        print(
+            f"  {mode:<16} {args.polls / elapsed:8.0f} polls/s"
+            f"  {elapsed / args.polls * 1e6:8.1f} us/poll  {written:8.0f} KB written"
+        )
+
+
+if __name__ == "__main__":
+    main()
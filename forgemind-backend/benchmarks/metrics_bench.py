@@ -0,0 +1,81 @@
+# forgemind-backend/benchmarks/metrics_bench.py
+
+"""Per-request cost of the Prometheus instrumentation.
+
+Times one labelled histogram observation (what every Redis command and
+HTTP call adds), then a bare Flask app serving a /poll-sized JSON body with
+and without ``metrics.init_app``, and finally a /metrics scrape:
+
+    python benchmarks/metrics_bench.py --requests 5000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from flask import Flask, jsonify
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import metrics  # noqa: E402
+
+TOKEN = "benchmark"
+SCRAPE = {"Authorization": f"Bearer {TOKEN}"}
+
+
+def bench_observe(count):
+    started = time.perf_counter()
+    for _ in range(count):
+        metrics.EXTERNAL_LATENCY.labels("redis", "get").observe(0.001)
+    elapsed = (time.perf_counter() - started) / count * 1e6
+    print(f"Histogram observation ({count} calls)  {elapsed:8.2f} us/call")
+
+
+def make_app(instrumented):
+    app = Flask(__name__)
+    if instrumented:
+        metrics.init_app(app, token=TOKEN)
+
+    @app.route("/poll", methods=["POST"])
+    def poll():
+        return jsonify({"status": False, "message": "No pending operation"})
+
+    return app
+
+
+def bench_requests(count):
+    body = {"user_id": "benchmark", "cad_state_hash": "0" * 64, "timeout": 25}
+    print(f"Flask /poll round trip ({count} requests, test client)")
+    baseline = None
+    for label, instrumented in (("no metrics", False), ("metrics", True)):
+        client = make_app(instrumented).test_client()
+        client.post("/poll", json=body)
+
+        started = time.perf_counter()
+        for _ in range(count):
+            client.post("/poll", json=body)
+        elapsed = (time.perf_counter() - started) / count * 1e6
+
+        overhead = "" if baseline is None else f" (+{elapsed - baseline:.1f} us)"
+        baseline = elapsed if baseline is None else baseline
+        print(f"  {label:<12} {elapsed:8.1f} us/request{overhead}")
+
+    started = time.perf_counter()
+    size = len(client.get("/metrics", headers=SCRAPE).data)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"/metrics scrape  {elapsed:.1f} ms, {size} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--observations", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    bench_observe(args.observations)
+    bench_requests(args.requests)
+
+
+if __name__ == "__main__":
+    main()
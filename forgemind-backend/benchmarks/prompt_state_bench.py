@@ -0,0 +1,88 @@
+# forgemind-backend/benchmarks/prompt_state_bench.py
+
+"""Prompt size of the CAD state, raw JSON against ``compile_cad_state``.
+
+Builds synthetic designs shaped like the add-in's ``get_workspace_state()``
+description (components of repeated fastener bodies plus sketches) and
+reports estimated tokens and compile time per design size:
+
+    python benchmarks/prompt_state_bench.py --budget 1500
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chat_engines import estimate_tokens  # noqa: E402
+from prompt_state import compile_cad_state  # noqa: E402
+
+
+def body(name, x, size):
+    y = random.random() * 10
+    return {
+        "name": name,
+        "volume": size[0] * size[1] * size[2] * (1 + random.random() * 1e-9),
+        "surface_area": 2 * (size[0] * size[1] + size[1] * size[2] + size[0] * size[2]),
+        "bounding_box": {
+            "min_point": [x, y, 0.0],
+            "max_point": [x + size[0], y + size[1], size[2]],
+        },
+    }
+
+
+def design(components, bodies, sketches):
+    return {
+        "name": "Benchmark",
+        "components": [
+            {
+                "name": "Root" if c == 0 else f"Bracket{c}",
+                "bodies": [
+                    body(f"Bolt{b + 1}", b * 2.0, (0.5, 0.5, 3.0))
+                    for b in range(bodies)
+                ]
+                + [body("Plate", 0.0, (10.0, 5.0, 0.4))],
+                "sketches": [
+                    {
+                        "name": f"Sketch{s + 1}",
+                        "profiles": [
+                            {"area": random.random() * 10, "perimeter": 12.0}
+                            for _ in range(4)
+                        ],
+                    }
+                    for s in range(sketches)
+                ],
+            }
+            for c in range(components)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"CAD state in the prompt (budget {args.budget} tokens)")
+    sizes = ((1, 1, 1), (5, 8, 2), (40, 20, 5), (200, 50, 5))
+    for components, bodies, sketches in sizes:
+        raw = json.dumps(design(components, bodies, sketches))
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            _, tokens = compile_cad_state(raw, "widen the plate", args.budget)
+        elapsed = (time.perf_counter() - started) / args.rounds * 1000
+        print(
+            f"  {components:4d} components x {bodies + 1:3d} bodies"
+            f"  raw {estimate_tokens(raw):8d} tokens"
+            f"  compiled {tokens:6d} tokens  {elapsed:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# forgemind-backend/benchmarks/startup_bench.py
+
+"""Worker cold start: time from ``import app`` to the first responses.
+
+Each run is a fresh Python process that imports ``app`` and then serves
+GET /ready and a first POST /poll through the Flask test client. Supabase is
+a local HTTP server answering every request after ``--supabase-ms`` (the
+bucket check, the operation lookup), and Redis is left unconfigured so the
+process runs without it. Two startups are compared:
+
+- ``eager``: what every worker did at import before: build the Supabase
+  and OpenAI clients and check the storage bucket;
+- ``lazy``: the current import, where clients are built on first use and
+  the bucket is left to ``flask provision-storage``.
+
+    python benchmarks/startup_bench.py --runs 5 --supabase-ms 150
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Runs in the child process; prints the timings as JSON
+WORKER = """
+import json, sys, time
+started = time.perf_counter()
+import app
+if sys.argv[1] == "eager":
+    app.supabase.resolve()
+    app.client.resolve()
+    app.provision_storage()
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get("/ready")
+ready = time.perf_counter()
+client.post("/poll", json={"user_id": "benchmark-user"})
+polled = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "ready": ready - started,
+    "poll": polled - started,
+}))
+"""
+
+
+def serve_supabase(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def _answer(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency)
+            body = b"[]" if self.command == "GET" else b"{}"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PATCH = do_HEAD = _answer
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_worker(mode, supabase_url):
+    env = {
+        key: value for key, value in os.environ.items() if key != "REDISCLOUD_URL"
+    }
+    # Nothing below may reach a real service
+    env.update(
+        {
+            "REACT_APP_SUPABASE_URL": supabase_url,
+            "REACT_APP_SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.x",
+            "OPENAI_API_KEY": "sk-benchmark",
+            "AUTH_ENFORCEMENT": "off",
+            "LOG_LEVEL": "ERROR",
+        }
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER, mode],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--supabase-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    server = serve_supabase(args.supabase_ms / 1000)
+    supabase_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"Cold start, median of {args.runs} runs (ms since the import began)")
+    print(f"  {'':<8} {'import':>8} {'/ready':>8} {'/poll':>8}")
+    for mode in ("eager", "lazy"):
+        runs = [start_worker(mode, supabase_url) for _ in range(args.runs)]
+        medians = {
+            step: statistics.median(run[step] for run in runs) * 1000
+            for step in ("import", "ready", "poll")
+        }
+        print(
+            f"  {mode:<8} {medians['import']:8.0f} {medians['ready']:8.0f}"
+            f" {medians['poll']:8.0f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
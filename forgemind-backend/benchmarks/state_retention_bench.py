@@ -0,0 +1,95 @@
+# forgemind-backend/benchmarks/state_retention_bench.py
+
+"""Cost of the per-user state budget and of the TTL refresh on each poll.
+
+Stores generated designs of growing size through ``CadStateStore`` with and
+without a ``--max-kb`` budget, printing the stored bytes and the time per
+store (truncating states over budget re-encodes them a few times); then
+times the /poll pipeline on a ``LocalStore`` with and without the
+``StateRetention`` refresh:
+
+    python benchmarks/state_retention_bench.py --max-kb 64
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from cad_state import CadStateStore  # noqa: E402
+from local_store import LocalStore  # noqa: E402
+from presence import PluginPresence  # noqa: E402
+from prompt_state_bench import design  # noqa: E402
+from retention import StateRetention  # noqa: E402
+
+TTL = 7 * 24 * 3600
+
+
+def per_call_ms(fn, count):
+    fn()
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) / count * 1000
+
+
+def bench_budget(max_bytes, count):
+    print(f"Stored CAD state ({max_bytes // 1024} KB budget)")
+    print(f"  {'components':>10} {'unbounded':>14} {'budgeted':>24}")
+    for components in (10, 40, 160, 640):
+        state = design(components, 6, 4)
+        row = []
+        for budget in (None, max_bytes):
+            store = LocalStore()
+            states = CadStateStore(store, ttl=TTL, max_bytes=budget)
+            ms = per_call_ms(lambda: states.store("bench-user", state), count)
+            size = len(store.get("cad_state:bench-user"))
+            row.append(f"{size / 1024:7.1f} KB {ms:6.1f} ms")
+        print(f"  {components:>10} {row[0]:>14} {row[1]:>24}")
+
+
+def bench_poll(count):
+    store = LocalStore()
+    presence = PluginPresence(store)
+    retention = StateRetention(
+        store,
+        {
+            prefix: TTL
+            for prefix in ("cad_state:", "cad_state_hash:", "ops:", "ops_hydrated:")
+        },
+    )
+
+    def poll(refresh):
+        pipe = store.pipeline(transaction=False)
+        presence.queue_poll(pipe, "bench-user")
+        pipe.get("cad_state_hash:bench-user")
+        if refresh:
+            retention.queue_refresh(pipe, "bench-user")
+        pipe.execute()
+
+    print("/poll pipeline on LocalStore")
+    for refresh in (False, True):
+        label = "with TTL refresh" if refresh else "without"
+        us = per_call_ms(lambda: poll(refresh), count) * 1000
+        print(f"  {label:<18} {us:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-kb", type=int, default=64)
+    parser.add_argument("--stores", type=int, default=5)
+    parser.add_argument("--polls", type=int, default=20000)
+    args = parser.parse_args()
+    # Every budgeted store of the largest design logs a truncation warning
+    logging.getLogger("cad_state").setLevel(logging.ERROR)
+
+    bench_budget(args.max_kb * 1024, args.stores)
+    bench_poll(args.polls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# forgemind-backend/cad_codec.py
+
+"""Compact binary encoding of CAD states, in Redis and on the wire.
+
+Stored states are msgpack, zstd-compressed, behind the ``FMC1`` header;
+values written before the header existed (JSON text) still decode. The
+encoding is lossless: a state read back hashes to the same ``state_hash``
+the add-in computed, which delta uploads depend on. So floats keep their
+64 bits and repeated names are left for zstd to fold, rather than being
+packed as float32 or interned.
+
+The add-in may upload bodies as ``application/msgpack`` (optionally with
+``Content-Encoding: zstd``) instead of JSON, and ask for msgpack responses
+with ``Accept: application/msgpack``; ``init_app`` makes both transparent
+to the views.
+"""
+
+import json
+import threading
+
+import msgpack
+import zstandard
+from flask import Request, request
+from werkzeug.exceptions import BadRequest
+
+MAGIC = b"FMC1"
+MSGPACK_MIMETYPE = "application/msgpack"
+ZSTD_LEVEL = 3
+
+# zstd contexts aren't safe to share between threads, but are worth reusing
+_contexts = threading.local()
+
+
+def _compressor():
+    if not hasattr(_contexts, "compressor"):
+        _contexts.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        _contexts.decompressor = zstandard.ZstdDecompressor()
+    return _contexts.compressor, _contexts.decompressor
+
+
+def pack(value) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def unpack(data: bytes):
+    """Parse a msgpack document; raises ValueError if it isn't one."""
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def encode(state) -> bytes:
+    """Encode a CAD state (any JSON-compatible value) for storage."""
+    compressor, _ = _compressor()
+    return MAGIC + compressor.compress(pack(state))
+
+
+def decode(raw):
+    """Decode a stored CAD state; None stays None. Legacy JSON values are
+    parsed, and text that isn't JSON is returned as a string."""
+    if raw is None:
+        return None
+    if isinstance(raw, bytes) and raw.startswith(MAGIC):
+        _, decompressor = _compressor()
+        return unpack(decompressor.decompress(raw[len(MAGIC) :]))
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw.decode("utf-8", "replace") if isinstance(raw, bytes) else raw
+
+
+def wants_msgpack(accept: str) -> bool:
+    """True if an ``Accept`` header prefers msgpack to JSON."""
+    quality = {}
+    for part in (accept or "").split(","):
+        media_type, _, params = part.strip().partition(";")
+        try:
+            q = float(params.strip()[2:]) if params.strip().startswith("q=") else 1.0
+        except ValueError:
+            q = 0.0
+        quality[media_type.strip().lower()] = q
+    return quality.get(MSGPACK_MIMETYPE, 0) > quality.get("application/json", 0)
+
+
+class MsgpackRequest(Request):
+    """Flask request whose ``get_json`` also parses msgpack bodies."""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if self.mimetype != MSGPACK_MIMETYPE:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        try:
+            return unpack(self.get_data(cache=cache))
+        except ValueError as e:
+            if silent:
+                return None
+            raise BadRequest(f"Invalid msgpack body: {e or type(e).__name__}")
+
+
+def negotiate_response(response):
+    """Flask ``after_request`` hook re-encoding JSON responses as msgpack for
+    clients that ask for it."""
+    response.vary.add("Accept")
+    if (
+        response.mimetype != "application/json"
+        or response.is_streamed
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or not wants_msgpack(request.headers.get("Accept"))
+    ):
+        return response
+    response.set_data(pack(json.loads(response.get_data())))
+    response.mimetype = MSGPACK_MIMETYPE
+    return response
+
+
+def init_app(app):
+    """Accept msgpack request bodies and negotiate msgpack responses. Call
+    after ``compression.init_app`` so responses are re-encoded before they
+    are compressed."""
+    app.request_class = MsgpackRequest
+    app.after_request(negotiate_response)
@@ -0,0 +1,198 @@
+# forgemind-backend/cad_state.py
+
+import hashlib
+import json
+import logging
+
+import cad_codec
+from retention import encode_within
+
+logger = logging.getLogger(__name__)
+
+
+class PatchError(ValueError):
+    """Raised when a JSON patch cannot be applied to the stored CAD state."""
+
+
+def state_hash(state) -> str:
+    """Content hash of a CAD state; must match the add-in's ``state_hash``."""
+    canonical = json.dumps(state, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def apply_patch(doc, patch):
+    """Apply an RFC 6902 patch (add/remove/replace/test) and return the result.
+
+    ``doc`` may be modified in place; the returned value must be used since
+    a patch on the root path replaces the document entirely.
+    """
+    for op in patch:
+        try:
+            kind, path = op["op"], op["path"]
+        except (KeyError, TypeError):
+            raise PatchError(f"Malformed patch operation: {op!r}")
+
+        if path == "":
+            if kind in ("add", "replace"):
+                doc = op["value"]
+                continue
+            raise PatchError(f"Unsupported root operation: {kind}")
+        if not isinstance(path, str) or not path.startswith("/"):
+            raise PatchError(f"Invalid path: {path!r}")
+
+        tokens = [
+            token.replace("~1", "/").replace("~0", "~")
+            for token in path[1:].split("/")
+        ]
+        parent = doc
+        try:
+            for token in tokens[:-1]:
+                parent = parent[int(token) if isinstance(parent, list) else token]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise PatchError(f"Path not found: {path}")
+
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else _list_index(last, path)
+            if kind == "add":
+                if index > len(parent):
+                    raise PatchError(f"Index out of range: {path}")
+                parent.insert(index, op["value"])
+                continue
+            if index >= len(parent):
+                raise PatchError(f"Index out of range: {path}")
+            last = index
+        elif not isinstance(parent, dict):
+            raise PatchError(f"Path not found: {path}")
+        elif kind != "add" and last not in parent:
+            raise PatchError(f"Path not found: {path}")
+
+        if kind in ("add", "replace"):
+            parent[last] = op["value"]
+        elif kind == "remove":
+            del parent[last]
+        elif kind == "test":
+            if parent[last] != op["value"]:
+                raise PatchError(f"Test failed: {path}")
+        else:
+            raise PatchError(f"Unsupported operation: {kind}")
+    return doc
+
+
+def _list_index(token, path):
+    if not token.isdigit():
+        raise PatchError(f"Invalid array index: {path}")
+    return int(token)
+
+
+class CadStateStore:
+    """Keeps each user's latest CAD state in Redis from delta uploads.
+
+    Polls carry one of:
+
+    - ``cad_state`` (optionally with ``cad_state_hash``): a full upload;
+    - ``cad_state_hash`` alone: the add-in's state is unchanged;
+    - ``cad_state_patch`` with ``cad_state_base_hash`` and ``cad_state_hash``:
+      an RFC 6902 patch against the state the add-in last uploaded.
+
+    The stored state lives at ``cad_state:{user_id}``, encoded with
+    ``cad_codec``, and its hash at ``cad_state_hash:{user_id}``. When the hashes
+    don't line up the backend can't reconstruct the state, and the poll
+    response asks the add-in to resync with a full upload.
+
+    Both keys expire ``ttl`` seconds after the last write (polls refresh the
+    TTL, see ``StateRetention``). A state that encodes to more than
+    ``max_bytes`` is stored truncated, under the hash of the full state: the
+    add-in stays in sync while it is unchanged, and each change it makes is
+    resynced with a full upload since patches can't apply to the truncated
+    copy.
+    """
+
+    STATE_PREFIX = "cad_state:"
+    HASH_PREFIX = "cad_state_hash:"
+
+    def __init__(self, redis_client, ttl: int = None, max_bytes: int = None):
+        self._redis = redis_client
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+
+    def queue_upload(self, pipe, user_id: str, data: dict):
+        """Queue the reads/writes for a poll's CAD state on ``pipe``.
+
+        Queues exactly one command; pass its result to ``finish_upload``. A
+        full upload is an MSET, which clears the keys' TTL: queue
+        ``StateRetention.queue_refresh`` after it on the same pipeline.
+        """
+        if data.get("cad_state"):
+            pipe.mset(
+                self._full_state(
+                    user_id, data["cad_state"], data.get("cad_state_hash")
+                )
+            )
+        elif data.get("cad_state_patch") is not None:
+            pipe.mget(f"{self.STATE_PREFIX}{user_id}", f"{self.HASH_PREFIX}{user_id}")
+        elif data.get("cad_state_hash"):
+            pipe.get(f"{self.HASH_PREFIX}{user_id}")
+        else:
+            pipe.exists(f"{self.HASH_PREFIX}{user_id}")  # Keeps one result per poll
+
+    def finish_upload(self, user_id: str, data: dict, result) -> bool:
+        """Complete a queued upload; returns False if the add-in must resync."""
+        if data.get("cad_state") or not data.get("cad_state_hash"):
+            return True
+
+        if data.get("cad_state_patch") is None:
+            return _decode(result) == data["cad_state_hash"]
+
+        stored_state, stored_hash = result[0], _decode(result[1])
+        if not stored_state or stored_hash != data.get("cad_state_base_hash"):
+            return False
+        try:
+            state = apply_patch(
+                cad_codec.decode(stored_state), data["cad_state_patch"]
+            )
+        except PatchError as e:
+            logger.warning(
+                "Could not apply CAD state patch for user %s: %s", user_id, e
+            )
+            return False
+        if state_hash(state) != data["cad_state_hash"]:
+            return False
+
+        self.store(user_id, state, data["cad_state_hash"])
+        return True
+
+    def store(self, user_id: str, state, digest: str = None):
+        """Replace the stored state with a full upload."""
+        pipe = self._redis.pipeline(transaction=False)
+        for key, value in self._full_state(user_id, state, digest).items():
+            pipe.set(key, value, ex=self._ttl)
+        pipe.execute()
+
+    def _full_state(self, user_id, state, digest):
+        if isinstance(state, (str, bytes)):
+            # Older add-ins (and /instruction_result) send the state as JSON text
+            try:
+                state = json.loads(state)
+            except ValueError:
+                pass
+        encoded, truncated = encode_within(state, self._max_bytes, cad_codec.encode)
+        if truncated:
+            logger.warning(
+                "CAD state of user %s exceeds %d bytes encoded; storing it truncated",
+                user_id,
+                self._max_bytes,
+            )
+        return {
+            f"{self.STATE_PREFIX}{user_id}": encoded,
+            f"{self.HASH_PREFIX}{user_id}": digest or state_hash(state),
+        }
+
+    def clear(self, user_id: str):
+        self._redis.delete(
+            f"{self.STATE_PREFIX}{user_id}", f"{self.HASH_PREFIX}{user_id}"
+        )
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
@@ -0,0 +1,307 @@
+# forgemind-backend/chat_engines.py
+
+"""Ways of getting the assistant's reply for a /chat prompt.
+
+``AssistantsEngine`` keeps the conversation in an OpenAI Assistants thread:
+the prompt is posted to the thread and a run is polled (or streamed) until
+the reply is ready. ``CompletionsEngine`` is stateless: it rebuilds the
+conversation from the ``messages`` table, keeps the newest turns that fit a
+token budget, stands in a rolling summary for older ones, and makes a single
+streaming Chat Completions call. ``CHAT_ENGINE`` picks one per deployment.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Threads of CompletionsEngine chats are local; their IDs never reach OpenAI
+LOCAL_THREAD_PREFIX = "local_"
+
+# Run states after which runs.retrieve will never report "completed"
+TERMINAL_RUN_STATUSES = {"failed", "cancelled", "expired", "incomplete"}
+
+DEFAULT_SYSTEM_PROMPT = """\
+You are a friendly AI assistant, ForgeMind, who turns descriptions of CAD \
+operations for Autodesk Fusion into Python scripts which perform the described \
+operation. Each user message shows the current CAD workspace contents, the \
+status of the last script that ran, and the instructions.
+
+The script is executed inside Fusion with `adsk.core`, `adsk.fusion` and \
+`adsk.cam` already imported. Lengths are in centimetres.
+
+Reply with a single JSON object with these keys:
+- "steps": a list of short strings describing what the script does;
+- "python_code": the script, as a string;
+- "user_facing_response": a short, friendly message for the user.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English and
+    code), plus the per-message framing overhead."""
+    return len(text) // 4 + 4
+
+
+def message_text(row) -> str:
+    """Text of a ``messages`` row; assistant replies are stored as JSON objects."""
+    content = row["content"]
+    return content if isinstance(content, str) else json.dumps(content)
+
+
+class AssistantsEngine:
+    """Replies through an OpenAI Assistants thread per chat."""
+
+    name = "assistants"
+
+    def __init__(self, client, assistant_id: str):
+        self._client = client
+        self.assistant_id = assistant_id
+
+    def start_thread(self) -> str:
+        return self._client.beta.threads.create().id
+
+    def add_prompt(self, chat):
+        self._client.beta.threads.messages.create(
+            thread_id=chat.thread_id, role="user", content=chat.prompt
+        )
+
+    def add_reply(self, chat, reply: dict):
+        """Record a reply that didn't come from a run, so follow-ups see it."""
+        self._client.beta.threads.messages.create(
+            thread_id=chat.thread_id, role="assistant", content=json.dumps(reply)
+        )
+
+    def complete(self, chat) -> str:
+        """Run the assistant on the thread and return its raw reply."""
+        run = self._client.beta.threads.runs.create(
+            thread_id=chat.thread_id, assistant_id=self.assistant_id
+        )
+        while run.status != "completed":
+            if run.status in TERMINAL_RUN_STATUSES:
+                raise RuntimeError(
+                    f"Assistant run {run.id} ended with status {run.status}"
+                )
+            time.sleep(1)
+            run = self._client.beta.threads.runs.retrieve(
+                thread_id=chat.thread_id, run_id=run.id
+            )
+
+        # Newest first: the first assistant message is this run's reply
+        messages = self._client.beta.threads.messages.list(
+            thread_id=chat.thread_id, order="desc", limit=1, run_id=run.id
+        )
+        for message in messages.data:
+            if message.role == "assistant":
+                return "".join(
+                    part.text.value for part in message.content if part.type == "text"
+                )
+        raise RuntimeError("No response from assistant")
+
+    def stream(self, chat):
+        """Yield the reply's text as the run generates it."""
+        with self._client.beta.threads.runs.stream(
+            thread_id=chat.thread_id, assistant_id=self.assistant_id
+        ) as stream:
+            yield from stream.text_deltas
+
+    def finish(self, chat):
+        pass
+
+
+class CompletionsEngine:
+    """Replies with one streaming Chat Completions call per prompt.
+
+    The request holds the system prompt, a summary of turns that no longer
+    fit ``history_budget`` tokens, the newest turns that do, and the prompt.
+    Summaries are kept in Redis as ``chat_summary:{chat_id}`` and extended
+    on a background thread after a reply, so building a request never waits
+    on a second model call. Without Redis, older turns are simply dropped.
+    """
+
+    name = "completions"
+    SUMMARY_PREFIX = "chat_summary:"
+
+    def __init__(
+        self,
+        client,
+        supabase,
+        redis_client,
+        use_redis: bool,
+        model: str,
+        summary_model: str,
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+        history_budget: int = 6000,
+        history_limit: int = 100,
+        summary_ttl: int = 30 * 24 * 3600,
+    ):
+        self._client = client
+        self._supabase = supabase
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self.model = model
+        self.summary_model = summary_model
+        self.system_prompt = system_prompt
+        self.history_budget = history_budget
+        self._history_limit = history_limit
+        self._summary_ttl = summary_ttl
+        self._summarizer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="chat-summary"
+        )
+        self._summarizing = set()
+        self._lock = threading.Lock()
+
+    def start_thread(self) -> str:
+        return f"{LOCAL_THREAD_PREFIX}{uuid.uuid4().hex}"
+
+    def add_prompt(self, chat):
+        pass  # The prompt is sent with the completion request
+
+    def add_reply(self, chat, reply: dict):
+        pass  # complete_chat stores every reply in the messages table
+
+    def request(self, chat) -> dict:
+        """Keyword arguments for ``chat.completions.create``, minus ``stream``."""
+        return {
+            "model": self.model,
+            "messages": self.build_messages(chat.prompt, *self._history(chat)),
+            "response_format": {"type": "json_object"},
+        }
+
+    def build_messages(self, prompt: str, history, summary=None):
+        """Assemble the request from oldest-first ``history`` rows.
+
+        Keeps the newest turns within ``history_budget`` tokens; ``summary``
+        stands in for everything older.
+        """
+        window, used = [], 0
+        for row in reversed(history):
+            text = message_text(row)
+            used += estimate_tokens(text)
+            if used > self.history_budget:
+                break
+            window.append({"role": row["role"], "content": text})
+        window.reverse()
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if summary:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{summary}",
+                }
+            )
+        return messages + window + [{"role": "user", "content": prompt}]
+
+    def complete(self, chat) -> str:
+        return "".join(self.stream(chat))
+
+    def stream(self, chat):
+        stream = self._client.chat.completions.create(stream=True, **self.request(chat))
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def finish(self, chat):
+        """Fold turns that fell out of the window into the chat's summary."""
+        if not self._use_redis:
+            return
+        with self._lock:
+            if chat.chat_id in self._summarizing:
+                return
+            self._summarizing.add(chat.chat_id)
+        self._summarizer.submit(self._summarize, chat.chat_id)
+
+    def _history(self, chat):
+        """Return ``(rows, summary)``: the turns before this prompt not yet
+        summarized, oldest first, and the summary of those before them."""
+        record = self._summary(chat.chat_id)
+        query = (
+            self._supabase.table("messages")
+            .select("id, role, content, created_at")
+            .eq("chat_id", chat.chat_id)
+            .order("created_at", desc=True)
+            .limit(self._history_limit)
+        )
+        if record:
+            query = query.gt("created_at", record["through"])
+        rows = list(reversed(query.execute().data))
+
+        # prepare_chat has already stored this prompt's text as the newest row
+        if rows and rows[-1]["role"] == "user":
+            rows.pop()
+        return rows, record["summary"] if record else None
+
+    def _summary(self, chat_id):
+        if not self._use_redis:
+            return None
+        try:
+            raw = self._redis.get(f"{self.SUMMARY_PREFIX}{chat_id}")
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning("Error reading chat summary for %s: %s", chat_id, e)
+            return None
+
+    def _summarize(self, chat_id):
+        try:
+            record = self._summary(chat_id)
+            query = (
+                self._supabase.table("messages")
+                .select("id, role, content, created_at")
+                .eq("chat_id", chat_id)
+                .order("created_at", desc=True)
+                .limit(self._history_limit)
+            )
+            if record:
+                query = query.gt("created_at", record["through"])
+            rows = list(reversed(query.execute().data))
+
+            # Leave the turns the next request's window will still hold
+            kept = 0
+            while rows and kept + estimate_tokens(message_text(rows[-1])) <= (
+                self.history_budget
+            ):
+                kept += estimate_tokens(message_text(rows.pop()))
+            if not rows:
+                return
+
+            transcript = "\n".join(
+                f"{row['role']}: {message_text(row)}" for row in rows
+            )
+            previous = record["summary"] if record else "(none)"
+            response = self._client.chat.completions.create(
+                model=self.summary_model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Summarize this CAD modelling conversation for "
+                        "the assistant that continues it. Keep the objects created, "
+                        "their names and dimensions, and what the user still wants. "
+                        "Be brief.",
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Summary so far:\n{previous}\n\n"
+                        f"Later turns:\n{transcript}",
+                    },
+                ],
+            )
+            self._redis.set(
+                f"{self.SUMMARY_PREFIX}{chat_id}",
+                json.dumps(
+                    {
+                        "summary": response.choices[0].message.content,
+                        "through": rows[-1]["created_at"],
+                    }
+                ),
+                ex=self._summary_ttl,
+            )
+        except Exception as e:
+            logger.warning("Error summarizing chat %s: %s", chat_id, e)
+        finally:
+            with self._lock:
+                self._summarizing.discard(chat_id)
@@ -0,0 +1,93 @@
+# forgemind-backend/chat_jobs.py
+
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatJobRunner:
+    """Runs /chat pipelines on a bounded worker pool and tracks their results.
+
+    Job records live in Redis under ``chat_job:{job_id}`` so any gunicorn
+    worker can answer /chat_status. Without Redis they are kept in-process,
+    which only works when a single worker serves both requests. Records
+    carry the ``user_id`` that submitted the job, so only that user is shown
+    its result.
+    """
+
+    KEY_PREFIX = "chat_job:"
+
+    def __init__(self, redis_client, use_redis: bool, max_workers: int, ttl: int):
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self._ttl = ttl
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="chat-job"
+        )
+        self._local_jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, fn, *args) -> str:
+        """Queue ``fn(*args)`` for ``user_id`` and return the job ID used to
+        fetch its result."""
+        job_id = uuid.uuid4().hex
+        self._save(job_id, {"job_status": "queued", "user_id": user_id})
+        self._executor.submit(self._run, job_id, user_id, fn, args)
+        return job_id
+
+    def get(self, job_id: str):
+        """Return the stored job record, or None if the job is unknown or expired."""
+        if self._use_redis:
+            try:
+                raw = self._redis.get(f"{self.KEY_PREFIX}{job_id}")
+                return json.loads(raw) if raw else None
+            except Exception as e:
+                logger.warning("Error reading chat job %s from Redis: %s", job_id, e)
+        with self._lock:
+            entry = self._local_jobs.get(job_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    @staticmethod
+    def visible_to(job, user_id) -> bool:
+        """Whether ``user_id`` may see ``job``; an unknown caller (no valid
+        token, outside ``enforce``) sees every job."""
+        return user_id is None or job.get("user_id") in (None, user_id)
+
+    def _run(self, job_id, user_id, fn, args):
+        self._save(job_id, {"job_status": "running", "user_id": user_id})
+        try:
+            result = fn(*args)
+            self._save(
+                job_id,
+                {"job_status": "completed", "user_id": user_id, "result": result},
+            )
+        except Exception as e:
+            logger.exception("Error in chat job %s: %s", job_id, e)
+            self._save(
+                job_id, {"job_status": "failed", "user_id": user_id, "error": str(e)}
+            )
+
+    def _save(self, job_id, record):
+        if self._use_redis:
+            try:
+                self._redis.set(
+                    f"{self.KEY_PREFIX}{job_id}", json.dumps(record), ex=self._ttl
+                )
+                return
+            except Exception as e:
+                logger.warning("Error storing chat job %s in Redis: %s", job_id, e)
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired records so the fallback store stays bounded by the TTL
+            for expired_id in [
+                k for k, (expires_at, _) in self._local_jobs.items() if expires_at < now
+            ]:
+                del self._local_jobs[expired_id]
+            self._local_jobs[job_id] = (now + self._ttl, record)
@@ -0,0 +1,160 @@
+# forgemind-backend/compression.py
+
+"""Compressed request and response bodies.
+
+The Fusion add-in gzips large JSON request bodies (CAD state uploads on
+/poll, /wait_for_operation and /instruction_result) and sends
+``Content-Encoding: gzip``; other clients may use zstd. Responses are
+compressed for every route when the client's ``Accept-Encoding`` allows it,
+preferring zstd over gzip. Event streams are left alone so tokens are
+delivered as they are produced.
+"""
+
+import gzip
+import io
+import json
+import zlib
+
+import zstandard
+from flask import request
+
+# Bodies smaller than this are sent uncompressed; the framing overhead isn't worth it
+MIN_COMPRESS_SIZE = 500
+# Upper bound on a decompressed request body, so a small upload can't expand unbounded
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Content types that must be streamed to the client as-is
+UNCOMPRESSED_CONTENT_TYPES = ("text/event-stream",)
+
+
+class BodyTooLarge(ValueError):
+    """Raised when a compressed request body expands beyond MAX_DECOMPRESSED_SIZE."""
+
+
+def decompress_body(body: bytes, encoding: str) -> bytes:
+    """Decode a request body sent with ``Content-Encoding: encoding``.
+
+    Raises ValueError for unsupported encodings or corrupt data, and
+    BodyTooLarge if the result would exceed MAX_DECOMPRESSED_SIZE.
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        try:
+            data = decompressor.decompress(body, MAX_DECOMPRESSED_SIZE + 1)
+        except zlib.error as e:
+            raise ValueError(f"Invalid gzip body: {e}")
+    elif encoding == "zstd":
+        try:
+            chunks, size = [], 0
+            with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+                while size <= MAX_DECOMPRESSED_SIZE:
+                    chunk = reader.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+            data = b"".join(chunks)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd body: {e}")
+    else:
+        raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+    if len(data) > MAX_DECOMPRESSED_SIZE:
+        raise BodyTooLarge("Decompressed request body is too large")
+    return data
+
+
+def choose_encoding(accept_encoding: str):
+    """Pick the response encoding for an ``Accept-Encoding`` header, or None."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+
+    for encoding in ("zstd", "gzip"):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class DecompressRequestMiddleware:
+    """WSGI middleware that transparently inflates compressed request bodies,
+    so views keep calling ``request.get_json()``."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING")
+        if encoding and encoding.strip().lower() != "identity":
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            try:
+                body = decompress_body(environ["wsgi.input"].read(length), encoding)
+            except BodyTooLarge as e:
+                return _plain_error(start_response, "413 Payload Too Large", str(e))
+            except ValueError as e:
+                return _plain_error(start_response, "400 Bad Request", str(e))
+            environ["wsgi.input"] = io.BytesIO(body)
+            environ["CONTENT_LENGTH"] = str(len(body))
+            del environ["HTTP_CONTENT_ENCODING"]
+        return self.wsgi_app(environ, start_response)
+
+
+def _plain_error(start_response, status, message):
+    body = json.dumps({"status": False, "message": message}).encode("utf-8")
+    start_response(
+        status,
+        [("Content-Type", "application/json"), ("Content-Length", str(len(body)))],
+    )
+    return [body]
+
+
+def compress_response(response):
+    """Flask ``after_request`` hook compressing eligible responses."""
+    response.vary.add("Accept-Encoding")
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype in UNCOMPRESSED_CONTENT_TYPES
+    ):
+        return response
+
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compress_body(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    """Enable request decompression and response compression for ``app``."""
+    app.wsgi_app = DecompressRequestMiddleware(app.wsgi_app)
+    app.after_request(compress_response)
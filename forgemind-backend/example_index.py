@@ -0,0 +1,410 @@
+# forgemind-backend/example_index.py
+
+"""Nearest-neighbour retrieval over Fusion scripts known to work.
+
+The examples are the curated scripts in forgemind-ai's text_to_fusion
+dataset plus every operation the plugin reported as successful. Instructions
+are embedded with OpenAI and searched with ``VectorIndex``, so /chat can
+show the assistant the closest proven scripts as few-shot context or, for a
+near-duplicate first prompt, reuse one outright.
+"""
+
+import copy
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 256
+
+DEFAULT_DATASET_DIR = (
+    Path(__file__).resolve().parent.parent
+    / "forgemind-ai/training/datasets/text_to_fusion/unprocessed"
+)
+
+
+# A number with an optional unit right after it ("5", "2.5mm", "10 in", "45°")
+_QUANTITY = re.compile(
+    r"(\d+(?:\.\d+)?|\.\d+)(?:\s*"
+    r"(mm|millimet(?:er|re)s?|cm|centimet(?:er|re)s?|m|met(?:er|re)s?|"
+    r"in|inch(?:es)?|\"|ft|feet|foot|'|deg|degrees?|°|rad|radians?)(?![a-z]))?",
+    re.IGNORECASE,
+)
+_UNITS = {
+    "mm": "mm",
+    "cm": "cm",
+    "m": "m",
+    "in": "in",
+    '"': "in",
+    "ft": "ft",
+    "feet": "ft",
+    "foot": "ft",
+    "'": "ft",
+    "deg": "deg",
+    "°": "deg",
+    "rad": "rad",
+}
+
+
+def quantities(text: str) -> tuple:
+    """The numbers in ``text``, in order, with their normalized units:
+    "5x5x5 cube" and "5 x 5 x 5.0 cube" have the same quantities, "5x5x6" and
+    "5mm cube" don't."""
+    found = []
+    for number, unit in _QUANTITY.findall(text or ""):
+        unit = unit.lower()
+        for prefix, name in (
+            ("millimet", "mm"),
+            ("centimet", "cm"),
+            ("met", "m"),
+            ("inch", "in"),
+            ("degree", "deg"),
+            ("radian", "rad"),
+        ):
+            if unit.startswith(prefix):
+                unit = name
+        found.append((float(number), _UNITS.get(unit, unit)))
+    return tuple(found)
+
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """Cosine-similarity search over unit-normalized float32 rows.
+
+    Large indexes use an inverted file: rows are bucketed by their nearest
+    spherical k-means centroid and a query scans only the ``nprobe`` buckets
+    whose centroids are closest to it. Below ``min_ivf_rows`` a full scan is
+    both exact and faster, so no buckets are built. Rows added later with
+    ``with_rows`` are kept apart and always scanned in full.
+    """
+
+    def __init__(self, vectors, nlist=None, nprobe=8, min_ivf_rows=2048, seed=0):
+        self.vectors = vectors
+        self.tail = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self.nprobe = nprobe
+        self.centroids = None
+        if len(vectors) >= min_ivf_rows:
+            self._build_ivf(nlist or int(np.sqrt(len(vectors))), seed)
+
+    def __len__(self):
+        return len(self.vectors) + len(self.tail)
+
+    def with_rows(self, rows):
+        """A copy of the index with ``rows`` appended after the existing
+        ones. The base rows (possibly memory-mapped) and their buckets are
+        shared, not copied or reclustered."""
+        extended = copy.copy(self)
+        extended.tail = np.vstack([self.tail, _normalize_rows(rows)])
+        return extended
+
+    def _build_ivf(self, nlist, seed, iterations=10, sample_size=50000):
+        rng = np.random.default_rng(seed)
+        sample = self.vectors[
+            rng.choice(len(self.vectors), min(sample_size, len(self.vectors)), False)
+        ]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            sums[empty] = centroids[empty]  # Keep centroids that attracted nothing
+            centroids = _normalize_rows(sums)
+
+        assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.order = np.argsort(assignment, kind="stable")
+        self.offsets = np.searchsorted(assignment[self.order], np.arange(nlist + 1))
+
+    def search(self, query, k):
+        """Return up to ``k`` ``(row, similarity)`` pairs, most similar first."""
+        if not len(self):
+            return []
+        query = _normalize_rows(query)
+        if self.centroids is None:
+            rows = np.arange(len(self.vectors))
+        else:
+            nprobe = min(self.nprobe, len(self.centroids))
+            probed = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+            rows = np.concatenate(
+                [self.order[self.offsets[c] : self.offsets[c + 1]] for c in probed]
+            )
+        scores = np.concatenate([self.vectors[rows] @ query, self.tail @ query])
+        rows = np.concatenate(
+            [rows, len(self.vectors) + np.arange(len(self.tail))]
+        )
+        top = np.argsort(scores)[::-1][:k]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+
+class ExampleIndex:
+    """Instruction embeddings for proven scripts, searchable from /chat.
+
+    Successful operations are stored in Redis (instruction, reply and
+    embedding) so every worker indexes them and nothing is embedded twice.
+    Each worker loads them, plus the curated dataset, into a ``VectorIndex``
+    whose matrix is written to ``cache_dir`` and memory-mapped: workers on
+    one host share a single copy through the page cache. The index is built
+    in the background, on the first search and then every
+    ``refresh_interval`` seconds, and searches find nothing until the first
+    build is done; successes recorded by this worker are searchable
+    immediately.
+    """
+
+    EXAMPLES_KEY = "example_index:examples"  # example id -> example JSON
+    VECTORS_KEY = "example_index:vectors"  # example id -> float32 embedding
+    CANDIDATE_PREFIX = "example_candidate:"  # operation_id -> example awaiting its result
+
+    def __init__(
+        self,
+        openai_client,
+        redis_client,
+        use_redis: bool,
+        dataset_dir=DEFAULT_DATASET_DIR,
+        cache_dir=None,
+        refresh_interval: int = 600,
+        candidate_ttl: int = 3600,
+        query_cache_size: int = 256,
+    ):
+        self._openai = openai_client
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self._dataset_dir = Path(dataset_dir)
+        self._cache_dir = Path(
+            cache_dir or os.path.join(tempfile.gettempdir(), "forgemind_example_index")
+        )
+        self._refresh_interval = refresh_interval
+        self._candidate_ttl = candidate_ttl
+        self._query_cache_size = query_cache_size
+
+        self._index = None  # (VectorIndex, examples), swapped whole on refresh
+        self._loaded_at = float("-inf")
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._query_cache = OrderedDict()  # instruction -> embedding
+        self._query_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="examples")
+
+    def search(self, instruction: str, k: int, min_similarity: float = 0.0):
+        """Return up to ``k`` ``(similarity, example)`` pairs for ``instruction``.
+
+        Examples are dicts with ``instruction`` and ``python_code``; those
+        from past operations also carry ``steps``, ``user_facing_response``
+        and ``first_prompt``. Returns [] when embeddings are unavailable or
+        the index is still being built.
+        """
+        current = self._current()
+        if current is None:
+            return []
+        index, examples = current
+        try:
+            query = self._embed_query(instruction)
+        except Exception as e:
+            logger.warning("Example search unavailable: %s", e)
+            return []
+        return [
+            (score, examples[row])
+            for row, score in index.search(query, k)
+            if score >= min_similarity
+        ]
+
+    def remember(self, operation_id, user_id, instruction, response, first_prompt):
+        """Hold the operation's reply until the plugin reports how it ran."""
+        if not (self._use_redis and operation_id):
+            return
+        example = {
+            "instruction": instruction,
+            "python_code": response.get("python_code"),
+            "steps": response.get("steps"),
+            "user_facing_response": response.get("user_facing_response"),
+            "first_prompt": first_prompt,
+        }
+        try:
+            self._redis.set(
+                f"{self.CANDIDATE_PREFIX}{operation_id}",
+                json.dumps({"user_id": user_id, "example": example}),
+                ex=self._candidate_ttl,
+            )
+        except Exception as e:
+            logger.warning("Error recording example candidate: %s", e)
+
+    def record_outcome(self, operation_id, user_id, succeeded: bool):
+        """Index the operation's instruction and script if it ran successfully.
+
+        Embedding happens on a background thread, off the request path.
+        """
+        if not (self._use_redis and operation_id):
+            return
+        try:
+            candidate_key = f"{self.CANDIDATE_PREFIX}{operation_id}"
+            raw = self._redis.get(candidate_key)
+            record = json.loads(raw) if raw else None
+            if not record or record["user_id"] != user_id:
+                return
+            self._redis.delete(candidate_key)
+        except Exception as e:
+            logger.warning("Error reading example candidate: %s", e)
+            return
+        if succeeded and record["example"]["python_code"]:
+            self._writer.submit(self._admit, f"op:{operation_id}", record["example"])
+
+    def _admit(self, example_id, example):
+        try:
+            vector = self._embed([example["instruction"]])[0]
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.hset(self.EXAMPLES_KEY, example_id, json.dumps(example))
+            pipe.hset(self.VECTORS_KEY, example_id, vector.tobytes())
+            pipe.execute()
+        except Exception as e:
+            logger.error("Error indexing example %s: %s", example_id, e)
+            return
+
+        # Before the first build finishes, that build (or the next) picks it up
+        with self._load_lock:
+            if self._index is not None:
+                index, examples = self._index
+                self._index = (index.with_rows(vector[None, :]), examples + [example])
+
+    def _current(self):
+        """The ``(VectorIndex, examples)`` pair, or None until the first
+        build finishes; starts a background (re)build when one is due."""
+        with self._load_lock:
+            if (
+                time.monotonic() - self._loaded_at > self._refresh_interval
+                and not self._refreshing
+            ):
+                self._refreshing = True
+                threading.Thread(target=self._refresh, daemon=True).start()
+            return self._index
+
+    def _refresh(self):
+        try:
+            rebuilt = self._build()
+            with self._load_lock:
+                self._index = rebuilt
+        except Exception as e:
+            # Searches keep the previous index (or none) until the next attempt
+            logger.warning("Error building example index: %s", e)
+        finally:
+            with self._load_lock:
+                self._loaded_at = time.monotonic()
+                self._refreshing = False
+
+    def _build(self):
+        ids, examples, vectors = [], [], []
+
+        if self._use_redis:
+            stored = self._redis.hgetall(self.EXAMPLES_KEY)
+            stored_vectors = self._redis.hgetall(self.VECTORS_KEY)
+            for example_id, raw in stored.items():
+                vector = stored_vectors.get(example_id)
+                if vector is not None:
+                    ids.append(example_id.decode("utf-8"))
+                    examples.append(json.loads(raw))
+                    vectors.append(np.frombuffer(vector, dtype=np.float32))
+
+        known = set(ids)
+        missing = [
+            (example_id, example)
+            for example_id, example in self._dataset_examples()
+            if example_id not in known
+        ]
+        if missing:
+            embedded = self._embed([example["instruction"] for _, example in missing])
+            for (example_id, example), vector in zip(missing, embedded):
+                ids.append(example_id)
+                examples.append(example)
+                vectors.append(vector)
+            if self._use_redis:
+                self._redis.hset(
+                    self.VECTORS_KEY,
+                    mapping={eid: v.tobytes() for (eid, _), v in zip(missing, embedded)},
+                )
+                self._redis.hset(
+                    self.EXAMPLES_KEY,
+                    mapping={eid: json.dumps(ex) for eid, ex in missing},
+                )
+
+        matrix = np.vstack(vectors) if vectors else self._empty_matrix()
+        logger.info("Loaded %s examples into the example index", len(examples))
+        return VectorIndex(self._memory_map(ids, matrix)), examples
+
+    @staticmethod
+    def _empty_matrix():
+        return np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+    def _dataset_examples(self):
+        """Curated scripts, with the file name standing in for the instruction."""
+        examples = []
+        for path in sorted(glob.glob(str(self._dataset_dir / "*.py"))):
+            code = Path(path).read_text(encoding="utf-8")
+            digest = hashlib.sha256(code.encode("utf-8")).hexdigest()[:16]
+            examples.append(
+                (
+                    f"dataset:{Path(path).stem}:{digest}",
+                    {
+                        "instruction": Path(path).stem.replace("_", " "),
+                        "python_code": code,
+                    },
+                )
+            )
+        return examples
+
+    def _memory_map(self, ids, matrix):
+        """Write ``matrix`` under a name derived from its contents and map it
+        read-only; a worker that finds the file already written just maps it."""
+        digest = hashlib.sha256("\n".join(ids).encode("utf-8")).hexdigest()[:16]
+        path = self._cache_dir / f"vectors-{digest}-{len(ids)}.npy"
+        try:
+            if not path.exists():
+                self._cache_dir.mkdir(parents=True, exist_ok=True)
+                partial = path.with_suffix(f".{os.getpid()}.tmp")
+                with open(partial, "wb") as f:
+                    np.save(f, matrix)
+                os.replace(partial, path)
+                # Workers still mapping an older file keep their pages until they refresh
+                for stale in self._cache_dir.glob("vectors-*.npy"):
+                    if stale != path:
+                        stale.unlink(missing_ok=True)
+            return np.load(path, mmap_mode="r")
+        except OSError as e:
+            logger.warning("Example index kept in memory (%s)", e)
+            return matrix
+
+    def _embed_query(self, instruction):
+        text = " ".join(instruction.split()).lower()
+        with self._query_lock:
+            cached = self._query_cache.get(text)
+            if cached is not None:
+                self._query_cache.move_to_end(text)
+                return cached
+        vector = self._embed([text])[0]
+        with self._query_lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def _embed(self, texts):
+        response = self._openai.embeddings.create(
+            model=EMBEDDING_MODEL, input=texts, dimensions=EMBEDDING_DIMENSIONS
+        )
+        return _normalize_rows([item.embedding for item in response.data])
@@ -0,0 +1,124 @@
+# forgemind-backend/fanout.py
+
+"""Overlapping a request's independent I/O, and timing its steps.
+
+``IoPool.gather`` runs calls that don't depend on each other (a Supabase
+insert, a Redis read, an OpenAI request) concurrently on a shared thread
+pool, and ``IoPool.defer`` moves work whose result the caller doesn't wait
+for off the critical path. ``StepTimer`` times the named steps of one
+request and ``StepStats`` keeps recent timings per step for percentiles.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class IoPool:
+    """Shared thread pool for blocking client calls.
+
+    Calls run on the pool must not gather or wait on the pool themselves,
+    or a saturated pool deadlocks. With ``max_workers=0`` everything runs
+    inline, in order, which is useful for comparing against the sequential
+    behaviour.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = (
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="io")
+            if max_workers > 0
+            else None
+        )
+
+    def gather(self, *calls):
+        """Run the zero-argument ``calls`` concurrently; return their results
+        in order. The first runs on the calling thread. Once all have
+        finished, the first exception, if any, is raised."""
+        if self._executor is None or len(calls) < 2:
+            return [call() for call in calls]
+
+        futures = [self._executor.submit(call) for call in calls[1:]]
+        try:
+            first = calls[0]()
+        finally:
+            wait(futures)
+        return [first] + [future.result() for future in futures]
+
+    def defer(self, fn, *args):
+        """Run ``fn(*args)`` in the background, logging any exception."""
+        if self._executor is None:
+            _log_errors(fn, args)
+        else:
+            self._executor.submit(_log_errors, fn, args)
+
+
+def _log_errors(fn, args):
+    try:
+        fn(*args)
+    except Exception as e:
+        logger.exception("Error in background task %s: %s", fn.__name__, e)
+
+
+class StepTimer:
+    """Wall-clock time of each named step of one request, in milliseconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps = {}
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = (time.perf_counter() - started) * 1000
+
+    def timed(self, name: str, fn, *args):
+        """``fn(*args)`` as a zero-argument call, timed as ``name``; for gather."""
+
+        def call():
+            with self.step(name):
+                return fn(*args)
+
+        return call
+
+    def finish(self) -> dict:
+        """The step timings plus ``total``, the time since the timer started."""
+        self.steps["total"] = (time.perf_counter() - self.started) * 1000
+        return self.steps
+
+    def report(self) -> str:
+        return " ".join(f"{name}={ms:.0f}" for name, ms in self.steps.items())
+
+
+class StepStats:
+    """The last ``window`` timings of each step, for percentiles."""
+
+    def __init__(self, window: int = 1000):
+        self._window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, steps: dict):
+        with self._lock:
+            for name, ms in steps.items():
+                self._samples.setdefault(name, deque(maxlen=self._window)).append(ms)
+
+    def percentiles(self) -> dict:
+        """``{step: {"count", "p50", "p95"}}`` over each step's window."""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+        return {
+            name: {
+                "count": len(values),
+                "p50": values[int(0.5 * (len(values) - 1))],
+                "p95": values[int(0.95 * (len(values) - 1))],
+            }
+            for name, values in samples.items()
+        }
@@ -0,0 +1,41 @@
+# forgemind-backend/lazy.py
+
+"""Clients built on first use instead of at import.
+
+Creating the Supabase and OpenAI clients costs a couple of hundred
+milliseconds in every worker, and a worker that only serves polls may not
+need one for a while. ``Lazy`` stands in for such a client: it can be
+handed to the stores at import, and the real client is built, once per
+process, the first time one of its attributes is used.
+"""
+
+import threading
+
+
+class Lazy:
+    """Proxy forwarding attribute access to ``factory()``, built once."""
+
+    def __init__(self, factory, name: str = None):
+        self._factory = factory
+        self._name = name or getattr(factory, "__name__", "client")
+        self._target = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._target is not None
+
+    def resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        # Only reached for attributes Lazy itself doesn't define
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        state = "built" if self.built else "not built"
+        return f"<Lazy {self._name} ({state})>"
@@ -0,0 +1,181 @@
+# forgemind-backend/listing.py
+
+"""Paged, projected listings of chats and messages, and their ETags.
+
+Pages are keyset-paginated: rows are ordered on a timestamp column with
+``id`` as the tie-breaker, and ``next_cursor`` encodes the last row's pair,
+so a page costs the same however deep it is and rows inserted meanwhile
+don't shift the following pages.
+
+``ListingVersions`` keeps a version counter per listing in Redis
+(``chats_version:{user_id}``, ``messages_version:{chat_id}``), bumped after
+every write to the rows behind it. A listing's ETag is derived from the
+counter and the request's parameters, so a client revalidating an unchanged
+listing gets a 304 for one Redis round trip, without a Supabase query.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# What a cursor may carry; values end up in a PostgREST filter
+_CURSOR_VALUE = re.compile(r"^[0-9A-Za-z:.+\- ]{1,64}$")
+
+
+class ListingError(ValueError):
+    """Raised for listing parameters the client got wrong (a 400)."""
+
+
+def parse_fields(fields, allowed, default):
+    """Columns to select: ``fields`` (comma separated) restricted to
+    ``allowed``, or ``default`` when the client didn't ask."""
+    if not fields:
+        return list(default)
+    columns = [column.strip() for column in fields.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in allowed]
+    if unknown or not columns:
+        raise ListingError(
+            f"Unknown fields: {', '.join(unknown) or fields}; "
+            f"choose from {', '.join(allowed)}"
+        )
+    return columns
+
+
+def parse_limit(limit, default: int, maximum: int) -> int:
+    if limit is None:
+        return default
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ListingError("limit must be an integer")
+    if limit < 1:
+        raise ListingError("limit must be at least 1")
+    return min(limit, maximum)
+
+
+def encode_cursor(row: dict, order_column: str) -> str:
+    raw = json.dumps([row[order_column], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return the ``(order value, id)`` pair of a cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ListingError("Invalid cursor")
+    if not all(_CURSOR_VALUE.match(str(part)) for part in (value, row_id)):
+        raise ListingError("Invalid cursor")
+    return str(value), str(row_id)
+
+
+def fetch_page(table, filters: dict, columns, order_column, desc, cursor, limit):
+    """Select one page of ``table`` (a Supabase table query) rows matching
+    the ``filters`` equalities; returns ``(rows, next_cursor)``.
+
+    ``columns`` is extended with the order column and ``id`` the cursor
+    needs; they are dropped from the rows again if the client didn't ask
+    for them.
+    """
+    selected = list(dict.fromkeys([*columns, order_column, "id"]))
+    query = table.select(",".join(selected))
+    for column, value in filters.items():
+        query = query.eq(column, value)
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        op = "lt" if desc else "gt"
+        query = query.or_(
+            f'{order_column}.{op}."{value}",'
+            f'and({order_column}.eq."{value}",id.{op}."{row_id}")'
+        )
+    rows = (
+        query.order(order_column, desc=desc)
+        .order("id", desc=desc)
+        .limit(limit + 1)
+        .execute()
+        .data
+        or []
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], order_column)
+    extra = [column for column in selected if column not in columns]
+    if extra:
+        rows = [
+            {key: value for key, value in row.items() if key not in extra}
+            for row in rows
+        ]
+    return rows, next_cursor
+
+
+class ListingVersions:
+    """Version counters for conditional listings (see module docs).
+
+    Counters start from the current time in nanoseconds rather than zero, so
+    one that expired (after ``ttl`` seconds without use) or was lost with
+    Redis's data never repeats a value a client may still hold an ETag for.
+    Without Redis there are no ETags: each worker would count on its own.
+    """
+
+    CHATS_PREFIX = "chats_version:"
+    MESSAGES_PREFIX = "messages_version:"
+
+    def __init__(self, redis_client, use_redis: bool, ttl: int):
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self._ttl = ttl
+
+    def chats_key(self, user_id) -> str:
+        return f"{self.CHATS_PREFIX}{user_id}"
+
+    def messages_key(self, chat_id) -> str:
+        return f"{self.MESSAGES_PREFIX}{chat_id}"
+
+    def bump(self, *keys):
+        """Record a change to the listings at ``keys``; call once the write
+        has reached Supabase, so no reader caches the old rows under the new
+        version."""
+        if not self._use_redis:
+            return
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.set(key, time.time_ns(), nx=True)
+                pipe.incr(key)
+                pipe.expire(key, self._ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("Error bumping listing versions %s: %s", keys, e)
+
+    def etag(self, key, *params):
+        """ETag of the listing at ``key`` as requested with ``params``, or
+        None if there is none to give."""
+        if not self._use_redis:
+            return None
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.set(key, time.time_ns(), nx=True)
+            pipe.get(key)
+            pipe.expire(key, self._ttl)
+            version = pipe.execute()[1]
+        except Exception as e:
+            logger.warning("Error reading listing version %s: %s", key, e)
+            return None
+        if version is None:
+            return None
+        digest = hashlib.sha256(
+            json.dumps([key, _decode(version), *params]).encode("utf-8")
+        ).hexdigest()
+        return digest[:32]
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
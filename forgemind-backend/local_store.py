@@ -0,0 +1,522 @@
+# forgemind-backend/local_store.py
+
+"""An in-process store for the part of the Redis API the backend uses.
+
+``LocalStore`` keeps strings, hashes, lists and sorted sets in one LRU
+ordered dict, with per-key TTLs and a memory cap: once the (estimated)
+size passes ``max_bytes``, or the key count ``max_keys``, the least
+recently used keys are evicted. Values come back as bytes, like redis-py.
+It replaces Redis when none is reachable, which is complete on a
+single-process deployment; with several workers each keeps its own state.
+
+``CachedRedis`` puts a ``LocalStore`` in front of Redis as an L1 cache for
+data that may be read a little stale: ``get``, ``hget`` and ``hgetall``
+results are kept for ``ttl`` seconds, and every write made through it
+(directly or in a pipeline) drops the local copy of the keys it touches.
+"""
+
+import fnmatch
+import threading
+import time
+from collections import OrderedDict
+
+from redis.exceptions import ResponseError
+
+# Rough per-key and per-item overhead of the Python objects holding a value
+KEY_OVERHEAD = 200
+ITEM_OVERHEAD = 80
+
+_WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if isinstance(value, float):
+        return repr(value).encode("utf-8")
+    if isinstance(value, int):
+        return str(value).encode("utf-8")
+    raise TypeError(f"Invalid input of type {type(value).__name__}")
+
+
+def _key(name) -> str:
+    return name.decode("utf-8") if isinstance(name, bytes) else str(name)
+
+
+def _size(key, value) -> int:
+    size = KEY_OVERHEAD + len(key)
+    if isinstance(value, bytes):
+        return size + len(value)
+    if isinstance(value, list):
+        return size + sum(len(item) + ITEM_OVERHEAD for item in value)
+    # Hashes (bytes values) and sorted sets (float scores)
+    return size + sum(
+        len(field) + ITEM_OVERHEAD + (len(v) if isinstance(v, bytes) else 0)
+        for field, v in value.items()
+    )
+
+
+class LocalStore:
+    """Thread-safe, bounded stand-in for a Redis client (see module docs)."""
+
+    # Writes between scans for expired keys
+    SWEEP_INTERVAL = 1000
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, max_keys: int = 100000):
+        self.max_bytes = max_bytes
+        self.max_keys = max_keys
+        self._data = OrderedDict()  # key -> bytes | dict | list, oldest first
+        self._expires = {}  # key -> time.monotonic() deadline
+        self._sizes = {}
+        self._bytes = 0
+        self._writes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Bookkeeping; callers hold the lock
+
+    def _lookup(self, name, kind=None):
+        key = _key(name)
+        value = self._data.get(key)
+        if value is None:
+            return key, None
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._remove(key)
+            return key, None
+        if kind is not None and not isinstance(value, kind):
+            raise ResponseError(_WRONGTYPE)
+        self._data.move_to_end(key)
+        return key, value
+
+    def _read(self, name, kind):
+        key, value = self._lookup(name, kind)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, value
+
+    def _put(self, key, value, keep_ttl=True):
+        """Store ``value`` (or account for an in-place change to it)."""
+        if not value and not isinstance(value, bytes):
+            # Redis drops emptied hashes, lists and sorted sets
+            self._remove(key)
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if not keep_ttl:
+            self._expires.pop(key, None)
+        size = _size(key, value)
+        self._bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        self._writes += 1
+        if self._writes % self.SWEEP_INTERVAL == 0:
+            self._sweep()
+        while self._data and (
+            self._bytes > self.max_bytes or len(self._data) > self.max_keys
+        ):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def _remove(self, key) -> bool:
+        if self._data.pop(key, None) is None:
+            return False
+        self._expires.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+        return True
+
+    def _sweep(self):
+        now = time.monotonic()
+        for key in [k for k, deadline in self._expires.items() if deadline <= now]:
+            self._remove(key)
+
+    # Keys
+
+    def ping(self, *args, **kwargs):
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._remove(_key(name)) for name in names)
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(self._lookup(name)[1] is not None for name in names)
+
+    def expire(self, name, time_s, nx=False, xx=False, gt=False, lt=False):
+        with self._lock:
+            key, value = self._lookup(name)
+            if value is None:
+                return False
+            deadline = time.monotonic() + float(time_s)
+            current = self._expires.get(key)
+            if (nx and current is not None) or (xx and current is None):
+                return False
+            # A key without a TTL counts as an infinite one
+            if gt and (current is None or deadline <= current):
+                return False
+            if lt and current is not None and deadline >= current:
+                return False
+            self._expires[key] = deadline
+            return True
+
+    def ttl(self, name):
+        with self._lock:
+            key, value = self._lookup(name)
+            if value is None:
+                return -2
+            deadline = self._expires.get(key)
+            return -1 if deadline is None else round(deadline - time.monotonic())
+
+    def keys(self, pattern="*"):
+        with self._lock:
+            self._sweep()
+            return [
+                key.encode("utf-8")
+                for key in self._data
+                if fnmatch.fnmatch(key, pattern)
+            ]
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        # A snapshot, so callers may write while iterating
+        return iter(self.keys(match or "*"))
+
+    def memory_usage(self, key, samples=None):
+        with self._lock:
+            key = _key(key)
+            deadline = self._expires.get(key)
+            if deadline is not None and deadline <= time.monotonic():
+                return None
+            # Read without counting as a use, so reports don't reorder the LRU
+            return self._sizes.get(key)
+
+    # Strings
+
+    def get(self, name):
+        with self._lock:
+            return self._read(name, bytes)[1]
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False, keepttl=False):
+        with self._lock:
+            key, current = self._lookup(name)
+            if (nx and current is not None) or (xx and current is None):
+                return None
+            self._put(key, _encode(value), keep_ttl=keepttl)
+            if ex is not None or px is not None:
+                seconds = float(ex) if ex is not None else float(px) / 1000
+                self._expires[key] = time.monotonic() + seconds
+            return True
+
+    def mset(self, mapping):
+        with self._lock:
+            for name, value in mapping.items():
+                self._put(_key(name), _encode(value), keep_ttl=False)
+            return True
+
+    def mget(self, keys, *args):
+        names = [keys, *args] if isinstance(keys, (str, bytes)) else list(keys)
+        with self._lock:
+            return [
+                value if isinstance(value, bytes) else None
+                for value in (self._read(name, None)[1] for name in names)
+            ]
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            key, current = self._lookup(name, bytes)
+            try:
+                value = int(current or b"0") + amount
+            except ValueError:
+                raise ResponseError("value is not an integer or out of range")
+            self._put(key, _encode(value))
+            return value
+
+    # Hashes
+
+    def hset(self, name, key=None, value=None, mapping=None, items=None):
+        fields = dict(mapping or {})
+        if key is not None:
+            fields[key] = value
+        for field, item in zip((items or [])[::2], (items or [])[1::2]):
+            fields[field] = item
+        with self._lock:
+            key_, current = self._lookup(name, dict)
+            current = dict(current or {})
+            added = 0
+            for field, item in fields.items():
+                field = _encode(field)
+                added += field not in current
+                current[field] = _encode(item)
+            self._put(key_, current)
+            return added
+
+    def hget(self, name, key):
+        with self._lock:
+            current = self._read(name, dict)[1]
+            return current.get(_encode(key)) if current else None
+
+    def hmget(self, name, keys, *args):
+        fields = [keys, *args] if isinstance(keys, (str, bytes)) else list(keys)
+        with self._lock:
+            current = self._read(name, dict)[1] or {}
+            return [current.get(_encode(field)) for field in fields]
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._read(name, dict)[1] or {})
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            key, current = self._lookup(name, dict)
+            if current is None:
+                return 0
+            current = dict(current)
+            removed = sum(current.pop(_encode(k), None) is not None for k in keys)
+            self._put(key, current)
+            return removed
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            key_, current = self._lookup(name, dict)
+            current = dict(current or {})
+            field = _encode(key)
+            value = int(current.get(field, b"0")) + amount
+            current[field] = _encode(value)
+            self._put(key_, current)
+            return value
+
+    # Lists
+
+    def rpush(self, name, *values):
+        with self._lock:
+            key, current = self._lookup(name, list)
+            current = (current or []) + [_encode(value) for value in values]
+            self._put(key, current)
+            return len(current)
+
+    def lpop(self, name, count=None):
+        with self._lock:
+            key, current = self._lookup(name, list)
+            if not current:
+                return None
+            popped, rest = current[: count or 1], current[count or 1 :]
+            self._put(key, rest)
+            return popped if count is not None else popped[0]
+
+    def llen(self, name):
+        with self._lock:
+            return len(self._lookup(name, list)[1] or [])
+
+    def lrange(self, name, start, end):
+        with self._lock:
+            current = self._lookup(name, list)[1] or []
+            return current[start : (end + 1) or None]
+
+    def lrem(self, name, count, value):
+        with self._lock:
+            key, current = self._lookup(name, list)
+            if not current:
+                return 0
+            value = _encode(value)
+            matches = [i for i, item in enumerate(current) if item == value]
+            if count > 0:
+                matches = matches[:count]
+            elif count < 0:
+                matches = matches[count:]
+            drop = set(matches)
+            self._put(key, [item for i, item in enumerate(current) if i not in drop])
+            return len(drop)
+
+    # Sorted sets
+
+    def zadd(self, name, mapping, nx=False, xx=False, **kwargs):
+        with self._lock:
+            key, current = self._lookup(name, dict)
+            current = dict(current or {})
+            added = 0
+            for member, score in mapping.items():
+                member = _encode(member)
+                exists = member in current
+                if (nx and exists) or (xx and not exists):
+                    continue
+                added += not exists
+                current[member] = float(score)
+            self._put(key, current)
+            return added
+
+    def zcard(self, name):
+        with self._lock:
+            return len(self._lookup(name, dict)[1] or {})
+
+    def zrem(self, name, *values):
+        with self._lock:
+            key, current = self._lookup(name, dict)
+            if current is None:
+                return 0
+            current = dict(current)
+            removed = sum(current.pop(_encode(v), None) is not None for v in values)
+            self._put(key, current)
+            return removed
+
+    def zpopmin(self, name, count=None):
+        with self._lock:
+            key, current = self._lookup(name, dict)
+            if not current:
+                return []
+            ranked = sorted(current.items(), key=lambda item: (item[1], item[0]))
+            popped = ranked[: count or 1]
+            self._put(key, dict(ranked[count or 1 :]))
+            return popped
+
+    # Pub/sub has no one else to reach in this process
+
+    def publish(self, channel, message):
+        return 0
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return LocalPipeline(self)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "keys": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class LocalPipeline:
+    """Queues ``LocalStore`` commands and runs them together, atomically."""
+
+    def __init__(self, store: LocalStore):
+        self._store = store
+        self._commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self._store, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._commands = []
+
+    def execute(self, raise_on_error=True):
+        commands, self._commands = self._commands, []
+        results = []
+        with self._store._lock:
+            for command, args, kwargs in commands:
+                try:
+                    results.append(command(*args, **kwargs))
+                except ResponseError as e:
+                    if raise_on_error:
+                        raise
+                    results.append(e)
+        return results
+
+
+def _written_keys(command: str, args, kwargs) -> list:
+    if command in ("delete", "unlink"):
+        return list(args)
+    if command == "mset":
+        return list((args[0] if args else kwargs["mapping"]).keys())
+    name = args[0] if args else kwargs.get("name")
+    return [name] if name is not None else []
+
+
+class CachedRedis:
+    """L1 cache in front of a Redis client (see module docs).
+
+    Reads of keys changed by other workers can be up to ``ttl`` seconds
+    stale, so only hand it to stores that tolerate that.
+    """
+
+    def __init__(self, redis_client, local: LocalStore, ttl: float):
+        self._redis = redis_client
+        self._local = local
+        self._ttl = ttl
+
+    def get(self, name):
+        value = self._local.get(name)
+        if value is None:
+            value = self._redis.get(name)
+            if value is not None:
+                self._local.set(name, value, ex=self._ttl)
+        return value
+
+    def hgetall(self, name):
+        value = self._local.hgetall(name)
+        if not value:
+            value = self._redis.hgetall(name)
+            if value:
+                with self._local._lock:
+                    self._local.hset(name, mapping=value)
+                    self._local.expire(name, self._ttl)
+        return value
+
+    def hget(self, name, key):
+        # One cached HGETALL serves every field of the hash
+        return self.hgetall(name).get(_encode(key))
+
+    def invalidate(self, *names):
+        self._local.delete(*names)
+
+    def pipeline(self, *args, **kwargs):
+        return CachedPipeline(self, self._redis.pipeline(*args, **kwargs))
+
+    def __getattr__(self, command):
+        # Anything else goes to Redis, as a write to its first key
+        send = getattr(self._redis, command)
+
+        def write(*args, **kwargs):
+            try:
+                return send(*args, **kwargs)
+            finally:
+                self.invalidate(*_written_keys(command, args, kwargs))
+
+        return write
+
+
+class CachedPipeline:
+    """A Redis pipeline that drops the L1 copies of the keys it wrote."""
+
+    def __init__(self, cache: CachedRedis, pipe):
+        self._cache = cache
+        self._pipe = pipe
+        self._written = []
+
+    def __getattr__(self, command):
+        queue = getattr(self._pipe, command)
+
+        def queue_and_track(*args, **kwargs):
+            self._written.extend(_written_keys(command, args, kwargs))
+            queue(*args, **kwargs)
+            return self
+
+        return queue_and_track
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pipe.reset()
+
+    def execute(self, raise_on_error=True):
+        written, self._written = self._written, []
+        try:
+            return self._pipe.execute(raise_on_error)
+        finally:
+            self._cache.invalidate(*written)
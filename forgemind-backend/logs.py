@@ -0,0 +1,149 @@
+# forgemind-backend/logs.py
+
+"""Structured logging that never blocks a request thread on output.
+
+``configure`` routes the root logger through a bounded queue: request
+threads format the record and enqueue it, and a single listener thread
+writes it to stdout, as one JSON object per line (``LOG_FORMAT=json``) or
+as text. When the queue is full, records are dropped and counted rather
+than waited on.
+
+Records can carry structured fields through ``extra``; they are rendered
+as JSON, and every field and message is cut to ``max_chars`` so a CAD
+state or prompt can't flood the output. High-frequency records pass
+``extra={"sample_every": n}`` and only one in ``n`` of them is written,
+with ``sampled=n`` added so counts can be scaled back up.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else came from ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+
+
+def truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... ({len(text) - max_chars} more chars)"
+
+
+def _fields(record) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_fields(record),
+        }
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        fields = " ".join(f"{k}={v}" for k, v in _fields(record).items())
+        line = super().format(record)
+        return f"{line} {fields}" if fields else line
+
+
+class SampleFilter(logging.Filter):
+    """Keeps one in ``sample_every`` of the records logged from each call site."""
+
+    def __init__(self):
+        super().__init__()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        every = getattr(record, "sample_every", None)
+        if every is None:
+            return True
+        del record.sample_every
+        if every <= 1:
+            return True
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            counter = self._counters.setdefault(site, itertools.count())
+        # next() on itertools.count is atomic under the GIL
+        if next(counter) % every:
+            return False
+        record.sampled = every
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues records without ever blocking; counts what didn't fit."""
+
+    def __init__(self, log_queue, max_chars: int):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Runs on the logging thread: resolve the message and make the
+        # fields immutable text before handing the record to the listener
+        record = super().prepare(record)
+        record.msg = record.message = truncate(record.msg, self.max_chars)
+        for key, value in _fields(record).items():
+            if not isinstance(value, (bool, int, float)) and value is not None:
+                if not isinstance(value, str):
+                    value = json.dumps(value, default=str)
+                setattr(record, key, truncate(value, self.max_chars))
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure(
+    level: str = "INFO",
+    fmt: str = "json",
+    max_chars: int = 2000,
+    queue_size: int = 10000,
+    stream=None,
+):
+    """Send the root logger's records through the queue to ``stream``
+    (stdout by default). Calling it again replaces the previous setup."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(queue_size), max_chars)
+    handler.addFilter(SampleFilter())
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    return handler
+
+
+@atexit.register
+def _flush():
+    if _listener is not None:
+        _listener.stop()
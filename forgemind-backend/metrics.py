@@ -0,0 +1,297 @@
+# forgemind-backend/metrics.py
+
+"""Prometheus metrics for the backend, served at /metrics.
+
+- ``forgemind_http_request_duration_seconds{route,method,status}``: every
+  Flask request, labelled with the URL rule rather than the path;
+- ``forgemind_external_call_duration_seconds{service,operation}``: every
+  HTTP call made by the app's Supabase and OpenAI clients (tables, auth and
+  storage; runs, messages and polling) and every Redis command or pipeline;
+- ``forgemind_chat_step_duration_seconds{step}``: the /chat pipeline steps
+  timed by ``fanout.StepTimer``;
+- ``forgemind_polls_total{route,result}``: plugin polls that found an
+  operation (``hit``) or not (``miss``);
+- ``forgemind_operations_total{status}``: operations created, handed to a
+  plugin and reported back.
+
+Metrics are kept per process. With several gunicorn workers, set
+``PROMETHEUS_MULTIPROC_DIR`` to an empty directory shared by the workers so
+each scrape aggregates all of them.
+"""
+
+import hmac
+import logging
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from redis import Redis
+from redis.client import Pipeline
+
+logger = logging.getLogger(__name__)
+
+# Latencies from a cache hit to a slow model call
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    30.0, 60.0,
+)  # fmt: skip
+
+REQUEST_LATENCY = Histogram(
+    "forgemind_http_request_duration_seconds",
+    "Time spent serving a request",
+    ["route", "method", "status"],
+    buckets=BUCKETS,
+)
+EXTERNAL_LATENCY = Histogram(
+    "forgemind_external_call_duration_seconds",
+    "Time spent in a call to Supabase, OpenAI or Redis",
+    ["service", "operation"],
+    buckets=BUCKETS,
+)
+CHAT_STEP_LATENCY = Histogram(
+    "forgemind_chat_step_duration_seconds",
+    "Time spent in a step of the /chat pipeline",
+    ["step"],
+    buckets=BUCKETS,
+)
+POLLS = Counter(
+    "forgemind_polls_total", "Plugin polls by outcome", ["route", "result"]
+)
+OPERATIONS = Counter(
+    "forgemind_operations_total", "Operation status transitions", ["status"]
+)
+
+# Request extension holding the time a request was sent
+_STARTED = "forgemind_started"
+
+# Path segments that identify a record rather than an endpoint
+_ID_SEGMENT = re.compile(
+    r"^(?:[a-z]+_[A-Za-z0-9]{8,}|[0-9a-f-]{32,36}|\d+|[^/]*\.(?:png|jpe?g))$"
+)
+
+
+def _operation(request) -> str:
+    """``METHOD /path`` with record IDs replaced, so labels stay bounded."""
+    segments = [
+        "{id}" if _ID_SEGMENT.match(segment) else segment
+        for segment in urlsplit(str(request.url)).path.split("/")[:6]
+    ]
+    return f"{request.method} {'/'.join(segments)}"
+
+
+def time_http(client, service: str):
+    """Time every request ``client`` (an ``httpx.Client`` or
+    ``httpx.AsyncClient``) sends as a ``service`` call, by endpoint; returns
+    the client.
+
+    Adds event hooks to the client, so only the clients the app creates are
+    timed, from sending a request to receiving its response headers.
+    Requests that fail before a response are not observed.
+    """
+
+    def on_request(request):
+        request.extensions[_STARTED] = time.perf_counter()
+
+    def on_response(response):
+        started = response.request.extensions.get(_STARTED)
+        if started is not None:
+            EXTERNAL_LATENCY.labels(service, _operation(response.request)).observe(
+                time.perf_counter() - started
+            )
+
+    if isinstance(client, httpx.AsyncClient):
+        sync_request, sync_response = on_request, on_response
+
+        async def on_request(request):
+            sync_request(request)
+
+        async def on_response(response):
+            sync_response(response)
+
+    hooks = client.event_hooks
+    client.event_hooks = {
+        "request": [*hooks["request"], on_request],
+        "response": [*hooks["response"], on_response],
+    }
+    return client
+
+
+def time_supabase(client):
+    """Time the calls of a Supabase ``client`` as ``supabase`` calls; returns
+    the client.
+
+    The client recreates its PostgREST and storage clients after every auth
+    change, so the factories it creates them with are wrapped on this
+    instance to time each new one.
+    """
+    time_http(client.auth._http_client, "supabase")
+    for factory in ("_init_postgrest_client", "_init_storage_client"):
+
+        def create_timed(*args, _create=getattr(client, factory), **kwargs):
+            created = _create(*args, **kwargs)
+            time_http(created.session, "supabase")
+            return created
+
+        setattr(client, factory, create_timed)
+    return client
+
+
+class TimedPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            EXTERNAL_LATENCY.labels("redis", "pipeline").observe(
+                time.perf_counter() - started
+            )
+
+
+class TimedRedis(Redis):
+    """``redis.Redis`` that times each command, and each pipeline as a whole."""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            EXTERNAL_LATENCY.labels("redis", str(args[0]).lower()).observe(
+                time.perf_counter() - started
+            )
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TimedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+def record_chat_steps(steps: dict):
+    """Observe a ``StepTimer``'s timings (milliseconds)."""
+    for step, ms in steps.items():
+        CHAT_STEP_LATENCY.labels(step).observe(ms / 1000)
+
+
+def record_poll(route: str, hit: bool):
+    POLLS.labels(route, "hit" if hit else "miss").inc()
+
+
+def record_operation(status: str):
+    OPERATIONS.labels(status).inc()
+
+
+class StatsCollector:
+    """Exports the numeric fields of ``fn()`` as ``{prefix}_{field}`` gauges,
+    read at scrape time (e.g. ``ResponseCache.stats``, kept in Redis)."""
+
+    def __init__(self, prefix: str, documentation: str, fn):
+        self._prefix = prefix
+        self._documentation = documentation
+        self._fn = fn
+
+    def describe(self):
+        return []  # Don't call fn() when registering
+
+    def collect(self):
+        try:
+            stats = self._fn()
+        except Exception as e:
+            logger.warning("Error collecting %s metrics: %s", self._prefix, e)
+            return
+        for field, value in stats.items():
+            if isinstance(value, (bool, int, float)):
+                yield GaugeMetricFamily(
+                    f"{self._prefix}_{field}", self._documentation, value=value
+                )
+
+
+_stats_collectors = []
+
+
+def register_stats(prefix: str, documentation: str, fn):
+    collector = StatsCollector(prefix, documentation, fn)
+    _stats_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def render():
+    """The exposition body and its content type."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _stats_collectors:
+            registry.register(collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class ASGIRequestTimer:
+    """ASGI middleware timing requests to the app's own routes; requests it
+    passes to a mounted Flask app are timed there by ``init_app``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = []
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            route = scope.get("route")
+            if hasattr(route, "endpoint"):  # A Route, not a Mount
+                REQUEST_LATENCY.labels(
+                    route.path, scope["method"], str(status[0] if status else 500)
+                ).observe(time.perf_counter() - started)
+
+
+def init_app(app, token: str = None):
+    """Time every request to ``app`` and serve the metrics at /metrics to
+    requests with ``Authorization: Bearer <token>``; without a ``token``,
+    /metrics answers 404."""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.get("request_started")
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            REQUEST_LATENCY.labels(
+                route, request.method, str(response.status_code)
+            ).observe(time.perf_counter() - started)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        if not token:
+            return Response("Not found\n", status=404, mimetype="text/plain")
+        if not hmac.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+        body, content_type = render()
+        return Response(body, content_type=content_type)
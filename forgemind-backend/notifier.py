@@ -0,0 +1,130 @@
+# forgemind-backend/notifier.py
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class OperationNotifier:
+    """Wakes parked long-poll requests when an operation is enqueued for a user.
+
+    Each worker process runs one background thread subscribed to the Redis
+    pattern ``ops_notify:*``; ``notify`` publishes on the user's channel so the
+    wake-up reaches whichever worker is holding that user's request. Without
+    Redis, notifications only reach waiters in the current process.
+    """
+
+    CHANNEL_PREFIX = "ops_notify:"
+
+    def __init__(self, redis_client, use_redis: bool):
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self._lock = threading.Lock()
+        self._waiters = {}  # user_id -> set of objects with a set() method
+        self._listener = None
+
+    def notify(self, user_id: str):
+        """Signal that a new operation is pending for ``user_id``."""
+        if self._use_redis:
+            try:
+                self._redis.publish(f"{self.CHANNEL_PREFIX}{user_id}", "1")
+                return
+            except Exception as e:
+                logger.warning("Redis publish failed, waking local waiters only: %s", e)
+        self._wake(user_id)
+
+    @contextmanager
+    def subscribe(self, user_id: str):
+        """Register a waiter for ``user_id`` and yield its ``threading.Event``.
+
+        Register before checking for pending work so an operation enqueued
+        between the check and the wait still sets the event.
+        """
+        event = threading.Event()
+        self._register(user_id, event)
+        try:
+            yield event
+        finally:
+            self._unregister(user_id, event)
+
+    @asynccontextmanager
+    async def subscribe_async(self, user_id: str):
+        """Like ``subscribe`` but yields an ``asyncio.Event`` so ASGI views can
+        park without holding a thread."""
+        event = asyncio.Event()
+        waiter = _AsyncWaiter(asyncio.get_running_loop(), event)
+        self._register(user_id, waiter)
+        try:
+            yield event
+        finally:
+            self._unregister(user_id, waiter)
+
+    def _register(self, user_id, waiter):
+        self._ensure_listener()
+        with self._lock:
+            self._waiters.setdefault(user_id, set()).add(waiter)
+
+    def _unregister(self, user_id, waiter):
+        with self._lock:
+            waiters = self._waiters.get(user_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[user_id]
+
+    def _wake(self, user_id: str):
+        with self._lock:
+            waiters = list(self._waiters.get(user_id, ()))
+        for event in waiters:
+            event.set()
+
+    def _ensure_listener(self):
+        # Started lazily so the thread lives in the gunicorn worker, not the pre-fork master
+        if not self._use_redis or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="ops-notifier", daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{self.CHANNEL_PREFIX}*")
+                for message in pubsub.listen():
+                    channel = message.get("channel")
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    if channel and channel.startswith(self.CHANNEL_PREFIX):
+                        self._wake(channel[len(self.CHANNEL_PREFIX) :])
+            except Exception as e:
+                logger.warning("Operation notifier lost Redis subscription: %s", e)
+                time.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+class _AsyncWaiter:
+    """Adapts an ``asyncio.Event`` so the listener thread can set it."""
+
+    def __init__(self, loop, event):
+        self._loop = loop
+        self._event = event
+
+    def set(self):
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # The event loop has already shut down
@@ -0,0 +1,286 @@
+# forgemind-backend/operations.py
+
+import json
+import logging
+import queue
+import threading
+import time
+
+from postgrest.exceptions import APIError
+
+logger = logging.getLogger(__name__)
+
+# PostgREST error code for "function not found in the schema cache"
+MISSING_FUNCTION_CODE = "PGRST202"
+
+# Statuses each transition may overwrite, so batches flushed out of order by
+# different workers can never move an operation backwards
+ALLOWED_PREVIOUS_STATUSES = {
+    "sent": ["pending"],
+    "completed": ["pending", "sent"],
+    "error": ["pending", "sent"],
+}
+
+
+class OperationStore:
+    """Hands pending operations to the plugin exactly once.
+
+    With Redis, pending operations are mirrored into a per-user list
+    ``ops:{user_id}`` that polls pop from, so polling never touches Postgres;
+    status transitions are persisted by a ``StatusWriter``. Each claim also
+    sets ``op_claimed:{id}``, which makes delivery exactly-once even if an
+    operation is queued twice (e.g. when the queue is rebuilt from Supabase
+    after Redis loses its data, or after the user's queue expired). The
+    queue expires ``queue_ttl`` seconds after the last enqueue or poll.
+
+    Without Redis, claims go straight to Supabase through the
+    ``claim_next_operation`` Postgres function (see
+    sql/claim_next_operation.sql), or a compare-and-set update until that
+    function is deployed.
+    """
+
+    QUEUE_PREFIX = "ops:"
+    CLAIMED_PREFIX = "op_claimed:"
+    HYDRATED_PREFIX = "ops_hydrated:"
+
+    # Queued fields the plugin needs to run an operation
+    QUEUED_FIELDS = ("id", "user_id", "chat_id", "python_code")
+
+    def __init__(
+        self,
+        supabase,
+        redis_client,
+        use_redis: bool,
+        claim_ttl: int,
+        queue_ttl: int = None,
+    ):
+        self._supabase = supabase
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self._claim_ttl = claim_ttl
+        self._queue_ttl = queue_ttl
+        self._rpc_available = True
+        self.status_writer = StatusWriter(supabase)
+
+    def enqueue(self, op: dict):
+        """Queue a freshly inserted ``operations`` row for its user's plugin."""
+        if not self._use_redis:
+            return
+        try:
+            self._push(
+                op["user_id"],
+                json.dumps({field: op.get(field) for field in self.QUEUED_FIELDS}),
+            )
+        except Exception as e:
+            # The row is still pending in Supabase; the queue is rebuilt from it
+            logger.warning("Error queueing operation %s in Redis: %s", op.get("id"), e)
+
+    def has_pending(self, user_id: str) -> bool:
+        if self._use_redis:
+            try:
+                self._hydrate_if_needed(user_id)
+                return self._redis.llen(f"{self.QUEUE_PREFIX}{user_id}") > 0
+            except Exception as e:
+                logger.warning("Error reading operation queue from Redis: %s", e)
+        pending_ops = (
+            self._supabase.table("operations")
+            .select("id")
+            .eq("status", "pending")
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+        return bool(pending_ops.data)
+
+    def claim_next(self, user_id: str):
+        """Mark the user's oldest pending operation as sent and return it,
+        or None if nothing is pending."""
+        if self._use_redis:
+            try:
+                return self._claim_from_queue(user_id)
+            except Exception as e:
+                logger.warning("Error claiming from Redis queue, using Supabase: %s", e)
+        return self._claim_from_supabase(user_id)
+
+    def record_status(self, op_id, user_id: str, status: str):
+        """Persist a status transition (``completed``/``error``) off the request path."""
+        self.status_writer.record(op_id, user_id, status)
+
+    def discard_chat(self, user_id: str, chat_id):
+        """Drop queued operations of a deleted chat so they are never delivered."""
+        if not self._use_redis:
+            return
+        key = f"{self.QUEUE_PREFIX}{user_id}"
+        try:
+            for raw in self._redis.lrange(key, 0, -1):
+                if json.loads(raw).get("chat_id") == chat_id:
+                    self._redis.lrem(key, 0, raw)
+        except Exception as e:
+            logger.warning(
+                "Error discarding queued operations for chat %s: %s", chat_id, e
+            )
+
+    def _claim_from_queue(self, user_id):
+        key = f"{self.QUEUE_PREFIX}{user_id}"
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.exists(f"{self.HYDRATED_PREFIX}{user_id}")
+        pipe.lpop(key)
+        hydrated, raw = pipe.execute()
+
+        if not hydrated and self._hydrate_if_needed(user_id) and raw is None:
+            raw = self._redis.lpop(key)
+
+        while raw is not None:
+            op = json.loads(raw)
+            # A duplicate of an operation another poll already claimed is skipped
+            if self._redis.set(
+                f"{self.CLAIMED_PREFIX}{op['id']}", "1", nx=True, ex=self._claim_ttl
+            ):
+                self.status_writer.record(op["id"], user_id, "sent")
+                return op
+            raw = self._redis.lpop(key)
+        return None
+
+    def _hydrate_if_needed(self, user_id) -> bool:
+        """Rebuild the user's queue from Supabase once per queue lifetime.
+
+        The marker expires with the queue (both are refreshed by polls), or
+        disappears when Redis loses its data; either way the queue needs
+        rebuilding.
+        """
+        if not self._redis.set(
+            f"{self.HYDRATED_PREFIX}{user_id}", "1", nx=True, ex=self._queue_ttl
+        ):
+            return False
+
+        pending_ops = (
+            self._supabase.table("operations")
+            .select(",".join(self.QUEUED_FIELDS))
+            .eq("status", "pending")
+            .eq("user_id", user_id)
+            .order("created_at")
+            .execute()
+        )
+        if pending_ops.data:
+            self._push(user_id, *[json.dumps(op) for op in pending_ops.data])
+        return True
+
+    def _push(self, user_id, *raw_ops):
+        key = f"{self.QUEUE_PREFIX}{user_id}"
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.rpush(key, *raw_ops)
+        if self._queue_ttl:
+            pipe.expire(key, self._queue_ttl)
+        pipe.execute()
+
+    def _claim_from_supabase(self, user_id):
+        if self._rpc_available:
+            try:
+                claimed = self._supabase.rpc(
+                    "claim_next_operation", {"p_user_id": user_id}
+                ).execute()
+                return claimed.data[0] if claimed.data else None
+            except APIError as e:
+                if e.code != MISSING_FUNCTION_CODE:
+                    raise
+                logger.warning("claim_next_operation RPC missing, using fallback claim")
+                self._rpc_available = False
+        return self._claim_with_compare_and_set(user_id)
+
+    def _claim_with_compare_and_set(self, user_id, attempts=3):
+        for _ in range(attempts):
+            pending_ops = (
+                self._supabase.table("operations")
+                .select("id")
+                .eq("status", "pending")
+                .eq("user_id", user_id)
+                .order("created_at")
+                .limit(1)
+                .execute()
+            )
+            if not pending_ops.data:
+                return None
+
+            # Only one concurrent update can match status=pending for this row
+            claimed = (
+                self._supabase.table("operations")
+                .update({"status": "sent"})
+                .eq("id", pending_ops.data[0]["id"])
+                .eq("status", "pending")
+                .execute()
+            )
+            if claimed.data:
+                return claimed.data[0]
+        return None
+
+
+class StatusWriter:
+    """Batches operation status transitions into a few Supabase updates.
+
+    A background thread drains recorded transitions every ``interval``
+    seconds and issues one ``UPDATE ... WHERE id IN (...)`` per user and
+    status. Failed batches are retried on the next flush.
+    """
+
+    def __init__(self, supabase, interval: float = 1.0, max_batch: int = 500):
+        self._supabase = supabase
+        self._interval = interval
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, op_id, user_id: str, status: str):
+        self._ensure_thread()
+        self._queue.put((op_id, user_id, status))
+
+    def _ensure_thread(self):
+        # Started lazily so the thread lives in the gunicorn worker, not the pre-fork master
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="op-status-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        retry = {}
+        while True:
+            # Later transitions of the same operation replace earlier ones
+            latest = dict(retry)
+            try:
+                op_id, user_id, status = self._queue.get(timeout=self._interval)
+                latest[op_id] = (user_id, status)
+                while len(latest) < self._max_batch:
+                    op_id, user_id, status = self._queue.get_nowait()
+                    latest[op_id] = (user_id, status)
+            except queue.Empty:
+                pass
+            retry = self._flush(latest) if latest else {}
+            if retry:
+                time.sleep(self._interval)
+
+    def _flush(self, latest):
+        batches = {}
+        for op_id, transition in latest.items():
+            batches.setdefault(transition, []).append(op_id)
+
+        failed = {}
+        for (user_id, status), op_ids in batches.items():
+            try:
+                (
+                    self._supabase.table("operations")
+                    .update({"status": status})
+                    .in_("id", op_ids)
+                    .eq("user_id", user_id)
+                    .in_("status", ALLOWED_PREVIOUS_STATUSES[status])
+                    .execute()
+                )
+            except Exception as e:
+                logger.warning(
+                    "Error persisting %s '%s' updates: %s", len(op_ids), status, e
+                )
+                failed.update({op_id: (user_id, status) for op_id in op_ids})
+        return failed
@@ -0,0 +1,120 @@
+# forgemind-backend/presence.py
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PluginPresence:
+    """Fusion plugin login/activity state, kept in one Redis hash per user.
+
+    ``presence:{user_id}`` holds ``login``, ``logged_out`` and ``last_seen``.
+    Every poll refreshes the key's TTL to ``ACTIVE_TTL``, so the plugin counts
+    as active exactly as long as the key exists; no timestamps are compared.
+    An explicit logout keeps the hash for ``LOGOUT_TTL`` so stale plugins
+    polling after logout are still rejected. Polls use ``EXPIRE NX``/``GT``
+    so they never shorten that longer TTL; on servers older than Redis 7,
+    which lack those options, a script compares the TTL instead.
+    """
+
+    KEY_PREFIX = "presence:"
+
+    # Seconds without a poll before the plugin is considered inactive
+    ACTIVE_TTL = 300
+    # How long an explicit logout is remembered
+    LOGOUT_TTL = 30 * 24 * 3600
+
+    # EXPIRE NX + GT for servers without them: only ever extend the TTL
+    EXTEND_TTL_SCRIPT = (
+        "if redis.call('TTL', KEYS[1]) < tonumber(ARGV[1]) then "
+        "return redis.call('EXPIRE', KEYS[1], ARGV[1]) end return 0"
+    )
+
+    def __init__(self, redis_client):
+        self._redis = redis_client
+        self._expire_options = None
+
+    def _supports_expire_options(self) -> bool:
+        """Whether the server takes ``EXPIRE NX``/``GT``; asked once, on the
+        first poll, so workers still start without a Redis round trip."""
+        if self._expire_options is None:
+            info = getattr(self._redis, "info", None)
+            if info is None:  # LocalStore
+                self._expire_options = True
+            else:
+                version = str(info("server").get("redis_version", "0"))
+                self._expire_options = int(version.split(".")[0]) >= 7
+                if not self._expire_options:
+                    logger.info(
+                        "Redis %s has no EXPIRE NX/GT; refreshing presence "
+                        "with a script",
+                        version,
+                    )
+        return self._expire_options
+
+    def key(self, user_id: str) -> str:
+        return f"{self.KEY_PREFIX}{user_id}"
+
+    def queue_poll(self, pipe, user_id: str):
+        """Queue the read and refresh of a plugin poll on ``pipe``.
+
+        The first result of the pipeline is the presence before this poll;
+        pass it to ``parse``. Writes are unconditional so the poll costs a
+        single round trip: ``logged_out`` is never touched here, so a
+        logged-out user stays logged out.
+        """
+        key = self.key(user_id)
+        pipe.hgetall(key)
+        pipe.hset(key, mapping={"login": "true", "last_seen": int(time.time())})
+        if self._supports_expire_options():
+            pipe.expire(key, self.ACTIVE_TTL, nx=True)
+            pipe.expire(key, self.ACTIVE_TTL, gt=True)
+        else:
+            pipe.eval(self.EXTEND_TTL_SCRIPT, 1, key, self.ACTIVE_TTL)
+
+    def get(self, user_id: str) -> dict:
+        return self.parse(self._redis.hgetall(self.key(user_id)))
+
+    def is_logged_out(self, user_id: str) -> bool:
+        return self._redis.hget(self.key(user_id), "logged_out") in (b"true", "true")
+
+    def login(self, user_id: str):
+        """Start a fresh session, clearing any logout flag and its TTL."""
+        key = self.key(user_id)
+        pipe = self._redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(
+            key,
+            mapping={
+                "login": "true",
+                "logged_out": "false",
+                "last_seen": int(time.time()),
+            },
+        )
+        pipe.expire(key, self.ACTIVE_TTL)
+        pipe.execute()
+
+    def logout(self, user_id: str):
+        key = self.key(user_id)
+        pipe = self._redis.pipeline()
+        pipe.hset(
+            key,
+            mapping={
+                "login": "false",
+                "logged_out": "true",
+                "last_seen": int(time.time()),
+            },
+        )
+        pipe.expire(key, self.LOGOUT_TTL)
+        pipe.execute()
+
+    @staticmethod
+    def parse(raw) -> dict:
+        """Decode an HGETALL reply; an empty dict means no recent presence."""
+        return {
+            (k.decode("utf-8") if isinstance(k, bytes) else k): (
+                v.decode("utf-8") if isinstance(v, bytes) else v
+            )
+            for k, v in (raw or {}).items()
+        }
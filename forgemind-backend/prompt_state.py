@@ -0,0 +1,210 @@
+# forgemind-backend/prompt_state.py
+
+"""Compact, token-budgeted rendering of the CAD state for prompts.
+
+The add-in's ``get_workspace_state()`` description holds every body's
+full-precision volume, area and bounding box and every sketch profile, so
+pasting it into a prompt grows with the design. ``compile_cad_state`` turns
+it into indented text instead:
+
+- numbers are rounded to three significant figures (lengths are in cm);
+- bodies with the same rounded measurements are listed once, with a count
+  and their names collapsed ("Bolt1..Bolt8");
+- components the instruction mentions (by component, body or sketch name)
+  keep their detail longest;
+- while over budget, the least relevant components drop to sizes only,
+  then names only, then counts only, and finally out of the listing.
+"""
+
+import json
+import re
+
+from chat_engines import estimate_tokens
+
+# Most to least detailed; see _render_component
+DETAIL_LEVELS = ("full", "sizes", "names", "counts")
+
+# Profiles listed per sketch at "full" detail
+MAX_PROFILES = 4
+
+# Default Fusion names say nothing about which entity the user means
+GENERIC_STEMS = {"body", "bodies", "sketch", "component", "root", "profile"}
+
+
+def _num(value) -> str:
+    return f"{value:.3g}" if isinstance(value, (int, float)) else "?"
+
+
+def _vector(values) -> str:
+    return "(" + ",".join(_num(v) for v in values or ()) + ")"
+
+
+def _mentioned(name: str, words: set) -> bool:
+    """Whether the instruction's ``words`` name ``name`` ("bolt3") or its
+    stem ("bolts" for Bolt3)."""
+    name = name.lower()
+    if name in words:
+        return True
+    stem = name.rstrip("0123456789 _-")
+    return (
+        len(stem) >= 3
+        and stem not in GENERIC_STEMS
+        and any(word.startswith(stem) for word in words)
+    )
+
+
+def _collapse_names(names) -> str:
+    """``Bolt1, Bolt2, Bolt3`` -> ``Bolt1..Bolt3`` when names share a stem."""
+    if len(names) <= 2:
+        return ", ".join(names)
+    matches = [re.fullmatch(r"(.*?)(\d+)", name) for name in names]
+    if all(matches) and len({m.group(1) for m in matches}) == 1:
+        numbers = sorted(int(m.group(2)) for m in matches)
+        if numbers == list(range(numbers[0], numbers[0] + len(numbers))):
+            stem = matches[0].group(1)
+            return f"{stem}{numbers[0]}..{stem}{numbers[-1]}"
+    if len(names) <= 4:
+        return ", ".join(names)
+    return f"{', '.join(names[:3])}, ... {names[-1]}"
+
+
+def _body_signature(body):
+    box = body.get("bounding_box") or {}
+    low, high = box.get("min_point") or (), box.get("max_point") or ()
+    size = tuple(_num(b - a) for a, b in zip(low, high))
+    return _num(body.get("volume")), _num(body.get("surface_area")), size
+
+
+def _group_bodies(bodies):
+    """Group bodies with identical rounded measurements, in first-seen order."""
+    groups = {}
+    for body in bodies:
+        groups.setdefault(_body_signature(body), []).append(body)
+    return list(groups.items())
+
+
+def _render_component(component, body_groups, level: str) -> list:
+    name = component.get("name") or "(unnamed)"
+    bodies = component.get("bodies") or []
+    sketches = component.get("sketches") or []
+
+    if level == "counts":
+        return [f"{name}: {len(bodies)} bodies, {len(sketches)} sketches"]
+    if level == "names":
+        lines = [f"{name}:"]
+        if bodies:
+            names = [body.get("name") or "?" for body in bodies]
+            lines.append(f"  bodies: {_collapse_names(names)}")
+        if sketches:
+            names = [sketch.get("name") or "?" for sketch in sketches]
+            lines.append(f"  sketches: {_collapse_names(names)}")
+        return lines
+
+    lines = [f"{name}:"]
+    for (volume, area, size), group in body_groups:
+        names = _collapse_names([body.get("name") or "?" for body in group])
+        count = f"{len(group)}x " if len(group) > 1 else ""
+        line = f"  body {count}{names}: size {'x'.join(size) or '?'}"
+        if level == "full":
+            line += f", volume {volume}, area {area}"
+            if len(group) == 1:
+                box = group[0].get("bounding_box") or {}
+                line += f", min {_vector(box.get('min_point'))}"
+        lines.append(line)
+    if level == "full":
+        for sketch in sketches:
+            profiles = sketch.get("profiles") or []
+            line = f"  sketch {sketch.get('name') or '?'}: {len(profiles)} profiles"
+            if profiles:
+                areas = [_num(p.get("area")) for p in profiles[:MAX_PROFILES]]
+                more = ", ..." if len(profiles) > MAX_PROFILES else ""
+                line += f" (areas {', '.join(areas)}{more})"
+            lines.append(line)
+        return lines
+
+    by_profiles = {}
+    for sketch in sketches:
+        count = len(sketch.get("profiles") or [])
+        by_profiles.setdefault(count, []).append(sketch.get("name") or "?")
+    for count, names in by_profiles.items():
+        label = f"{len(names)}x " if len(names) > 1 else ""
+        lines.append(f"  sketch {label}{_collapse_names(names)}: {count} profiles")
+    return lines
+
+
+def _relevance(component, index: int, words: set) -> tuple:
+    """Sort key: mentioned components first, then the root, then tree order."""
+    names = [component.get("name")]
+    names += [body.get("name") for body in component.get("bodies") or []]
+    names += [sketch.get("name") for sketch in component.get("sketches") or []]
+    mentioned = any(_mentioned(name, words) for name in names if name)
+    return (not mentioned, index != 0, index)
+
+
+def compile_cad_state(cad_state, instruction: str = "", budget: int = 1500):
+    """Render ``cad_state`` for a prompt in at most ``budget`` tokens.
+
+    ``cad_state`` is the description (or its JSON); anything else, such as
+    the "No CAD state found" placeholder, is passed through, cut to the
+    budget. Returns ``(text, estimated_tokens)``.
+    """
+    if isinstance(cad_state, (str, bytes)):
+        try:
+            cad_state = json.loads(cad_state)
+        except ValueError:
+            if isinstance(cad_state, bytes):
+                cad_state = cad_state.decode("utf-8", "replace")
+            text = cad_state[: budget * 4]
+            return text, estimate_tokens(text)
+    if not isinstance(cad_state, dict):
+        text = json.dumps(cad_state)[: budget * 4]
+        return text, estimate_tokens(text)
+
+    components = cad_state.get("components") or []
+    body_count = sum(len(c.get("bodies") or []) for c in components)
+    sketch_count = sum(len(c.get("sketches") or []) for c in components)
+    header = (
+        f"Design {cad_state.get('name') or '(unnamed)'}: {len(components)} "
+        f"components, {body_count} bodies, {sketch_count} sketches (lengths in cm)"
+    )
+
+    words = set(re.findall(r"[a-z0-9_-]+", (instruction or "").lower()))
+    order = sorted(
+        range(len(components)), key=lambda i: _relevance(components[i], i, words)
+    )
+    body_groups = [_group_bodies(c.get("bodies") or []) for c in components]
+    rendered = [
+        _render_component(c, groups, DETAIL_LEVELS[0])
+        for c, groups in zip(components, body_groups)
+    ]
+    costs = [estimate_tokens("\n".join(lines)) for lines in rendered]
+    total = estimate_tokens(header) + sum(costs)
+
+    # Degrade the least relevant components one level at a time
+    for level in range(1, len(DETAIL_LEVELS)):
+        for i in reversed(order):
+            if total <= budget:
+                break
+            rendered[i] = _render_component(
+                components[i], body_groups[i], DETAIL_LEVELS[level]
+            )
+            cost = estimate_tokens("\n".join(rendered[i]))
+            total += cost - costs[i]
+            costs[i] = cost
+
+    # Then leave the least relevant out altogether
+    shown = list(order)
+    while total > budget and len(shown) > 1:
+        total -= costs[shown.pop()]
+
+    lines = [header]
+    for i in sorted(shown):
+        lines.extend(rendered[i])
+    omitted = [components[i] for i in order[len(shown) :]]
+    if omitted:
+        lines.append(
+            f"... {len(omitted)} more components with "
+            f"{sum(len(c.get('bodies') or []) for c in omitted)} bodies not shown"
+        )
+    text = "\n".join(lines)
+    return text, estimate_tokens(text)
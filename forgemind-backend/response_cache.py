@@ -0,0 +1,181 @@
+# forgemind-backend/response_cache.py
+
+import hashlib
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Assistant reply fields replayed on a cache hit
+CACHED_FIELDS = ("steps", "python_code", "user_facing_response")
+
+
+def normalize_instruction(text: str) -> str:
+    """Case, whitespace and trailing punctuation don't change what the user
+    asked for: "Create a 5x5x5 cube." and "create a 5x5x5  cube" share a key."""
+    return re.sub(r"\s+", " ", text or "").strip().rstrip(".!").lower()
+
+
+def summarize_cad_state(cad_state):
+    """Canonical summary of a ``get_workspace_state()`` description.
+
+    Generated scripts refer to entities by name and position in the tree, not
+    by their measurements, so the summary keeps component, body and sketch
+    names and profile counts and drops volumes, areas and bounding boxes
+    that drift with every edit. Anything else (including the "No CAD state
+    found" placeholder) is used verbatim.
+    """
+    if isinstance(cad_state, (str, bytes)):
+        try:
+            cad_state = json.loads(cad_state)
+        except ValueError:
+            return cad_state
+    if not isinstance(cad_state, dict):
+        return cad_state
+
+    return [
+        [
+            component.get("name"),
+            [body.get("name") for body in component.get("bodies", [])],
+            [
+                [sketch.get("name"), len(sketch.get("profiles", []))]
+                for sketch in component.get("sketches", [])
+            ],
+        ]
+        for component in cad_state.get("components", [])
+    ]
+
+
+class ResponseCache:
+    """Replays assistant replies for prompts that have been answered before.
+
+    Entries are keyed on the normalized instruction plus a summary of the CAD
+    context it was sent with, and hold the reply's ``steps``, ``python_code``
+    and ``user_facing_response``. A reply is only admitted once the plugin
+    reports that its script ran successfully, and a replayed reply whose
+    script fails is evicted. Entries expire after ``ttl`` seconds and the
+    least recently used are evicted beyond ``max_entries``; hit and miss
+    counts are kept in Redis for every worker. Without Redis the cache is
+    disabled.
+    """
+
+    ENTRY_PREFIX = "chat_cache:"
+    INDEX_KEY = "chat_cache_index"  # sorted set: cache key -> last use
+    STATS_KEY = "chat_cache_stats"
+    PENDING_PREFIX = "chat_cache_pending:"  # operation_id -> reply awaiting its result
+
+    def __init__(
+        self,
+        redis_client,
+        use_redis: bool,
+        ttl: int,
+        max_entries: int,
+        pending_ttl: int = 3600,
+    ):
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._pending_ttl = pending_ttl
+
+    @staticmethod
+    def key_for(instruction: str, cad_state, cad_status: str = "") -> str:
+        canonical = json.dumps(
+            [
+                normalize_instruction(instruction),
+                summarize_cad_state(cad_state),
+                cad_status,
+            ],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Return the cached reply for ``key``, or None, counting the lookup."""
+        if not (self._use_redis and key):
+            return None
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.get(f"{self.ENTRY_PREFIX}{key}")
+            pipe.zadd(self.INDEX_KEY, {key: time.time()}, xx=True)
+            raw = pipe.execute()[0]
+            self._redis.hincrby(self.STATS_KEY, "hits" if raw else "misses", 1)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning("Error reading chat response cache: %s", e)
+            return None
+
+    def remember(self, operation_id, user_id, key, response, hit: bool):
+        """Hold ``response`` until the plugin reports how ``operation_id`` ran."""
+        if not (self._use_redis and key and operation_id):
+            return
+        record = {
+            "key": key,
+            "user_id": user_id,
+            "hit": hit,
+            "response": {field: response.get(field) for field in CACHED_FIELDS},
+        }
+        try:
+            self._redis.set(
+                f"{self.PENDING_PREFIX}{operation_id}",
+                json.dumps(record),
+                ex=self._pending_ttl,
+            )
+        except Exception as e:
+            logger.warning("Error recording chat cache candidate: %s", e)
+
+    def record_outcome(self, operation_id, user_id, succeeded: bool):
+        """Admit the operation's reply on success; evict a replayed reply that failed."""
+        if not (self._use_redis and operation_id):
+            return
+        try:
+            pending_key = f"{self.PENDING_PREFIX}{operation_id}"
+            raw = self._redis.get(pending_key)
+            record = json.loads(raw) if raw else None
+            if not record or record["user_id"] != user_id:
+                return
+            self._redis.delete(pending_key)
+            if succeeded:
+                self._admit(record["key"], record["response"])
+            elif record["hit"]:
+                self._evict([record["key"]])
+        except Exception as e:
+            logger.warning("Error updating chat response cache: %s", e)
+
+    def stats(self) -> dict:
+        if not self._use_redis:
+            return {"enabled": False}
+        counts = self._redis.hgetall(self.STATS_KEY)
+        hits = int(counts.get(b"hits", 0))
+        misses = int(counts.get(b"misses", 0))
+        return {
+            "enabled": True,
+            "entries": self._redis.zcard(self.INDEX_KEY),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def _admit(self, key, response):
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.set(f"{self.ENTRY_PREFIX}{key}", json.dumps(response), ex=self._ttl)
+        pipe.zadd(self.INDEX_KEY, {key: time.time()})
+        pipe.zcard(self.INDEX_KEY)
+        overflow = pipe.execute()[-1] - self._max_entries
+        if overflow > 0:
+            # Members whose entries already expired are dropped the same way
+            evicted = self._redis.zpopmin(self.INDEX_KEY, overflow)
+            self._evict([member for member, _ in evicted], index=False)
+
+    def _evict(self, keys, index=True):
+        if not keys:
+            return
+        keys = [k.decode("utf-8") if isinstance(k, bytes) else k for k in keys]
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.delete(*(f"{self.ENTRY_PREFIX}{key}" for key in keys))
+        if index:
+            pipe.zrem(self.INDEX_KEY, *keys)
+        pipe.execute()
@@ -0,0 +1,147 @@
+# forgemind-backend/retention.py
+
+"""How long per-user state stays in Redis, and how large it may grow.
+
+Each per-user key family (``cad_state:{user_id}`` and so on) gets a TTL
+that is set when the key is written and refreshed by every plugin poll, so
+the state of users who stop polling expires instead of piling up. A CAD
+state larger than the per-user budget is cut down by ``encode_within``
+before it is stored, and stored messages are truncated.
+
+``StateRetention.stats`` reports key counts and bytes per family, for
+/admin/state_stats.
+"""
+
+import copy
+
+
+def _keep_first(state, field, count):
+    for component in state.get("components") or []:
+        if isinstance(component.get(field), list):
+            component[field] = component[field][:count]
+
+
+def _reductions(state):
+    """Ever smaller versions of ``state``: sketch profiles go first, then
+    sketches and body measurements, then bodies and components beyond the
+    first few."""
+    components = state.get("components") or []
+
+    for component in components:
+        for sketch in component.get("sketches") or []:
+            sketch.pop("profiles", None)
+    yield state
+    for component in components:
+        component.pop("sketches", None)
+    yield state
+    for component in components:
+        for body in component.get("bodies") or []:
+            for field in ("bounding_box", "surface_area"):
+                body.pop(field, None)
+    yield state
+
+    count = max((len(c.get("bodies") or []) for c in components), default=0)
+    while count > 1:
+        count //= 2
+        _keep_first(state, "bodies", count)
+        yield state
+    count = len(components)
+    while count > 1:
+        count //= 2
+        state["components"] = components[:count]
+        yield state
+
+
+def encode_within(state, max_bytes: int, encode):
+    """Return ``(encode(state), False)``, or if that is larger than
+    ``max_bytes``, ``(encode(reduced), True)`` for the first reduction of the
+    state (marked ``"truncated": true``) that fits, or the smallest one.
+    ``state`` itself is never modified."""
+    encoded = encode(state)
+    if not max_bytes or len(encoded) <= max_bytes or not isinstance(state, dict):
+        return encoded, False
+
+    reduced = copy.deepcopy(state)
+    reduced["truncated"] = True
+    for reduced in _reductions(reduced):
+        encoded = encode(reduced)
+        if len(encoded) <= max_bytes:
+            break
+    return encoded, True
+
+
+class StateRetention:
+    """TTLs per key family, refreshed by plugin activity, and a report of
+    what is stored. ``ttls`` maps key prefixes (``"cad_state:"``) to
+    seconds."""
+
+    # Keys fetched per round trip while collecting stats
+    STATS_BATCH = 500
+
+    def __init__(self, redis_client, ttls: dict, max_message_chars: int = 4000):
+        self._redis = redis_client
+        self.ttls = ttls
+        self.max_message_chars = max_message_chars
+
+    def ttl(self, prefix: str):
+        return self.ttls.get(prefix)
+
+    def queue_refresh(self, pipe, user_id: str) -> int:
+        """Queue a TTL refresh of the user's keys on ``pipe``; returns the
+        number of commands queued."""
+        for prefix, ttl in self.ttls.items():
+            pipe.expire(f"{prefix}{user_id}", ttl)
+        return len(self.ttls)
+
+    def message(self, text) -> str:
+        text = str(text)
+        if len(text) <= self.max_message_chars:
+            return text
+        return text[: self.max_message_chars] + "... (truncated)"
+
+    def stats(self, limit: int = 100000) -> dict:
+        """Key count, bytes (Redis ``MEMORY USAGE``) and keys without a TTL
+        per family, over at most ``limit`` keys."""
+        families = {}
+        scanned = 0
+        complete = True
+        batch = []
+
+        def flush():
+            pipe = self._redis.pipeline(transaction=False)
+            for key in batch:
+                pipe.memory_usage(key)
+                pipe.ttl(key)
+            results = pipe.execute()
+            for key, size, ttl in zip(batch, results[::2], results[1::2]):
+                if ttl == -2:  # Expired since the scan
+                    continue
+                name = key.decode("utf-8") if isinstance(key, bytes) else key
+                prefix, colon, _ = name.partition(":")
+                family = families.setdefault(
+                    prefix + colon, {"keys": 0, "bytes": 0, "without_ttl": 0}
+                )
+                family["keys"] += 1
+                family["bytes"] += size or 0
+                family["without_ttl"] += ttl == -1
+            batch.clear()
+
+        for key in self._redis.scan_iter(count=self.STATS_BATCH):
+            if scanned >= limit:
+                complete = False
+                break
+            scanned += 1
+            batch.append(key)
+            if len(batch) >= self.STATS_BATCH:
+                flush()
+        if batch:
+            flush()
+
+        return {
+            "families": dict(
+                sorted(families.items(), key=lambda item: -item[1]["bytes"])
+            ),
+            "keys": sum(family["keys"] for family in families.values()),
+            "bytes": sum(family["bytes"] for family in families.values()),
+            "complete": complete,
+        }
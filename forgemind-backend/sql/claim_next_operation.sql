@@ -0,0 +1,21 @@
+-- Atomically hand the oldest pending operation for a user to the plugin.
+-- Used by OperationStore.claim_next (operations.py); run once in the Supabase SQL editor.
+-- SKIP LOCKED lets concurrent claims for the same user pick different rows
+-- instead of blocking, and each row is returned to exactly one caller.
+create or replace function claim_next_operation(p_user_id uuid)
+returns setof operations
+language sql
+as $$
+  update operations
+     set status = 'sent'
+   where id = (
+         select id
+           from operations
+          where user_id = p_user_id
+            and status = 'pending'
+          order by created_at
+          limit 1
+            for update skip locked
+         )
+  returning *;
+$$;
@@ -0,0 +1,103 @@
+# forgemind-backend/streaming.py
+
+import json
+
+
+class JsonStringFieldStreamer:
+    """Incrementally extracts one top-level string field from a streamed JSON object.
+
+    Feed it raw text deltas as the assistant produces them; each call returns
+    the newly decoded characters of ``field`` so they can be forwarded before
+    the JSON document is complete. Keys and values of other fields are skipped.
+    """
+
+    def __init__(self, field: str):
+        self._field = field
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._expect_key = False
+        self._key = None
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._capturing = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        buffer = self._buffer
+        end = len(buffer)
+        decoded = []
+        i = self._pos
+
+        while i < end:
+            ch = buffer[i]
+
+            if self._capturing:
+                if ch == "\\":
+                    escape_len = self._escape_length(buffer, i)
+                    if escape_len is None:
+                        break  # Wait for the rest of the escape sequence
+                    decoded.append(json.loads(f'"{buffer[i : i + escape_len]}"'))
+                    i += escape_len
+                    continue
+                if ch == '"':
+                    self._capturing = False
+                else:
+                    decoded.append(ch)
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._key = buffer[self._string_start : i]
+                i += 1
+                continue
+
+            if ch == '"':
+                if self._depth == 1 and not self._expect_key and self._key == self._field:
+                    self._capturing = True
+                else:
+                    self._in_string = True
+                    self._string_start = i + 1
+            elif ch in "{[":
+                self._depth += 1
+                self._expect_key = ch == "{" and self._depth == 1
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and ch == ":":
+                self._expect_key = False
+            elif self._depth == 1 and ch == ",":
+                self._expect_key = True
+                self._key = None
+            i += 1
+
+        self._pos = i
+        return "".join(decoded)
+
+    @staticmethod
+    def _escape_length(buffer: str, i: int):
+        """Length of the escape sequence at ``buffer[i]``, or None if incomplete."""
+        if i + 1 >= len(buffer):
+            return None
+        if buffer[i + 1] != "u":
+            return 2
+        if i + 6 > len(buffer):
+            return None
+        # A high surrogate must be decoded together with the low surrogate that follows
+        if 0xD800 <= int(buffer[i + 2 : i + 6], 16) <= 0xDBFF:
+            if i + 12 > len(buffer):
+                return None
+            return 12
+        return 6
+
+
+def sse_event(event: str, data) -> str:
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
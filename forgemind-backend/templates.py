@@ -0,0 +1,436 @@
+# forgemind-backend/templates.py
+
+"""Fast path for primitive CAD requests.
+
+Instructions like "Create a 5x5x5 cube" or "make a cylinder with radius 10mm
+and height 3cm" map directly onto the parameterized scripts curated in
+forgemind-ai's text_to_fusion dataset. ``match_template`` recognizes them and
+renders the script itself, so /chat can skip the assistant run. It only
+answers when every word of the instruction is accounted for; anything it
+doesn't fully understand ("a cube with a hole", "on top of the box") returns
+None and goes to the assistant.
+
+Lengths are in Fusion's internal unit, centimetres, unless a unit is given.
+"""
+
+import re
+
+# Centimetres per unit
+UNITS = {
+    "mm": 0.1,
+    "millimeter": 0.1,
+    "millimeters": 0.1,
+    "millimetre": 0.1,
+    "millimetres": 0.1,
+    "cm": 1.0,
+    "centimeter": 1.0,
+    "centimeters": 1.0,
+    "centimetre": 1.0,
+    "centimetres": 1.0,
+    "m": 100.0,
+    "meter": 100.0,
+    "meters": 100.0,
+    "metre": 100.0,
+    "metres": 100.0,
+    "in": 2.54,
+    "inch": 2.54,
+    "inches": 2.54,
+    '"': 2.54,
+}
+
+_NUMBER = r"(?:\d+(?:\.\d*)?|\.\d+)"
+_UNIT = "|".join(sorted((re.escape(u) for u in UNITS), key=len, reverse=True))
+_LENGTH = rf"{_NUMBER}\s*(?:(?:{_UNIT})(?![a-z]))?"
+
+_PREFIX = re.compile(
+    r"^(?:(?:please|can you|could you|i want|i need|give me)\s+)*"
+    r"(?:(?:create|make|draw|add|build|model|generate|insert)\s+)?"
+    r"(?:(?:a|an|one|new|simple|solid)\s+)*"
+)
+_SUFFIX = re.compile(r"(?:\s+(?:please|for me|at the origin))*$")
+
+# Word that names the primitive, in the order they are tried
+SHAPES = tuple(
+    (intent, re.compile(rf"(?<![a-z])(?:{words})(?![a-z])"))
+    for intent, words in (
+        ("hollow_cylinder", "hollow cylinder|tube|pipe"),
+        ("cube", "cube"),
+        ("box", "rectangular prism|cuboid|box|block"),
+        ("disk", "disk|disc"),
+        ("cylinder", "cylinder|rod"),
+    )
+)
+
+# Dimension names, and the parameter each fills
+_NAMED = {
+    "side": "size",
+    "side length": "size",
+    "size": "size",
+    "edge": "size",
+    "edge length": "size",
+    "width": "width",
+    "length": "length",
+    "depth": "depth",
+    "height": "height",
+    "thickness": "thickness",
+    "radius": "radius",
+    "diameter": "diameter",
+    "outer radius": "radius",
+    "outer diameter": "diameter",
+    "inner radius": "inner_radius",
+    "inner diameter": "inner_diameter",
+    "wall thickness": "wall",
+}
+_ADJECTIVES = {
+    "tall": "height",
+    "high": "height",
+    "long": "length",
+    "wide": "width",
+    "deep": "depth",
+    "thick": "thickness",
+    "radius": "radius",
+    "diameter": "diameter",
+    "in diameter": "diameter",
+    "in radius": "radius",
+    "side": "size",
+    "sides": "size",
+}
+
+
+def _alternation(words):
+    return "|".join(sorted((re.escape(w) for w in words), key=len, reverse=True))
+
+
+_SUFFIX_ONLY = {k: v for k, v in _ADJECTIVES.items() if k not in _NAMED}
+_SUFFIX_OR_NAME = {k: v for k, v in _ADJECTIVES.items() if k in _NAMED}
+
+# Clause patterns in the order they consume the instruction. Words like
+# "radius" can name the length before or after them, so "10mm diameter 30mm
+# tall" binds the unambiguous "30mm tall" first, then "diameter" as a prefix,
+# and only then as a suffix.
+_CLAUSES = (
+    # "5x5x5", "10 by 40 by 12 mm"
+    ("dims", re.compile(rf"({_LENGTH}(?:\s*(?:x|by|\*)\s*{_LENGTH}){{1,2}})")),
+    # "30mm tall", "10 cm in diameter"
+    (
+        "suffix",
+        re.compile(rf"({_LENGTH})\s+({_alternation(_SUFFIX_ONLY)})(?![a-z])"),
+    ),
+    # "radius of 5mm", "height: 20"
+    (
+        "named",
+        re.compile(
+            rf"({_alternation(_NAMED)})\s*(?:of|=|:|is)?\s*({_LENGTH})(?![\d.])"
+        ),
+    ),
+    # "5 cm radius"
+    (
+        "suffix",
+        re.compile(rf"({_LENGTH})\s+({_alternation(_SUFFIX_OR_NAME)})(?![a-z])"),
+    ),
+    # A bare length, as in "a 20mm cube"
+    ("bare", re.compile(rf"({_LENGTH})(?![\d.])")),
+)
+# A dimension name followed by "<length> <adjective>": in "10mm diameter 30mm
+# tall" the name ends the length before it, but in "radius 1 long 20" it names
+# the length after it and the adjective starts the next one. Only the first
+# reading, with a length before the name, is understood.
+_NAME_THEN_SUFFIX = re.compile(
+    rf"(?:({_LENGTH})\s+)?(?<![a-z])(?:{_alternation(_NAMED)})"
+    rf"\s*(?:of|=|:|is)?\s*{_LENGTH}\s+(?:{_alternation(_SUFFIX_ONLY)})(?![a-z])"
+)
+_DELETE_ALL = re.compile(
+    r"(?:delete|remove|clear) (?:all|everything)"
+    r"(?: (?:bodies|sketches|bodies and sketches))?"
+    r"|clear (?:the )?(?:workspace|design|canvas)"
+)
+_FILLET_ALL = re.compile(
+    rf"fillet (?:all (?:the )?)?edges (?:with (?:a )?)?"
+    rf"(?:(?:radius (?:of )?)?({_LENGTH})|({_LENGTH}) (?:radius|fillets?))"
+)
+_DIMS_SEPARATOR = re.compile(r"\s*(?:x|by|\*)\s*")
+_TRAILING_UNIT = re.compile(rf"(?:{_UNIT})$")
+_FILLER = re.compile(r"\b(?:with|and|of|a|an|that|is|has|having|each|all)\b|[,;]")
+
+
+def _to_cm(length: str) -> float:
+    match = re.fullmatch(rf"({_NUMBER})\s*((?:{_UNIT})?)", length.strip())
+    return round(float(match.group(1)) * UNITS.get(match.group(2), 1.0), 6)
+
+
+def parse_instruction(text: str):
+    """Return ``(intent, params)`` for a fully understood primitive request, else None.
+
+    ``params`` maps parameter names (``size``, ``radius``, ``height``...) to
+    centimetres; bare lengths are collected under ``"lengths"`` in order.
+    """
+    text = re.sub(r"\s+", " ", (text or "").lower().replace("×", "x")).strip()
+    text = text.rstrip(".!")
+    text = _SUFFIX.sub("", _PREFIX.sub("", text, count=1))
+
+    if _DELETE_ALL.fullmatch(text):
+        return "delete_all", {}
+
+    fillet = _FILLET_ALL.fullmatch(text)
+    if fillet:
+        return "fillet_all", {"radius": _to_cm(fillet.group(1) or fillet.group(2))}
+
+    for intent, pattern in SHAPES:
+        shape = pattern.search(text)
+        if shape:
+            break
+    else:
+        return None
+
+    params = {"lengths": []}
+    rest = f"{text[:shape.start()]} , {text[shape.end():]}"
+    if any(m.group(1) is None for m in _NAME_THEN_SUFFIX.finditer(rest)):
+        return None
+    for kind, clause in _CLAUSES:
+        for match in clause.finditer(rest):
+            if kind == "dims":
+                if "dims" in params:
+                    return None
+                values = _DIMS_SEPARATOR.split(match.group(1))
+                # A unit written once at the end applies to every value
+                unit = _TRAILING_UNIT.search(values[-1])
+                params["dims"] = [
+                    _to_cm(v if _TRAILING_UNIT.search(v) or not unit else v + unit[0])
+                    for v in values
+                ]
+            elif kind == "bare":
+                params["lengths"].append(_to_cm(match.group(1)))
+            else:
+                if kind == "named":
+                    name, length = _NAMED[match.group(1)], match.group(2)
+                else:
+                    name, length = _ADJECTIVES[match.group(2)], match.group(1)
+                if name in params:
+                    return None  # Given twice; can't tell which one was meant
+                params[name] = _to_cm(length)
+        rest = clause.sub(" ", rest)
+
+    # Anything left over is something the template can't express
+    if _FILLER.sub(" ", rest).strip():
+        return None
+    return intent, params
+
+
+BOX_NAMES = {"width", "depth", "length", "height", "thickness"}
+CYLINDER_NAMES = {"radius", "diameter", "height", "length", "thickness"}
+HOLLOW_CYLINDER_NAMES = CYLINDER_NAMES | {"inner_radius", "inner_diameter", "wall"}
+
+
+def _resolve(intent, params):
+    """Map parsed parameters onto the template's arguments, or None if they
+    are missing, contradictory or out of range."""
+    dims = params.get("dims", [])
+    lengths = params.get("lengths", [])
+    named = {k: v for k, v in params.items() if k not in ("dims", "lengths")}
+
+    def radius(prefix=""):
+        if f"{prefix}radius" in named and f"{prefix}diameter" in named:
+            return None
+        if f"{prefix}radius" in named:
+            return named[f"{prefix}radius"]
+        if f"{prefix}diameter" in named:
+            return named[f"{prefix}diameter"] / 2
+        return None
+
+    if intent == "cube":
+        # One size, or all three of the same
+        sizes = dims + lengths + ([named["size"]] if "size" in named else [])
+        if len(sizes) not in (1, 3) or len(set(sizes)) != 1 or set(named) - {"size"}:
+            return None
+        values = {"size": sizes[0]}
+    elif intent == "box":
+        if len(dims) == 3 and not lengths and not named:
+            width, depth, height = dims
+        elif not dims and not lengths and set(named) <= BOX_NAMES:
+            width = named.get("width")
+            depth = named.get("depth", named.get("length"))
+            height = named.get("height", named.get("thickness"))
+        else:
+            return None
+        values = {"width": width, "depth": depth, "height": height}
+    elif intent in ("cylinder", "disk"):
+        height_name = "height" if intent == "cylinder" else "thickness"
+        height = named.get("height", named.get("length", named.get("thickness")))
+        if dims or lengths or not set(named) <= CYLINDER_NAMES:
+            return None
+        values = {"radius": radius(), height_name: height}
+    elif intent == "hollow_cylinder":
+        outer = radius()
+        inner = radius("inner_")
+        if inner is None and outer is not None and "wall" in named:
+            inner = outer - named["wall"]
+        height = named.get("height", named.get("length"))
+        if dims or lengths or not set(named) <= HOLLOW_CYLINDER_NAMES:
+            return None
+        values = {"outer_radius": outer, "inner_radius": inner, "height": height}
+        if None not in values.values() and not 0 < inner < outer:
+            return None
+    else:
+        values = {k: v for k, v in named.items()}
+
+    if any(v is None or v <= 0 for v in values.values()):
+        return None
+    return values
+
+
+_HEADER = """app = adsk.core.Application.get()
+design = adsk.fusion.Design.cast(app.activeProduct)
+rootComp = design.rootComponent
+"""
+
+_EXTRUDE = """
+extrudes = rootComp.features.extrudeFeatures
+extInput = extrudes.createInput(
+    profile, adsk.fusion.FeatureOperations.NewBodyFeatureOperation
+)
+extInput.setDistanceExtent(False, adsk.core.ValueInput.createByReal({height!r}))
+extrude = extrudes.add(extInput)
+"""
+
+TEMPLATES = {
+    "cube": (
+        "a {size:g} cm cube",
+        ["Sketch a {size:g} cm square on the XY plane", "Extrude it {size:g} cm"],
+        _HEADER
+        + """
+# Square base on the XY plane
+sketch = rootComp.sketches.add(rootComp.xYConstructionPlane)
+sketch.sketchCurves.sketchLines.addTwoPointRectangle(
+    adsk.core.Point3D.create(0, 0, 0), adsk.core.Point3D.create({size!r}, {size!r}, 0)
+)
+profile = sketch.profiles.item(0)
+"""
+        + _EXTRUDE.replace("{height!r}", "{size!r}"),
+    ),
+    "box": (
+        "a {width:g} x {depth:g} x {height:g} cm box",
+        [
+            "Sketch a {width:g} x {depth:g} cm rectangle on the XY plane",
+            "Extrude it {height:g} cm",
+        ],
+        _HEADER
+        + """
+# Rectangular base on the XY plane
+sketch = rootComp.sketches.add(rootComp.xYConstructionPlane)
+sketch.sketchCurves.sketchLines.addTwoPointRectangle(
+    adsk.core.Point3D.create(0, 0, 0), adsk.core.Point3D.create({width!r}, {depth!r}, 0)
+)
+profile = sketch.profiles.item(0)
+"""
+        + _EXTRUDE,
+    ),
+    "cylinder": (
+        "a cylinder with a {radius:g} cm radius and {height:g} cm height",
+        [
+            "Sketch a circle of radius {radius:g} cm on the XY plane",
+            "Extrude it {height:g} cm",
+        ],
+        _HEADER
+        + """
+# Circular base on the XY plane
+sketch = rootComp.sketches.add(rootComp.xYConstructionPlane)
+circles = sketch.sketchCurves.sketchCircles
+circles.addByCenterRadius(adsk.core.Point3D.create(0, 0, 0), {radius!r})
+profile = sketch.profiles.item(0)
+"""
+        + _EXTRUDE,
+    ),
+    "disk": (
+        "a disk with a {radius:g} cm radius, {thickness:g} cm thick",
+        [
+            "Sketch a circle of radius {radius:g} cm on the XZ plane",
+            "Extrude it {thickness:g} cm",
+        ],
+        _HEADER
+        + """
+# Circle on the XZ plane
+sketch = rootComp.sketches.add(rootComp.xZConstructionPlane)
+circles = sketch.sketchCurves.sketchCircles
+circles.addByCenterRadius(adsk.core.Point3D.create(0, 0, 0), {radius!r})
+profile = sketch.profiles.item(0)
+"""
+        + _EXTRUDE.replace("{height!r}", "{thickness!r}"),
+    ),
+    "hollow_cylinder": (
+        "a hollow cylinder with {outer_radius:g} cm outer and {inner_radius:g} cm"
+        " inner radius, {height:g} cm tall",
+        [
+            "Sketch concentric circles of radius {outer_radius:g} cm and"
+            " {inner_radius:g} cm on the XY plane",
+            "Extrude the ring between them {height:g} cm",
+        ],
+        _HEADER
+        + """
+# Concentric circles on the XY plane; the ring between them is the wall
+sketch = rootComp.sketches.add(rootComp.xYConstructionPlane)
+circles = sketch.sketchCurves.sketchCircles
+circles.addByCenterRadius(adsk.core.Point3D.create(0, 0, 0), {outer_radius!r})
+circles.addByCenterRadius(adsk.core.Point3D.create(0, 0, 0), {inner_radius!r})
+profile = [p for p in sketch.profiles if p.profileLoops.count == 2][0]
+"""
+        + _EXTRUDE,
+    ),
+    "delete_all": (
+        "cleared all bodies and sketches",
+        ["Delete every body", "Delete every sketch"],
+        _HEADER
+        + """
+for body in list(rootComp.bRepBodies):
+    body.deleteMe()
+for sketch in list(rootComp.sketches):
+    sketch.deleteMe()
+""",
+    ),
+    "fillet_all": (
+        "filleted every edge of every body with a {radius:g} cm radius",
+        [
+            "Collect the edges of each body",
+            "Fillet them with a {radius:g} cm radius, one fillet per body",
+        ],
+        _HEADER
+        + """
+radius = adsk.core.ValueInput.createByReal({radius!r})
+for component in design.allComponents:
+    fillets = component.features.filletFeatures
+    for body in list(component.bRepBodies):
+        edges = adsk.core.ObjectCollection.create()
+        for edge in body.edges:
+            edges.add(edge)
+        if edges.count == 0:
+            continue
+        filletInput = fillets.createInput()
+        filletInput.addConstantRadiusEdgeSet(edges, radius, True)
+        fillets.add(filletInput)
+""",
+    ),
+}
+
+
+def match_template(text: str):
+    """Render the reply for a primitive request without the assistant.
+
+    Returns a dict shaped like the assistant's JSON reply (``steps``,
+    ``python_code``, ``user_facing_response``), or None when the instruction
+    isn't confidently one of the templates.
+    """
+    parsed = parse_instruction(text)
+    if parsed is None:
+        return None
+    intent, params = parsed
+    values = _resolve(intent, params)
+    if values is None:
+        return None
+
+    summary, steps, code = TEMPLATES[intent]
+    description = summary.format(**values)
+    verb = "" if intent in ("delete_all", "fillet_all") else "created "
+    return {
+        "steps": [step.format(**values) for step in steps],
+        "python_code": code.format(**values),
+        "user_facing_response": f"I {verb}{description}.",
+    }
@@ -0,0 +1,61 @@
+import copy
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+from cad_state import PatchError, apply_patch, state_hash  # noqa: E402
+
+# The add-in's package imports adsk; its diffing module is plain Python
+_spec = importlib.util.spec_from_file_location(
+    "state_delta", BACKEND.parent / "forgemind-fusion" / "logic" / "state_delta.py"
+)
+state_delta = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(state_delta)
+
+OLD = {
+    "design": "Part 1",
+    "bodies": [{"name": "Body1", "volume": 1.0}, {"name": "Body2", "volume": 2.0}],
+    "sketches": {"Sketch1": {"profiles": 1}},
+    "": {"empty key": True},
+    "a/b": 1,
+    "m~n": [1, 2, 3],
+}
+NEW = {
+    "design": "Part 1 v2",
+    "bodies": [{"name": "Body1", "volume": 1.5}],
+    "sketches": {"Sketch1": {"profiles": 2}, "Sketch2": {"profiles": 0}},
+    "": {"empty key": False, "/": "slash"},
+    "a/b": None,
+    "m~n": [1, 2, 3, 4],
+}
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        (OLD, NEW),
+        (NEW, OLD),
+        ({}, NEW),
+        (OLD, {}),
+        ([1, {"x": 2}], [{"x": 2}]),
+    ],
+)
+def test_diff_round_trips_through_apply_patch(old, new):
+    patch = state_delta.diff_states(old, new)
+    assert apply_patch(copy.deepcopy(old), patch) == new
+    assert state_delta.state_hash(new) == state_hash(new)
+
+
+def test_empty_keys_keep_their_slashes():
+    patch = [{"op": "replace", "path": "//m~0n", "value": 1}]
+    assert apply_patch({"": {"m~n": 0}}, patch) == {"": {"m~n": 1}}
+
+
+def test_relative_path_is_rejected():
+    with pytest.raises(PatchError):
+        apply_patch({"a": 1}, [{"op": "replace", "path": "a", "value": 2}])
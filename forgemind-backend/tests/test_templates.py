@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from templates import _resolve, match_template, parse_instruction  # noqa: E402
+
+
+def resolve(text):
+    parsed = parse_instruction(text)
+    return parsed and (parsed[0], _resolve(*parsed))
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # A name right before "<number> <adjective>" could own either number
+        "make a rod radius 1 long 20",
+        "create a disk radius 3 thick 1",
+        "create a cylinder radius 2 tall 5",
+        # Cubes take one size or three equal ones
+        "create a 5x5 cube",
+        "create a 5x5x6 cube",
+    ],
+)
+def test_ambiguous_prompts_fall_through(text):
+    assert match_template(text) is None
+
+
+@pytest.mark.parametrize(
+    "text, intent, values",
+    [
+        ("make a cylinder 10mm diameter 30mm tall", "cylinder",
+         {"radius": 0.5, "height": 3.0}),
+        ("make a cylinder with radius 2 and height 5", "cylinder",
+         {"radius": 2.0, "height": 5.0}),
+        ("create a disk 3 radius 1 thick", "disk",
+         {"radius": 3.0, "thickness": 1.0}),
+        ("create a 5x5x5 cube", "cube", {"size": 5.0}),
+        ("a 20mm cube", "cube", {"size": 2.0}),
+    ],
+)
+def test_dimensions_bind_to_their_names(text, intent, values):
+    resolved = resolve(text)
+    assert resolved and resolved[1], text
+    assert resolved[0] == intent
+    for name, value in values.items():
+        assert resolved[1][name] == pytest.approx(value)
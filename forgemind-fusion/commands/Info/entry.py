@@ -15,8 +15,16 @@ from ...commands.Login import entry as login
 import base64
 import os
 from ... import config
-from ...logic import run_logic, get_workspace_state, set_active_chat, debug_log
+from ...logic import (
+    run_logic,
+    get_workspace_state,
+    set_active_chat,
+    debug_log,
+    invalidate_workspace_state,
+    StateUploader,
+)
 from ...lib import fusionAddInUtils as futil
+from ...lib import http_utils
 import threading
 import json
 import urllib.request
@@ -43,10 +51,25 @@ ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resource
 
 # Holds references to event handlers
 local_handlers = []
-# Holds reference to the timer
-timer = None
-# Flag to check if the timer is running
-is_timer_running = False
+# Holds reference to the long-poll thread
+poll_thread = None
+# Holds reference to the thread uploading design changes between polls
+state_sync_thread = None
+# Set to stop the current long-poll and state upload threads
+poll_stop_event = None
+# Set by Fusion events when the design may have changed
+design_changed = threading.Event()
+# Flag to check if polling is running
+is_polling = False
+
+# Seconds the backend may park a /wait_for_operation request before answering
+LONG_POLL_TIMEOUT = 20
+# Seconds to back off before retrying after a failed or skipped poll
+POLL_RETRY_INTERVAL = 2
+# Seconds to let a burst of design changes settle before uploading the state
+STATE_SYNC_DELAY = 1
+# Sends the workspace state as a hash or patch when the backend already has it
+state_uploader = StateUploader()
 
 
 def save_and_compress_screenshot(filename_prefix):
@@ -76,6 +99,12 @@ def delete_files(*file_paths):
 
 
 def get_logic():
+    """Run one long-poll cycle against /wait_for_operation.
+
+    Returns True when the backend answered normally (an operation was handled
+    or the wait timed out) so the caller can re-poll immediately; returns a
+    falsy value on errors so the caller backs off.
+    """
     # Check authentication first - don't poll if not authenticated
     from ...commands.Login import entry as login
 
@@ -84,27 +113,33 @@ def get_logic():
         return
 
     # Get workspace description
-    workspace_desc = get_workspace_state()
-
-    # Add user_id to the request
-    workspace_desc["user_id"] = login.get_user_id()
-
-    json_payload = json.dumps(workspace_desc).encode("utf-8")
-
-    # Call /poll first with workspace description
-    poll_req = urllib.request.Request(
-        f"{config.API_BASE_URL}/poll",
-        data=json_payload,
-        headers={"Content-Type": "application/json"},
-        method="POST",
+    workspace_desc = get_workspace_state() or {}
+
+    # Park on /wait_for_operation until the backend has an operation for us
+    token = login.get_auth_token()
+    poll_req = http_utils.msgpack_request(
+        f"{config.API_BASE_URL}/wait_for_operation",
+        {
+            **state_uploader.encode(workspace_desc.get("cad_state")),
+            "user_id": login.get_user_id(),
+            "timeout": LONG_POLL_TIMEOUT,
+        },
+        token=token,
     )
     try:
-        poll_response = urllib.request.urlopen(poll_req)
+        poll_response = urllib.request.urlopen(poll_req, timeout=LONG_POLL_TIMEOUT + 10)
     except urllib.error.HTTPError as e:
+        # The backend may not have applied this upload; send the full state next time
+        state_uploader.reset()
         # Check if this is an authentication error from server
         if e.code == 401:
             try:
-                error_data = json.loads(e.read().decode("utf-8"))
+                error_data = json.loads(http_utils.read_body(e))
+                # An expired access token: poll again with a refreshed one
+                if not error_data.get("explicit_logout") and login.refresh_auth_token(
+                    rejected_token=token
+                ):
+                    return True
                 if error_data.get("authentication_required"):
                     futil.log(
                         "entry.py::get_logic - Server indicates authentication required, stopping polling"
@@ -128,78 +163,38 @@ def get_logic():
         futil.log(f"entry.py::get_logic - Error in poll request: {e}")
         return
     except Exception as e:
+        state_uploader.reset()
         futil.log(f"entry.py::get_logic - General error in poll request: {e}")
         return
 
     if poll_response.getcode() != 200:
+        state_uploader.reset()
         futil.log("entry.py::get_logic - Non-200 status from poll request")
         return None
 
-    poll_data = poll_response.read().decode("utf-8")
+    poll_data = http_utils.read_body(poll_response)
     poll_json = json.loads(poll_data)
 
+    if poll_json.get("resync_cad_state"):
+        futil.log("entry.py::get_logic - Backend requested a full workspace state")
+        state_uploader.reset()
+
     if not poll_json.get("status"):
         # futil.log("entry.py::get_logic - No instructions found when polling")
-        return None
-
-    futil.log(
-        f"entry.py::get_logic - Polling message: {poll_json.get('message', '[NO MESSAGE]')}"
-    )
-
-    # Call /get_instructions
-    req = urllib.request.Request(
-        f"{config.API_BASE_URL}/get_instructions",
-        data=json_payload,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-
-    try:
-        response = urllib.request.urlopen(req)
-    except urllib.error.HTTPError as e:
-        # Check if this is an authentication error
-        if e.code == 401:
-            try:
-                error_data = json.loads(e.read().decode("utf-8"))
-                if error_data.get("authentication_required"):
-                    futil.log(
-                        "entry.py::get_logic - Server indicates authentication required, stopping polling"
-                    )
-                    # If server says we need to authenticate, stop polling
-                    stop_polling()
-                    return
-            except:
-                pass
-        futil.log(f"entry.py::get_logic - Error in get_instructions request: {e}")
-        return
-    except Exception as e:
-        futil.log(
-            f"entry.py::get_logic - General error in get_instructions request: {e}"
-        )
-        return
+        return True
 
-    if response.getcode() != 200:
-        futil.log(
-            f"entry.py::get_logic - Backend returned status code {response.getcode()}"
-        )
-        return
-
-    response_data = response.read().decode("utf-8")
-    json_data = json.loads(response_data)
-    logic = json_data.get("instructions", None)
-    chat_id = json_data.get("chat_id", None)  # Extract chat_id from response
-    operation_id = json_data.get(
-        "operation_id", None
-    )  # Extract operation_id for tracking
+    # /wait_for_operation has already claimed the operation for us and
+    # returns its instructions in the same response
+    logic = poll_json.get("instructions", None)
+    chat_id = poll_json.get("chat_id", None)
+    operation_id = poll_json.get("operation_id", None)
 
     if not logic:
-        futil.log(
-            f"entry.py::get_logic - get_instructions returned no logic {response.getcode()}"
-        )
-        return
+        futil.log("entry.py::get_logic - Claimed operation has no logic")
+        return True
 
     futil.log(
-        f"entry.py::get_logic - get_instructions returned logic for chat {chat_id}:\n\n[\n{logic}\n]"
+        f"entry.py::get_logic - Claimed operation {operation_id} for chat {chat_id}:\n\n[\n{logic}\n]"
     )
 
     try:
@@ -222,6 +217,10 @@ def get_logic():
         run_logic_result["operation_id"] = (
             operation_id  # Include operation_id in the result
         )
+        # The result carries the full post-operation state; later polls diff against it
+        run_logic_result.update(
+            state_uploader.encode_full(run_logic_result.get("cad_state"))
+        )
 
         # with open(before_screenshot_path, "rb") as before_img_file:
         # run_logic_result["before_screenshot"] = base64.b64encode(before_img_file.read()).decode('utf-8')
@@ -229,22 +228,22 @@ def get_logic():
         # run_logic_result["after_screenshot"] = base64.b64encode(after_img_file.read()).decode('utf-8')
 
         # Send run_logic_result to /instruction_result
-        result_payload = json.dumps(run_logic_result).encode("utf-8")
-        result_req = urllib.request.Request(
+        result_req = http_utils.msgpack_request(
             f"{config.API_BASE_URL}/instruction_result",
-            data=result_payload,
-            headers={"Content-Type": "application/json"},
-            method="POST",
+            run_logic_result,
+            token=login.get_auth_token(),
         )
 
         result_response = urllib.request.urlopen(result_req)
         if result_response.getcode() != 200:
+            state_uploader.reset()
             futil.log(
                 f"entry.py::get_logic - Error sending result: {result_response.getcode()}"
             )
 
         # delete_files(before_screenshot_path, after_screenshot_path)
     except Exception as e:
+        state_uploader.reset()
         futil.log(f"entry.py::get_logic - Error executing logic: {e}")
         # Send error result
         error_result = {
@@ -253,28 +252,90 @@ def get_logic():
             "status": "error",
             "error_message": str(e),
         }
-        error_payload = json.dumps(error_result).encode("utf-8")
-        error_req = urllib.request.Request(
+        error_req = http_utils.json_request(
             f"{config.API_BASE_URL}/instruction_result",
-            data=error_payload,
-            headers={"Content-Type": "application/json"},
-            method="POST",
+            error_result,
+            token=login.get_auth_token(),
         )
 
+    return True
+
+
+def on_design_changed(*args):
+    """Fusion event callback: re-check the design and upload it if it changed.
+
+    The long poll only uploads the state when it starts, and may stay parked
+    for LONG_POLL_TIMEOUT seconds; the state upload thread sends the change
+    meanwhile so prompts sent in that window see the current design.
+    """
+    invalidate_workspace_state()
+    design_changed.set()
+
+
+def upload_state():
+    """Send the current workspace state to /poll, which stores it without
+    claiming an operation. Returns True if the backend asked for a full
+    upload."""
+    if not login.is_user_authenticated():
+        return False
+
+    workspace_desc = get_workspace_state() or {}
+    state_req = http_utils.msgpack_request(
+        f"{config.API_BASE_URL}/poll",
+        {
+            **state_uploader.encode(workspace_desc.get("cad_state")),
+            "user_id": login.get_user_id(),
+        },
+        token=login.get_auth_token(),
+    )
+    try:
+        state_response = urllib.request.urlopen(state_req, timeout=10)
+        resync = json.loads(http_utils.read_body(state_response)).get(
+            "resync_cad_state"
+        )
+    except Exception as e:
+        # The long poll resends the state; an error here is only logged
+        state_uploader.reset()
+        futil.log(f"entry.py::upload_state - Error uploading workspace state: {e}")
+        return False
+
+    if resync:
+        state_uploader.reset()
+    return bool(resync)
+
+
+# Uploads the workspace state after design changes while the long poll is parked
+def state_sync_loop(stop_event):
+    while not stop_event.is_set():
+        if not design_changed.wait(POLL_RETRY_INTERVAL):
+            continue
+        # Coalesce the events of one edit (and of a script run) into one upload
+        if stop_event.wait(STATE_SYNC_DELAY):
+            break
+        design_changed.clear()
+        try:
+            if upload_state():
+                # Send the full state straight away
+                design_changed.set()
+        except Exception as e:
+            futil.log(f"entry.py::state_sync_loop - Unexpected error: {e}")
+
 
 # Add a function to stop polling
 def stop_polling():
-    global timer, is_timer_running
-    if timer:
-        futil.log("entry.py::stop_polling - Cancelling get_logic timer")
-        timer.cancel()
-        timer = None
-    is_timer_running = False
+    global poll_thread, state_sync_thread, poll_stop_event, is_polling
+    if poll_stop_event:
+        futil.log("entry.py::stop_polling - Stopping long-poll thread")
+        # An in-flight request is left to finish; the thread exits when it returns
+        poll_stop_event.set()
+        poll_stop_event = None
+    poll_thread = None
+    state_sync_thread = None
+    is_polling = False
 
 
 # Modified start to only start polling if user is authenticated
 def start():
-    global timer, is_timer_running
     # ******************************** Create Command Definition ********************************
     futil.log("entry.py::start - FORGEMIND ADD IN BEING RUN - start")
 
@@ -292,11 +353,8 @@ def start():
         )
         # If either check fails, consider user not authenticated
         is_auth = False
-        # Reset timer to ensure no polling occurs
-        if timer:
-            timer.cancel()
-            timer = None
-        is_timer_running = False
+        # Stop any poll thread to ensure no polling occurs
+        stop_polling()
 
     # Prevent duplicate command definition error
     existing_cmd = ui.commandDefinitions.itemById(CMD_ID)
@@ -310,6 +368,12 @@ def start():
     # Add command created handler. The function passed here will be executed when the command is executed.
     futil.add_handler(cmd_def.commandCreated, command_created)
 
+    # Re-check the design after any edit or document switch, and upload it
+    # without waiting for the next poll; until then polls reuse the cached
+    # workspace state
+    futil.add_handler(ui.commandTerminated, on_design_changed)
+    futil.add_handler(app.documentActivated, on_design_changed)
+
     # ******************************** Create Command Control ********************************
     # Get target workspace for the command.
     workspace = ui.workspaces.itemById(WORKSPACE_ID)
@@ -335,26 +399,21 @@ def start():
     # Now you can set various options on the control such as promoting it to always be shown.
     control.isPromoted = IS_PROMOTED
 
-    # Cancel any existing timer before potentially starting a new one
-    if timer:
-        futil.log("entry.py::start - Cancelling existing get_logic timer")
-        timer.cancel()
-        timer = None
-        is_timer_running = False
+    # Stop any existing poll thread before potentially starting a new one
+    if is_polling:
+        futil.log("entry.py::start - Stopping existing long-poll thread")
+        stop_polling()
 
-    # Only start the timer if the user is authenticated
+    # Only start polling if the user is authenticated
     if is_auth:
         # Verify authentication with backend before starting polling
         try:
             # Create a simple verification request to test if we can actually connect
             workspace_desc = {"user_id": user_id, "test_auth": True}
-            json_payload = json.dumps(workspace_desc).encode("utf-8")
-
-            test_req = urllib.request.Request(
+            test_req = http_utils.json_request(
                 f"{config.API_BASE_URL}/poll",
-                data=json_payload,
-                headers={"Content-Type": "application/json"},
-                method="POST",
+                workspace_desc,
+                token=login.get_auth_token(),
             )
 
             try:
@@ -402,20 +461,16 @@ def start():
         futil.log(
             "entry.py::start - Not starting polling because user is not authenticated"
         )
-        is_timer_running = False
 
 
 # Executed when add-in is stopped.
 def stop():
-    global timer, is_timer_running
-    # Cancel the recurring get_logic calls
-    if timer:
-        futil.log("entry.py::stop - Cancelling get_logic timer")
-        timer.cancel()
-        timer = None
-        is_timer_running = False
+    # Stop the long-poll loop
+    if is_polling:
+        futil.log("entry.py::stop - Stopping long-poll thread")
+        stop_polling()
     else:
-        futil.log("entry.py::stop - No timer to cancel")
+        futil.log("entry.py::stop - No poll thread to stop")
 
     # Get the various UI elements for this command
     workspace = ui.workspaces.itemById(WORKSPACE_ID)
@@ -471,27 +526,38 @@ def command_destroy(args: adsk.core.CommandEventArgs):
 
 # New helper function to start polling
 def start_polling():
-    global timer, is_timer_running
-    if is_timer_running and timer:
+    global poll_thread, state_sync_thread, poll_stop_event, is_polling
+    if is_polling and poll_thread:
         # Already polling, don't start again
         futil.log("entry.py::start_polling - Already polling, not starting again")
         return
 
     futil.log("entry.py::start_polling - Starting polling")
-    is_timer_running = True
-    get_logic()  # run immediately
-    timer = threading.Timer(2, schedule_get_logic)
-    timer.start()
+    is_polling = True
+    # A new session (possibly another user) starts with a full state upload
+    state_uploader.reset()
+    poll_stop_event = threading.Event()
+    poll_thread = threading.Thread(
+        target=poll_loop, args=(poll_stop_event,), daemon=True
+    )
+    # The first poll uploads the state; only later changes need another upload
+    design_changed.clear()
+    poll_thread.start()
+    state_sync_thread = threading.Thread(
+        target=state_sync_loop, args=(poll_stop_event,), daemon=True
+    )
+    state_sync_thread.start()
     futil.log("entry.py::start_polling - Polling started successfully")
 
 
-# Modified schedule_get_logic to check authentication before executing
-def schedule_get_logic():
-    global timer, is_timer_running
-    if not is_timer_running:
-        return
+# Long-poll loop: re-polls as soon as the backend answers, backs off on errors
+def poll_loop(stop_event):
+    while not stop_event.is_set():
+        try:
+            completed = get_logic()
+        except Exception as e:
+            futil.log(f"entry.py::poll_loop - Unexpected error: {e}")
+            completed = False
 
-    # futil.log("entry.py::schedule_get_logic - Scheduling get_logic")
-    get_logic()
-    timer = threading.Timer(2, schedule_get_logic)
-    timer.start()
+        if not completed:
+            stop_event.wait(POLL_RETRY_INTERVAL)
@@ -15,6 +15,7 @@ import string
 import random
 from ... import config
 from ...lib import fusionAddInUtils as futil
+from ...lib import http_utils
 
 app = adsk.core.Application.get()
 ui = app.userInterface
@@ -23,8 +24,26 @@ ui = app.userInterface
 local_handlers = []
 is_authenticated = False
 auth_token = None
+# Exchanged at /refresh_token for a new access token (and the next refresh token)
+refresh_token = None
+# Unix time the access token expires, when known
+token_expires_at = None
+# time.time() when the backend last issued an access token
+token_issued_at = 0
 user_id = None
 was_logged_out = False  # Flag to prevent immediate re-authentication after logout
+# Last /verify_token outcome: {"token_hash", "valid", "until"}; reused until "until"
+# so the poll loop's auth checks don't need a network round trip
+last_verification = None
+
+# Seconds a successful verification is reused (never past the token's expiry)
+VERIFY_CACHE_TTL = 600
+# Seconds before a token the backend rejected is sent for verification again
+VERIFY_FAILURE_TTL = 60
+# Seconds before the access token expires that it is refreshed
+TOKEN_REFRESH_MARGIN = 300
+# Refresh tokens are single use; the poll and state upload threads take turns
+token_lock = threading.Lock()
 
 # Command properties
 CMD_NAME = os.path.basename(os.path.dirname(__file__))
@@ -134,7 +153,7 @@ def decrypt_data(encrypted_str):
 
 def authenticate(email, password):
     """Authenticate with the backend server using email and password."""
-    global is_authenticated, auth_token, user_id, was_logged_out
+    global is_authenticated, auth_token, refresh_token, token_expires_at, token_issued_at, user_id, was_logged_out
     
     try:
         # Prepare the authentication payload
@@ -142,15 +161,11 @@ def authenticate(email, password):
             "email": email,
             "password": password
         }
-        json_payload = json.dumps(auth_data).encode("utf-8")
         
         # Make the authentication request to the backend
         futil.log(f"Attempting to authenticate user {email} with backend")
-        auth_req = urllib.request.Request(
-            f"{config.API_BASE_URL}/fusion_auth",
-            data=json_payload,
-            headers={"Content-Type": "application/json"},
-            method="POST",
+        auth_req = http_utils.json_request(
+            f"{config.API_BASE_URL}/fusion_auth", auth_data
         )
         
         try:
@@ -161,7 +176,7 @@ def authenticate(email, password):
                 return False, "Authentication failed. Please check your credentials."
                 
             # Parse the response
-            response_data = auth_response.read().decode("utf-8")
+            response_data = http_utils.read_body(auth_response)
             futil.log(f"Authentication response received, status code: {auth_response.getcode()}")
             
             try:
@@ -175,6 +190,9 @@ def authenticate(email, password):
                 # Store authentication data
                 is_authenticated = True
                 auth_token = json_data.get("token")
+                refresh_token = json_data.get("refresh_token")
+                token_expires_at = json_data.get("expires_at")
+                token_issued_at = time.time()
                 user_id = json_data.get("user_id")
                 
                 if not auth_token or not user_id:
@@ -187,7 +205,8 @@ def authenticate(email, password):
                 futil.log(f"Successfully authenticated as user {user_id}")
                 
                 # Save authentication data securely
-                save_auth_data(auth_token, user_id)
+                save_auth_data(auth_token, user_id, refresh_token, token_expires_at)
+                remember_verified_token(auth_token)
                 
                 return True, "Authentication successful"
             except json.JSONDecodeError as e:
@@ -198,7 +217,7 @@ def authenticate(email, password):
         except urllib.error.HTTPError as e:
             error_message = f"HTTP Error during authentication: {e.code}"
             try:
-                error_data = e.read().decode('utf-8')
+                error_data = http_utils.read_body(e)
                 futil.log(f"Server error response: {error_data}")
                 error_json = json.loads(error_data)
                 if error_json.get("message"):
@@ -216,7 +235,7 @@ def authenticate(email, password):
         futil.log(f"Authentication error: {str(e)}")
         return False, f"Authentication error: {str(e)}"
 
-def save_auth_data(token, uid):
+def save_auth_data(token, uid, refresh=None, expires_at=None):
     """Save authentication data securely."""
     try:
         # Create the auth directory if it doesn't exist
@@ -233,6 +252,8 @@ def save_auth_data(token, uid):
         # Build auth data with additional security measures
         auth_data = {
             "token": token,
+            "refresh_token": refresh,
+            "token_expires_at": expires_at,
             "user_id": uid,
             "timestamp": time.time(),
             "machine_fingerprint": machine_fingerprint,
@@ -264,7 +285,7 @@ def save_auth_data(token, uid):
 
 def load_auth_data():
     """Load authentication data securely."""
-    global is_authenticated, auth_token, user_id, was_logged_out
+    global is_authenticated, auth_token, refresh_token, token_expires_at, user_id, was_logged_out
     
     # If we've explicitly logged out in this session, don't try to re-authenticate
     # until the user explicitly logs in again
@@ -353,27 +374,17 @@ def load_auth_data():
         
         # Set the global variables
         auth_token = token
+        refresh_token = auth_data.get("refresh_token")
+        token_expires_at = auth_data.get("token_expires_at")
         user_id = auth_data.get("user_id")
         
-        # Verify the token with the backend
-        verify_req = urllib.request.Request(
-            f"{config.API_BASE_URL}/verify_token",
-            data=json.dumps({"token": auth_token}).encode("utf-8"),
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-        
-        verify_response = urllib.request.urlopen(verify_req)
-        
-        if verify_response.getcode() != 200:
-            futil.log("Token verification failed")
-            return False
-        
-        response_data = verify_response.read().decode("utf-8")
-        json_data = json.loads(response_data)
-        
-        if not json_data.get("status"):
-            futil.log("Token is invalid")
+        # An access token saved by an earlier session has usually expired; refresh
+        # it, else verify it, reusing a recent verification when there is one
+        if refresh_token and token_needs_refresh():
+            valid = refresh_auth_token()
+        else:
+            valid = verify_token(auth_token)
+        if not valid:
             return False
         
         is_authenticated = True
@@ -384,18 +395,120 @@ def load_auth_data():
         futil.log(f"Error loading authentication data: {str(e)}")
         return False
 
+def verify_token(token):
+    """Check a token with /verify_token, caching the outcome in last_verification."""
+    global last_verification
+    
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    if (
+        last_verification
+        and last_verification["token_hash"] == token_hash
+        and time.time() < last_verification["until"]
+    ):
+        return last_verification["valid"]
+    
+    try:
+        verify_req = http_utils.json_request(
+            f"{config.API_BASE_URL}/verify_token", {"token": token}
+        )
+        verify_response = urllib.request.urlopen(verify_req)
+        json_data = json.loads(http_utils.read_body(verify_response))
+    except urllib.error.HTTPError as e:
+        if e.code != 401:
+            raise
+        json_data = {"status": False}
+    
+    valid = bool(json_data.get("status"))
+    if valid:
+        until = time.time() + VERIFY_CACHE_TTL
+        if json_data.get("expires_at"):
+            until = min(until, json_data["expires_at"])
+    else:
+        futil.log("Token is invalid")
+        until = time.time() + VERIFY_FAILURE_TTL
+    last_verification = {"token_hash": token_hash, "valid": valid, "until": until}
+    return valid
+
+def remember_verified_token(token):
+    """Record a token the backend just issued as verified."""
+    global last_verification
+    last_verification = {
+        "token_hash": hashlib.sha256(token.encode()).hexdigest(),
+        "valid": True,
+        "until": time.time() + VERIFY_CACHE_TTL,
+    }
+
+def token_needs_refresh():
+    """Whether the access token expires within TOKEN_REFRESH_MARGIN seconds."""
+    return (
+        token_expires_at is not None
+        and time.time() > token_expires_at - TOKEN_REFRESH_MARGIN
+    )
+
+def refresh_auth_token(rejected_token=None):
+    """Exchange the refresh token for a new session at /refresh_token.
+
+    Called before the access token expires, or with ``rejected_token`` when
+    the backend refused that token. Returns True when the add-in holds a
+    fresh access token; a caller that waited for another thread's refresh
+    finds it done. A token refused within TOKEN_REFRESH_MARGIN seconds of
+    being issued isn't refreshed again, since a new one would be refused too.
+    """
+    global auth_token, refresh_token, token_expires_at, token_issued_at
+    
+    with token_lock:
+        if rejected_token is None and not token_needs_refresh():
+            return True
+        if rejected_token is not None:
+            if rejected_token != auth_token:
+                return True
+            if time.time() - token_issued_at < TOKEN_REFRESH_MARGIN:
+                return False
+        if not refresh_token:
+            return False
+        
+        try:
+            refresh_req = http_utils.json_request(
+                f"{config.API_BASE_URL}/refresh_token", {"refresh_token": refresh_token}
+            )
+            refresh_response = urllib.request.urlopen(refresh_req, timeout=10)
+            json_data = json.loads(http_utils.read_body(refresh_response))
+        except urllib.error.HTTPError as e:
+            futil.log(f"Token refresh failed with status code: {e.code}")
+            if e.code == 401:
+                # Revoked or already used: only logging in again helps
+                refresh_token = None
+            return False
+        except Exception as e:
+            # Kept for the next attempt
+            futil.log(f"Error refreshing token: {str(e)}")
+            return False
+        
+        auth_token = json_data.get("token")
+        refresh_token = json_data.get("refresh_token")
+        token_expires_at = json_data.get("expires_at")
+        token_issued_at = time.time()
+        save_auth_data(auth_token, user_id, refresh_token, token_expires_at)
+        remember_verified_token(auth_token)
+        futil.log("Access token refreshed")
+        return True
+
 def logout():
     """Log out the user by clearing the authentication data."""
-    global is_authenticated, auth_token, user_id, was_logged_out
+    global is_authenticated, auth_token, refresh_token, token_expires_at, user_id, was_logged_out, last_verification
     
     try:
         # Store user_id for logging and backend notification
         uid_to_clear = user_id
+        token_to_clear = auth_token
         
         # First invalidate local authentication state
         is_authenticated = False
         auth_token = None
+        refresh_token = None
+        token_expires_at = None
         user_id = None
+        last_verification = None
         was_logged_out = True  # Set flag to prevent immediate re-authentication
         
         futil.log("Starting logout process...")
@@ -404,14 +517,13 @@ def logout():
         if uid_to_clear:
             try:
                 futil.log(f"Notifying backend of logout for user {uid_to_clear}")
-                logout_req = urllib.request.Request(
+                logout_req = http_utils.json_request(
                     f"{config.API_BASE_URL}/plugin_logout",
-                    data=json.dumps({"user_id": uid_to_clear}).encode("utf-8"),
-                    headers={"Content-Type": "application/json"},
-                    method="POST",
+                    {"user_id": uid_to_clear},
+                    token=token_to_clear,
                 )
                 logout_response = urllib.request.urlopen(logout_req)
-                response_data = logout_response.read().decode('utf-8')
+                response_data = http_utils.read_body(logout_response)
                 futil.log(f"Logout notification sent to backend: {response_data}")
             except Exception as e:
                 futil.log(f"Error notifying backend about logout: {str(e)}")
@@ -602,4 +714,11 @@ def is_user_authenticated():
 def get_user_id():
     """Get the authenticated user's ID."""
     global user_id
-    return user_id 
\ No newline at end of file
+    return user_id 
+
+def get_auth_token():
+    """Get the access token to send as the bearer token, refreshing it first
+    when it is about to expire."""
+    if refresh_token and token_needs_refresh():
+        refresh_auth_token()
+    return auth_token
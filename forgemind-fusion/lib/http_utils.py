@@ -0,0 +1,44 @@
+import gzip
+import json
+import urllib.request
+
+from . import msgpack_utils
+
+# Bodies at least this large are gzipped before upload (CAD state payloads)
+COMPRESS_MIN_SIZE = 1024
+
+
+def json_request(url, payload, method="POST", token=None):
+    """Build a request posting ``payload`` as JSON, gzipped when it is large.
+
+    Also advertises gzip so the backend compresses large responses; read
+    them with ``read_body``. ``token`` is sent as the bearer access token.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    return _request(url, body, "application/json", method, token)
+
+
+def msgpack_request(url, payload, method="POST", token=None):
+    """Like ``json_request``, posting ``payload`` as msgpack; used for the
+    requests carrying the CAD state, which the backend decodes faster (and
+    which are smaller) than JSON. Responses are still JSON."""
+    body = msgpack_utils.packb(payload)
+    return _request(url, body, "application/msgpack", method, token)
+
+
+def _request(url, body, content_type, method, token):
+    headers = {"Content-Type": content_type, "Accept-Encoding": "gzip"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if len(body) >= COMPRESS_MIN_SIZE:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return urllib.request.Request(url, data=body, headers=headers, method=method)
+
+
+def read_body(response):
+    """Return the decoded text of a response or ``HTTPError``, inflating gzip."""
+    body = response.read()
+    if (response.headers.get("Content-Encoding") or "").lower() == "gzip":
+        body = gzip.decompress(body)
+    return body.decode("utf-8")
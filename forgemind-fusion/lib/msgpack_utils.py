@@ -0,0 +1,73 @@
+import struct
+
+# Fusion's bundled Python has no msgpack package; the add-in only needs to
+# encode its uploads, so this covers the JSON types (plus bytes).
+
+_PACK_FLOAT = struct.Struct(">Bd").pack
+
+
+def packb(value):
+    """Encode ``value`` (JSON types, tuples and bytes) as msgpack."""
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def _pack(value, out):
+    if value is None:
+        out.append(0xC0)
+    elif value is True:
+        out.append(0xC3)
+    elif value is False:
+        out.append(0xC2)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        _header(out, len(data), 0xA0, 32, 0xD9, 0xDA, 0xDB)
+        out += data
+    elif isinstance(value, float):
+        out += _PACK_FLOAT(0xCB, value)
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, dict):
+        _header(out, len(value), 0x80, 16, None, 0xDE, 0xDF)
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif isinstance(value, (list, tuple)):
+        _header(out, len(value), 0x90, 16, None, 0xDC, 0xDD)
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, (bytes, bytearray)):
+        _header(out, len(value), None, 0, 0xC4, 0xC5, 0xC6)
+        out += value
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} as msgpack")
+
+
+def _pack_int(value, out):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xFF)
+    elif 0 <= value <= 0xFFFFFFFF:
+        out += struct.pack(">BI", 0xCE, value)
+    elif -0x80000000 <= value < 0:
+        out += struct.pack(">Bi", 0xD2, value)
+    elif 0 <= value <= 0xFFFFFFFFFFFFFFFF:
+        out += struct.pack(">BQ", 0xCF, value)
+    elif -0x8000000000000000 <= value < 0:
+        out += struct.pack(">Bq", 0xD3, value)
+    else:
+        raise OverflowError(f"Integer out of msgpack range: {value}")
+
+
+def _header(out, size, fix, fix_limit, tag8, tag16, tag32):
+    """Write the type and length of a string, binary, array or map."""
+    if size < fix_limit:
+        out.append(fix | size)
+    elif tag8 is not None and size <= 0xFF:
+        out += struct.pack(">BB", tag8, size)
+    elif size <= 0xFFFF:
+        out += struct.pack(">BH", tag16, size)
+    else:
+        out += struct.pack(">BI", tag32, size)
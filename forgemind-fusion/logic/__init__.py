@@ -1 +1,2 @@
-from .main import *
\ No newline at end of file
+from .main import *
+from .state_delta import StateUploader
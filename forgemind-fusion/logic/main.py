@@ -6,6 +6,8 @@ import math
 import json
 import os
 import re
+import threading
+from .workspace_cache import WorkspaceCache
 
 app = adsk.core.Application.get()
 ui = app.userInterface
@@ -20,12 +22,32 @@ current_chat_id = None
 # Debug logs
 DEBUG = True
 
+# Workspace description reused between polls until the design changes
+workspace_cache = WorkspaceCache()
+
+# Held while the long-poll or state upload thread uses the Fusion API, so an
+# upload never describes the design (or the cache) halfway through an operation.
+# Fusion events only invalidate the cache, which doesn't need it: an operation
+# waiting on the main thread would deadlock against a handler waiting here.
+fusion_lock = threading.RLock()
+
 def debug_log(message):
     """Log debug messages if debug is enabled"""
     if DEBUG:
         futil.log(f"DEBUG: {message}")
 
+def invalidate_workspace_state(*args):
+    """Force the next get_workspace_state call to re-check the design.
+
+    Registered for Fusion document/command events, so it accepts their args.
+    """
+    workspace_cache.invalidate()
+
 def get_workspace_state():
+    with fusion_lock:
+        return _describe_workspace()
+
+def _describe_workspace():
     user_id = login.get_user_id() or 'anonymous'
     try:
         if app is None:
@@ -46,44 +68,8 @@ def get_workspace_state():
         if not design.parentDocument:
             raise ValueError("No valid Fusion 360 document")
 
-        description = {"name": design.parentDocument.name, "components": []}
-
-        for comp in design.allComponents:
-            comp_info = {
-                "name": comp.name,
-                "bodies": [],
-                "sketches": []
-            }
-
-            for body in comp.bRepBodies:
-                body_info = {
-                    "name": body.name,
-                    "volume": body.volume,
-                    "surface_area": body.area,
-                    "bounding_box": {
-                        "min_point": body.boundingBox.minPoint.asArray(),
-                        "max_point": body.boundingBox.maxPoint.asArray()
-                    }
-                }
-                comp_info["bodies"].append(body_info)
-
-
-            for sketch in comp.sketches:
-                sketch_info = {
-                    "name": sketch.name,
-                    "profiles": []
-                }
-
-                for profile in sketch.profiles:
-                    profile_info = {
-                        "area": profile.areaProperties().area,
-                        "perimeter": profile.areaProperties().perimeter
-                    }
-                    sketch_info["profiles"].append(profile_info)
-
-                comp_info["sketches"].append(sketch_info)
-
-            description["components"].append(comp_info)
+        # Unchanged bodies and sketches are served from the cache without geometry queries
+        description = workspace_cache.describe(design)
 
         # Get the authenticated user's ID
         
@@ -518,17 +504,22 @@ def basic_code_validation(code):
 #     return 0
 
 def run_logic(logic: str, chat_id=None) -> dict:
-    try:
-        exec(logic)
-        return {
-            'status': 'success',
-            'error_message': None,
-            **get_workspace_state()
-        }
-    except Exception as error:
-        futil.log('[entry.py::get_logic] Error: ' + str(error))
-        return {
-            'status': 'error',
-            'error_message': str(error),
-            **get_workspace_state()
-        }
\ No newline at end of file
+    with fusion_lock:
+        # API edits made by the operation don't raise UI command events
+        workspace_cache.invalidate()
+        try:
+            exec(logic)
+            workspace_cache.invalidate()
+            return {
+                'status': 'success',
+                'error_message': None,
+                **get_workspace_state()
+            }
+        except Exception as error:
+            futil.log('[entry.py::get_logic] Error: ' + str(error))
+            workspace_cache.invalidate()
+            return {
+                'status': 'error',
+                'error_message': str(error),
+                **get_workspace_state()
+            }
\ No newline at end of file
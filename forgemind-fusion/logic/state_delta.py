@@ -0,0 +1,103 @@
+import hashlib
+import json
+import threading
+
+
+def state_hash(state):
+    """Content hash of a CAD state; must match the backend's ``state_hash``."""
+    canonical = json.dumps(state, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def diff_states(old, new, path=""):
+    """Return an RFC 6902 patch (add/remove/replace) turning ``old`` into ``new``."""
+    # Subtrees reused from the workspace cache are the same objects
+    if old is new:
+        return []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch = []
+        for key in old:
+            if key not in new:
+                patch.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                patch.append({"op": "add", "path": child, "value": value})
+            else:
+                patch.extend(diff_states(old[key], value, child))
+        return patch
+
+    if isinstance(old, list) and isinstance(new, list):
+        patch = []
+        common = min(len(old), len(new))
+        for index in range(common):
+            patch.extend(diff_states(old[index], new[index], f"{path}/{index}"))
+        for index in range(common, len(new)):
+            patch.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+        # Remove from the end so earlier indices stay valid
+        for index in range(len(old) - 1, common - 1, -1):
+            patch.append({"op": "remove", "path": f"{path}/{index}"})
+        return patch
+
+    if type(old) is not type(new) or old != new:
+        return [{"op": "replace", "path": path, "value": new}]
+    return []
+
+
+def _escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+class StateUploader:
+    """Encodes the CAD state for each poll relative to the last upload.
+
+    Sends the full state the first time (or after ``reset``), only its hash
+    while it is unchanged, and a JSON patch against the previous upload when
+    it changes. Call ``reset`` whenever the backend may not have the last
+    upload (request failed, or the response asked for a resync). Shared by
+    the long-poll thread and the thread uploading changes while it is parked.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._hash = None
+        self._lock = threading.Lock()
+
+    def encode(self, state):
+        """Return the poll fields describing ``state``."""
+        with self._lock:
+            return self._encode(state)
+
+    def _encode(self, state):
+        if state is None:
+            self._state = self._hash = None
+            return {"cad_state": None}
+
+        # A cached workspace state is returned as the same object, skip hashing it
+        digest = self._hash if state is self._state else state_hash(state)
+        if self._hash is None:
+            fields = {"cad_state": state, "cad_state_hash": digest}
+        elif digest == self._hash:
+            fields = {"cad_state_hash": digest}
+        else:
+            fields = {
+                "cad_state_patch": diff_states(self._state, state),
+                "cad_state_base_hash": self._hash,
+                "cad_state_hash": digest,
+            }
+
+        # Workspace states are never mutated once built, so keeping a reference is safe
+        self._state, self._hash = state, digest
+        return fields
+
+    def encode_full(self, state):
+        """Return fields for a full upload of ``state`` (e.g. /instruction_result)."""
+        with self._lock:
+            self._state = self._hash = None
+            return self._encode(state)
+
+    def reset(self):
+        with self._lock:
+            self._state = None
+            self._hash = None
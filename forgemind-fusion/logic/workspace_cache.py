@@ -0,0 +1,113 @@
+import time
+
+
+class WorkspaceCache:
+    """Caches the workspace description built by ``get_workspace_state``.
+
+    Fusion events (see ``commands/Info/entry.py``) and ``run_logic`` call
+    ``invalidate`` when the design may have changed. Until then, and for at
+    most ``REFRESH_INTERVAL`` seconds, ``describe`` returns the previous
+    description without touching the Fusion API. When a rebuild is needed,
+    bodies and sketches whose ``revisionId`` is unchanged reuse their cached
+    measurements, so only modified geometry is queried again. Names are
+    always read fresh since renaming doesn't change a revision.
+
+    ``describe`` is not thread-safe; callers hold ``logic.main.fusion_lock``.
+    ``invalidate`` only sets a flag and may be called from any thread.
+    """
+
+    # Rebuild at least this often in case a change arrived without an event
+    REFRESH_INTERVAL = 60
+
+    def __init__(self):
+        self._dirty = True
+        self._built_at = 0
+        self._document_name = None
+        self._description = None
+        self._bodies = {}  # entityToken -> (revisionId, measurements)
+        self._sketches = {}  # entityToken -> (revisionId, measurements)
+
+    def invalidate(self, *args):
+        """Mark the cached description stale; usable directly as an event callback."""
+        self._dirty = True
+
+    def describe(self, design):
+        document_name = design.parentDocument.name
+        if (
+            not self._dirty
+            and self._description is not None
+            and document_name == self._document_name
+            and time.monotonic() - self._built_at < self.REFRESH_INTERVAL
+        ):
+            return self._description
+
+        # Cleared before the walk so a change made meanwhile triggers another one
+        self._dirty = False
+        bodies, sketches = {}, {}
+        description = {"name": document_name, "components": []}
+
+        for comp in design.allComponents:
+            description["components"].append(
+                {
+                    "name": comp.name,
+                    "bodies": [
+                        {
+                            "name": body.name,
+                            **self._lookup(body, self._bodies, bodies, _measure_body),
+                        }
+                        for body in comp.bRepBodies
+                    ],
+                    "sketches": [
+                        {
+                            "name": sketch.name,
+                            **self._lookup(
+                                sketch, self._sketches, sketches, _measure_sketch
+                            ),
+                        }
+                        for sketch in comp.sketches
+                    ],
+                }
+            )
+
+        # Entities that no longer exist drop out of the cache
+        self._bodies, self._sketches = bodies, sketches
+        self._document_name = document_name
+        self._description = description
+        self._built_at = time.monotonic()
+        return description
+
+    @staticmethod
+    def _lookup(entity, previous, current, measure):
+        token = getattr(entity, "entityToken", None)
+        revision = getattr(entity, "revisionId", None)
+        if token is None or revision is None:
+            return measure(entity)
+
+        cached = previous.get(token)
+        measurements = (
+            cached[1] if cached and cached[0] == revision else measure(entity)
+        )
+        current[token] = (revision, measurements)
+        return measurements
+
+
+def _measure_body(body):
+    bounding_box = body.boundingBox
+    return {
+        "volume": body.volume,
+        "surface_area": body.area,
+        "bounding_box": {
+            "min_point": bounding_box.minPoint.asArray(),
+            "max_point": bounding_box.maxPoint.asArray(),
+        },
+    }
+
+
+def _measure_sketch(sketch):
+    profiles = []
+    for profile in sketch.profiles:
+        area_properties = profile.areaProperties()
+        profiles.append(
+            {"area": area_properties.area, "perimeter": area_properties.perimeter}
+        )
+    return {"profiles": profiles}
@@ -3,7 +3,7 @@ import Sidebar from "./components/Sidebar";
 import ChatWindow from "./components/ChatWindow";
 import BottomBar from "./components/BottomBar";
 import ConfirmationModal from "./components/ConfirmationModal";
-import { sendPrompt, getUserChats, getChatMessages, deleteChat, checkPluginLoginStatus } from "./api";
+import { streamPrompt, getUserChats, getChatMessages, deleteChat, checkPluginLoginStatus } from "./api";
 import Header from "../components/layout/Header";
 import { supabase } from "../supabaseClient";
 import { useNavigate, useLocation } from "react-router-dom";
@@ -301,6 +301,9 @@ const AppUI: React.FC<AppProps> = ({ onToggleSidebar, sidebarOpen, initialChatId
     setChats(updatedChats);
     setActiveChatIndex(newChatIndex);
 
+    // Placeholder for the assistant's reply, filled in while it streams
+    let aiMessage: Message | null = null;
+
     try {
       // Check if userId is available before proceeding
       if (!userId) {
@@ -340,7 +343,20 @@ const AppUI: React.FC<AppProps> = ({ onToggleSidebar, sidebarOpen, initialChatId
 
       // First, send the prompt and get the initial response
       const currentThreadId = isNewChat ? undefined : updatedChats[newChatIndex].threadId;
-      const aiResponse = await sendPrompt(input, userId, currentThreadId);
+      const streamingMessage: Message = {
+        role: "assistant",
+        content: { user_facing_response: "" },
+      };
+      aiMessage = streamingMessage;
+      updatedChats[newChatIndex].messages.push(streamingMessage);
+      setChats([...updatedChats]);
+
+      const aiResponse = await streamPrompt(input, userId, currentThreadId, (text) => {
+        streamingMessage.content = {
+          user_facing_response: streamingMessage.content.user_facing_response + text,
+        };
+        setChats([...updatedChats]);
+      });
 
       // Update thread ID if available (OpenAI's thread ID)
       if (aiResponse.thread_id) {
@@ -367,14 +383,8 @@ const AppUI: React.FC<AppProps> = ({ onToggleSidebar, sidebarOpen, initialChatId
         navigate(`/dashboard/${permanentChatId}`, { replace: true });
       }
 
-      // Create AI message
-      const aiMessage: Message = {
-        role: "assistant",
-        content: aiResponse.response,
-      };
-
-      // Add AI message to chat
-      updatedChats[newChatIndex].messages.push(aiMessage);
+      // Replace the streamed text with the complete AI message
+      streamingMessage.content = aiResponse.response;
 
       // Update the updated_at timestamp to ensure proper sorting
       updatedChats[newChatIndex].updated_at = new Date().toISOString();
@@ -401,8 +411,15 @@ const AppUI: React.FC<AppProps> = ({ onToggleSidebar, sidebarOpen, initialChatId
         content: { "user_facing_response": "Sorry, I encountered an error. Please try again." },
       };
 
-      // Add error message to chat
-      updatedChats[newChatIndex].messages.push(errorMessage);
+      // Add error message to chat, replacing an empty streaming placeholder
+      const placeholderIndex = aiMessage
+        ? updatedChats[newChatIndex].messages.indexOf(aiMessage)
+        : -1;
+      if (placeholderIndex !== -1 && !aiMessage?.content.user_facing_response) {
+        updatedChats[newChatIndex].messages[placeholderIndex] = errorMessage;
+      } else {
+        updatedChats[newChatIndex].messages.push(errorMessage);
+      }
 
       // Update state
       setChats([...updatedChats]);
@@ -1,8 +1,21 @@
 // forgemind-webapp/src/app/api.ts
 
+import { supabase } from '../supabaseClient';
+
 // Use an environment variable for the backend URL
 const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:5000';
 
+/**
+ * Returns the Authorization header carrying the current Supabase access token,
+ * which the backend verifies on every request. getSession reads the persisted
+ * session (refreshing it first if it has expired), so this rarely hits the network.
+ */
+async function authHeaders(): Promise<Record<string, string>> {
+  const { data } = await supabase.auth.getSession();
+  const token = data.session?.access_token;
+  return token ? { Authorization: `Bearer ${token}` } : {};
+}
+
 /**
  * Sends a user prompt to the backend via the /chat endpoint.
  * @param text The text prompt (e.g., "create a circle")
@@ -24,7 +37,8 @@ export async function sendPrompt(text: string, userId: string, threadId?: string
   const response = await fetch(`${API_BASE_URL}/chat`, {
     method: 'POST',
     headers: {
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      ...(await authHeaders())
     },
     mode: 'cors',
     credentials: 'omit',
@@ -35,28 +49,171 @@ export async function sendPrompt(text: string, userId: string, threadId?: string
     throw new Error(`Error sending prompt: ${response.statusText}`);
   }
 
-  return response.json();
+  // /chat queues the assistant run and answers with a job ID; wait for its result
+  const { job_id: jobId } = await response.json();
+  return waitForChatJob(jobId);
 }
 
+// How often to check on a queued /chat job
+const CHAT_STATUS_POLL_INTERVAL_MS = 1000;
+
 /**
- * Retrieves all chats for a user.
+ * Polls /chat_status until the chat job finishes and returns its result.
+ * @param jobId The job ID returned by /chat
+ */
+async function waitForChatJob(jobId: string) {
+  while (true) {
+    const response = await fetch(`${API_BASE_URL}/chat_status/${encodeURIComponent(jobId)}`, {
+      headers: await authHeaders(),
+      mode: 'cors',
+      credentials: 'omit'
+    });
+
+    if (!response.ok) {
+      throw new Error(`Error checking chat status: ${response.statusText}`);
+    }
+
+    const job = await response.json();
+    if (job.job_status === 'completed') {
+      return job.result;
+    }
+    if (job.job_status === 'failed') {
+      throw new Error(`Error sending prompt: ${job.error}`);
+    }
+
+    await new Promise((resolve) => setTimeout(resolve, CHAT_STATUS_POLL_INTERVAL_MS));
+  }
+}
+
+/**
+ * Sends a user prompt to the backend via the streaming /chat_stream endpoint.
+ * The assistant's user-facing text is passed to onToken as it is generated;
+ * the promise resolves with the same result as sendPrompt once the reply is complete.
+ * @param text The text prompt (e.g., "create a circle")
  * @param userId The user's ID (from Supabase Auth)
+ * @param threadId (Optional) The thread ID to include in the request body.
+ * @param onToken Called with each newly generated chunk of the user-facing response
  */
-export async function getUserChats(userId: string) {
-  const response = await fetch(`${API_BASE_URL}/get_chats?user_id=${encodeURIComponent(userId)}`, {
-    method: 'GET',
+export async function streamPrompt(
+  text: string,
+  userId: string,
+  threadId: string | undefined,
+  onToken: (text: string) => void
+): Promise<{
+  status: string;
+  chat_id: string;
+  thread_id: string;
+  response: any;
+}> {
+  const body: any = { text, user_id: userId };
+  if (threadId) {
+    body.thread_id = threadId;
+  }
+  const response = await fetch(`${API_BASE_URL}/chat_stream`, {
+    method: 'POST',
     headers: {
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      ...(await authHeaders())
     },
     mode: 'cors',
-    credentials: 'omit'
+    credentials: 'omit',
+    body: JSON.stringify(body)
   });
 
-  if (!response.ok) {
+  if (!response.ok || !response.body) {
+    throw new Error(`Error sending prompt: ${response.statusText}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+
+    // Server-sent events are separated by a blank line
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) {
+          event = line.slice('event: '.length);
+        } else if (line.startsWith('data: ')) {
+          data += line.slice('data: '.length);
+        }
+      }
+
+      const payload = data ? JSON.parse(data) : {};
+      if (event === 'token') {
+        onToken(payload.text);
+      } else if (event === 'final') {
+        return payload;
+      } else if (event === 'error') {
+        throw new Error(`Error sending prompt: ${payload.message}`);
+      }
+    }
+  }
+
+  throw new Error('Error sending prompt: stream ended without a response');
+}
+
+/**
+ * Fetches every page of a /get_chats or /get_messages listing, following
+ * next_cursor. Responses carry ETags, so the browser revalidates pages it has
+ * already seen and the backend answers 304 while they are unchanged.
+ * @param url The listing URL, with its query parameters
+ * @param key The response field holding the rows ('chats' or 'messages')
+ */
+async function fetchAllPages(url: string, key: string, init: RequestInit) {
+  const rows: any[] = [];
+  let cursor: string | null = null;
+  let page: any;
+  do {
+    const pageUrl: string = cursor ? `${url}&cursor=${encodeURIComponent(cursor)}` : url;
+    const response = await fetch(pageUrl, init);
+    if (!response.ok) {
+      return { response, body: null };
+    }
+    page = await response.json();
+    rows.push(...(page[key] || []));
+    cursor = page.next_cursor;
+  } while (cursor);
+  return { response: null, body: { ...page, [key]: rows, next_cursor: null } };
+}
+
+/**
+ * Retrieves all chats for a user.
+ * @param userId The user's ID (from Supabase Auth)
+ */
+export async function getUserChats(userId: string) {
+  const { response, body } = await fetchAllPages(
+    `${API_BASE_URL}/get_chats?user_id=${encodeURIComponent(userId)}`,
+    'chats',
+    {
+      method: 'GET',
+      headers: {
+        'Content-Type': 'application/json',
+        ...(await authHeaders())
+      },
+      mode: 'cors',
+      credentials: 'omit'
+    }
+  );
+
+  if (response) {
     throw new Error(`Error retrieving chats: ${response.statusText}`);
   }
 
-  return response.json();
+  return body;
 }
 
 /**
@@ -71,7 +228,8 @@ export async function deleteChat(chatId: string, userId: string) {
     const response = await fetch(`${API_BASE_URL}/delete_chat`, {
       method: 'DELETE',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        ...(await authHeaders())
       },
       mode: 'cors',
       credentials: 'omit',
@@ -106,23 +264,28 @@ export async function deleteChat(chatId: string, userId: string) {
 export async function getChatMessages(chatId: string) {
   try {
     console.log(`Fetching messages for chat: ${chatId}`);
-    const response = await fetch(`${API_BASE_URL}/get_messages?chat_id=${chatId}`, {
-      mode: 'cors',
-      credentials: 'omit'
-    });
+    const { response, body } = await fetchAllPages(
+      `${API_BASE_URL}/get_messages?chat_id=${chatId}`,
+      'messages',
+      {
+        headers: await authHeaders(),
+        mode: 'cors',
+        credentials: 'omit'
+      }
+    );
 
     // If we get a 500 error, log it but don't throw an error
     // Instead return an empty messages array
-    if (response.status === 500) {
+    if (response?.status === 500) {
       console.warn(`Server error fetching messages for chat ${chatId}. The server might be experiencing issues.`);
       return { messages: [] };
     }
 
-    if (!response.ok) {
+    if (response) {
       throw new Error(`Error retrieving messages: ${response.statusText}`);
     }
 
-    return response.json();
+    return body;
   } catch (error) {
     console.error(`Error in getChatMessages for ${chatId}:`, error);
     // Return empty messages instead of throwing to prevent UI crashes
@@ -176,6 +339,7 @@ export async function pollOperation() {
 export async function checkPluginLoginStatus(userId: string) {
   try {
     const response = await fetch(`${API_BASE_URL}/check_plugin_login?user_id=${encodeURIComponent(userId)}`, {
+      headers: await authHeaders(),
       mode: 'cors',
       credentials: 'omit'
     });